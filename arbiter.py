@@ -0,0 +1,33 @@
+# arbiter.py - 输入仲裁：多个窗口共用一个鼠标/键盘，所有输入动作串行执行
+import threading
+from contextlib import contextmanager
+import time
+import config
+from utils import dbg, activate_window
+
+
+class InputArbiter:
+    """
+    所有会话的鼠标/键盘动作都要先拿到这把锁（可重入），避免多个会话同时抢光标。
+    多开模式下拿到锁后先把目标窗口切到前台，键盘输入（如 M）才会发给正确的客户端。
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._focused = None
+
+    @contextmanager
+    def input(self, hwnd=None):
+        t0 = time.time()
+        with self._lock:
+            waited = time.time() - t0
+            if waited > 0.05:
+                dbg(f"[INPUT] hwnd={hwnd} 等待输入锁 {waited:.2f}s")
+            if config.MULTI_CLIENT and hwnd is not None and hwnd != self._focused:
+                activate_window(hwnd)
+                time.sleep(config.FOCUS_DELAY)
+                self._focused = hwnd
+            yield
+
+
+ARBITER = InputArbiter()
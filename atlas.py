@@ -0,0 +1,193 @@
+# atlas.py - 模板图集：把 templates/ 下全部 PNG 打包成一个文件（原始 uint8 灰度 / BGR 数组 + 元数据），启动时内存映射
+#
+# 文件格式：
+#   8 字节魔数 b"WTATLAS1" | 8 字节小端 uint64 头部长度 | UTF-8 JSON 头部 | 按 ALIGN 对齐的原始数组
+# 头部：{"version", "entries": {模板名: {sha1, size, mtime, w, h, gray_off, bgr_off, mean_color, dominant,
+#                                        color_filter, roi, threshold}}}
+# 用 numpy.memmap 只读映射：多个进程共享同一份页缓存，启动时不解码任何 PNG。
+# 源 PNG 的内容哈希变化（或增删文件）时自动重建。
+#
+# 用法：python atlas.py build | info
+import os
+import sys
+import json
+import struct
+import hashlib
+import numpy as np
+import config
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+ATLAS_PATH = os.path.join(ROOT, config.ATLAS_PATH)
+
+MAGIC = b"WTATLAS1"
+VERSION = 1
+ALIGN = 64
+
+
+def _sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        h.update(f.read())
+    return h.hexdigest()
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _template_meta():
+    """spec / config 里声明的 ROI 和判定阈值，随图集一起保存供工具查看"""
+    import statespec
+    rois = dict(statespec.rois())
+    rois.update(config.ROI_TABLE)
+    thresholds = {}
+    for st in statespec.STATES.values():
+        for d in st.get("detect", ()):
+            thresholds[d["template"]] = d["threshold"]
+    return rois, thresholds
+
+
+# ------------------------
+# 构建
+# ------------------------
+def build(sources, path=None):
+    """
+    sources: {模板名: 绝对路径}。解码全部 PNG 写入图集（先写临时文件再原子替换）。
+    返回写入的模板数。
+    """
+    import cv2
+    import registry
+    path = ATLAS_PATH if path is None else path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    rois, thresholds = _template_meta()
+    entries = {}
+    blobs = []
+    offset = 0
+    for name in sorted(sources):
+        src = sources[name]
+        data = np.fromfile(src, dtype=np.uint8)
+        bgr = cv2.imdecode(data, cv2.IMREAD_COLOR)
+        if bgr is None:
+            continue
+        gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+        h, w = gray.shape[:2]
+        mean_color = [float(c) for c in bgr.mean(axis=(0, 1))]
+        gray_off = offset
+        offset = _align(offset + gray.nbytes)
+        bgr_off = offset
+        offset = _align(offset + bgr.nbytes)
+        blobs.append((gray_off, np.ascontiguousarray(gray)))
+        blobs.append((bgr_off, np.ascontiguousarray(bgr)))
+        entries[name] = {
+            "sha1": hashlib.sha1(data.tobytes()).hexdigest(),
+            "size": int(data.size),
+            "mtime": os.path.getmtime(src),
+            "w": w, "h": h,
+            "gray_off": gray_off, "bgr_off": bgr_off,
+            "mean_color": mean_color,
+            "dominant": registry.classify_color(mean_color),
+            "color_filter": any(key in name.lower() for key in registry.COLOR_FILTER_KEYS),
+            "roi": rois.get(name),
+            "threshold": thresholds.get(name),
+        }
+    header = json.dumps({"version": VERSION, "entries": entries}, ensure_ascii=False).encode("utf-8")
+    data_start = _align(len(MAGIC) + 8 + len(header))
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        for off, arr in blobs:
+            f.seek(data_start + off)
+            f.write(arr.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp, path)
+    return len(entries)
+
+
+# ------------------------
+# 读取
+# ------------------------
+class Atlas:
+    """只读映射的图集；arrays(name) 返回 (gray, bgr) 两个零拷贝只读视图"""
+
+    def __init__(self, path=None):
+        self.path = ATLAS_PATH if path is None else path
+        with open(self.path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("不是模板图集文件")
+            (n,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(n).decode("utf-8"))
+        if header.get("version") != VERSION:
+            raise ValueError(f"图集版本不符: {header.get('version')}")
+        self.entries = header["entries"]
+        self._start = _align(len(MAGIC) + 8 + n)
+        self._mm = np.memmap(self.path, dtype=np.uint8, mode="r") if self.entries else None
+
+    def arrays(self, name):
+        e = self.entries[name]
+        w, h = e["w"], e["h"]
+        base = self._start
+        gray = self._mm[base + e["gray_off"]: base + e["gray_off"] + w * h].reshape(h, w)
+        bgr = self._mm[base + e["bgr_off"]: base + e["bgr_off"] + w * h * 3].reshape(h, w, 3)
+        return gray, bgr
+
+    def stale(self, sources):
+        """
+        源文件是否与图集不一致：增删文件，或大小 / mtime 变化且内容哈希不同。
+        只改了 mtime（如重新检出）的文件不触发重建。
+        """
+        if set(sources) != set(self.entries):
+            return True
+        for name, src in sources.items():
+            e = self.entries[name]
+            try:
+                if os.path.getsize(src) == e["size"] and os.path.getmtime(src) == e["mtime"]:
+                    continue
+            except OSError:
+                return True
+            if _sha1(src) != e["sha1"]:
+                return True
+        return False
+
+
+def ensure(sources, path=None):
+    """打开图集；不存在、损坏或与源文件不一致时先重建。失败返回 None（调用方退回逐个解码 PNG）"""
+    import utils
+    path = ATLAS_PATH if path is None else path
+    try:
+        if os.path.exists(path):
+            atlas = Atlas(path)
+            if not atlas.stale(sources):
+                return atlas
+            utils.log("[ATLAS] 模板有变化，重建图集")
+        n = build(sources, path)
+        utils.log(f"[ATLAS] 已打包 {n} 个模板 -> {path}")
+        return Atlas(path)
+    except Exception as e:
+        utils.log(f"[ATLAS] 图集不可用，改为逐个读取 PNG: {e}")
+        return None
+
+
+def main(argv=None):
+    import registry
+    argv = sys.argv[1:] if argv is None else argv
+    cmd = argv[0] if argv else "build"
+    sources = {name: p for name, (p, _) in registry.REGISTRY._scan().items()}
+    if cmd == "build":
+        print(f"已打包 {build(sources)} 个模板 -> {ATLAS_PATH}")
+        return 0
+    if cmd == "info":
+        atlas = Atlas()
+        total = sum(e["w"] * e["h"] * 4 for e in atlas.entries.values())
+        print(f"{ATLAS_PATH}: {len(atlas.entries)} 个模板, 像素数据 {total / 1024:.0f} KB, "
+              f"{'需要重建' if atlas.stale(sources) else '与源文件一致'}")
+        for name, e in sorted(atlas.entries.items()):
+            print(f"  {name:<40}{e['w']:>5}x{e['h']:<5}{e['dominant']:>9}  roi={e['roi']}  thr={e['threshold']}")
+        return 0
+    print("用法: python atlas.py build | info")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
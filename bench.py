@@ -0,0 +1,408 @@
+# bench.py - 离线基准：回放录制帧，测状态检测 / 模板匹配的耗时、帧率、内存和识别准确率
+#
+# 用法：
+#   python bench.py run [--dir logs] [--pattern "debug_*.png"] [--labels logs/labels.json] [--out a.json]
+#   python bench.py compare a.json b.json [--tolerance 0.15]
+#   录制档案回归：run --archive logs/rec_20250101_120000（默认以录制时的检测结果为标签）
+#   并行加速对比：run --workers 1 --out serial.json，run --workers 8 --out par.json，再 compare
+#   缩小图匹配对比：run --full-res --out full.json，run --out scaled.json，再 compare
+#   python bench.py logstats [logs/run_2025-01-01.jsonl ...]   分析运行日志里的 tick 记录（默认 logs 下全部）
+#   python bench.py inputs [--points 3] [--repeat 20] [--realtime] [--trace]   用 mock 输入后端测输入命令的时序
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import tracemalloc
+import config
+
+# 基准默认测试的模板（状态检测 + 点击确认 + 导航）
+DEFAULT_TEMPLATES = [
+    "port_join_battle.png", "port_join_battle_disabled.png", "minimap_corner.png",
+    "victory.png", "defeat.png", "back_to_port.png", "queue_waiting.png",
+    "battle_score_bar.png", "auto_nav_icon.png", "map_open_indicator.png",
+    "cap_enemy.png", "cap_enemy_1.png", "cap_enemy_2.png", "cap_enemy_3.png",
+    "cap_neutral.png", "cap_neutral_1.png", "cap_neutral_2.png", "cap_neutral_3.png",
+]
+
+# 导航一步的占点模板（multimatch 批量匹配）
+CAP_TEMPLATES = [
+    "cap_enemy.png", "cap_enemy_1.png", "cap_enemy_2.png", "cap_enemy_3.png",
+    "cap_neutral.png", "cap_neutral_1.png", "cap_neutral_2.png", "cap_neutral_3.png",
+]
+
+STATES = ["PORT", "QUEUE", "BATTLE", "RESULT", "UNKNOWN"]
+
+
+# ------------------------
+# 统计工具
+# ------------------------
+def percentile(sorted_vals, p):
+    if not sorted_vals:
+        return 0.0
+    k = (len(sorted_vals) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+
+def summarize(samples_ms):
+    vals = sorted(samples_ms)
+    n = len(vals)
+    return {
+        "n": n,
+        "mean_ms": round(sum(vals) / n, 3) if n else 0.0,
+        "p50_ms": round(percentile(vals, 50), 3),
+        "p90_ms": round(percentile(vals, 90), 3),
+        "p99_ms": round(percentile(vals, 99), 3),
+        "max_ms": round(vals[-1], 3) if n else 0.0,
+    }
+
+
+def load_labels(path):
+    """标签文件：JSON {文件名: 状态} 或 CSV 两列 文件名,状态"""
+    if not path:
+        return {}
+    if path.lower().endswith(".csv"):
+        with open(path, "r", encoding="utf-8") as f:
+            return {row[0].strip(): row[1].strip() for row in csv.reader(f) if len(row) >= 2}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def peak_rss_mb():
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 单位为 KB，macOS 为字节
+        return round(rss / 1024.0 / (1024.0 if sys.platform == "darwin" else 1.0), 1)
+    except Exception:
+        return None
+
+
+# ------------------------
+# run
+# ------------------------
+def run(args):
+    config.DEBUG = args.debug
+    config.FRAME_GATE = args.gate
+    if args.workers is not None:
+        config.MATCH_WORKERS = args.workers
+    if args.full_res:
+        config.MATCH_SCALE_ENABLED = False
+
+    import capture
+    import roi
+    import registry
+    import frame as framebus
+    import states
+    import multimatch
+    import captracker
+    from utils import find_template_in_window, match_template_multiscale
+
+    if args.archive:
+        backend = capture.set_backend(capture.ArchiveReplayBackend(args.archive, loop=False, preload=True))
+    else:
+        backend = capture.set_backend(capture.ReplayBackend(args.dir, args.pattern, loop=False, preload=True))
+    if not backend.paths:
+        print(f"没有找到回放帧: {args.archive or os.path.join(args.dir, args.pattern)}")
+        return 2
+    # 基准不读写持久化的 ROI 学习结果，保证每次运行条件一致
+    roi.TABLE = roi.RoiTable(path=None)
+    registry.preload()
+    # 录制档案没有另给标签时，以录制时检测出的状态为基准：准确率即与录制时结果的一致率。
+    # 缩小 / 裁剪录制的档案回放后像素与录制时不同，检测结果本就可能不一致，不能当作标签
+    if args.labels or not args.archive:
+        labels = load_labels(args.labels)
+    elif backend.archive.exact:
+        labels = backend.archive.labels()
+    else:
+        print("警告：档案是缩小 / 裁剪录制的（RECORD_STEP > 1 或 RECORD_CROP），回放不能复现录制时的检测结果，"
+              "不以录制状态为标签、不统计准确率；需要回归基准请用 RECORD_STEP = 1 录制或另给 --labels")
+        labels = {}
+    templates = args.templates.split(",") if args.templates else DEFAULT_TEMPLATES
+
+    tick_ms = []
+    tpl_ms = {name: [] for name in templates}
+    ms_ms = {name: [] for name in templates}
+    cap_ms = []
+    confusion = {}
+    correct = labelled = 0
+
+    tracemalloc.start()
+    wall_start = time.perf_counter()
+    for _ in range(args.repeat):
+        backend.index = -1
+        while True:
+            t0 = time.perf_counter()
+            state, info = states.detect_state_once()
+            dt = (time.perf_counter() - t0) * 1000.0
+            path = backend.current_path
+            f = framebus.latest(backend.HWND)
+            if path is None or f is None or backend.index < 0:
+                break
+            tick_ms.append(dt)
+
+            fname = os.path.basename(path)
+            truth = labels.get(fname)
+            if truth is not None:
+                labelled += 1
+                correct += int(truth == state)
+                row = confusion.setdefault(truth, {})
+                row[state] = row.get(state, 0) + 1
+
+            if not args.ticks_only:
+                for name in templates:
+                    t0 = time.perf_counter()
+                    find_template_in_window(f, name)
+                    tpl_ms[name].append((time.perf_counter() - t0) * 1000.0)
+                    t0 = time.perf_counter()
+                    match_template_multiscale(f.gray, name)
+                    ms_ms[name].append((time.perf_counter() - t0) * 1000.0)
+                # 导航一步：新帧上批量匹配全部占点模板（含颜色过滤图计算）
+                g = framebus.Frame(f.bgr, f.rect, f.hwnd)
+                t0 = time.perf_counter()
+                multimatch.match_all(g, CAP_TEMPLATES, threshold=0.6, rect=captracker.map_rect(g.width, g.height))
+                cap_ms.append((time.perf_counter() - t0) * 1000.0)
+
+            if backend.index >= len(backend.paths) - 1:
+                break
+    wall = time.perf_counter() - wall_start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total_tick_s = sum(tick_ms) / 1000.0
+    result = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "dir": args.archive or args.dir, "pattern": None if args.archive else args.pattern,
+            "frames": len(backend.paths),
+            "repeat": args.repeat, "frame_gate": args.gate, "workers": config.MATCH_WORKERS,
+            "match_scale": config.MATCH_SCALE_ENABLED,
+        },
+        "ticks": summarize(tick_ms),
+        "fps": round(len(tick_ms) / total_tick_s, 2) if total_tick_s else 0.0,
+        "wall_s": round(wall, 3),
+        "peak_traced_mb": round(peak / 1024.0 / 1024.0, 1),
+        "peak_rss_mb": peak_rss_mb(),
+        "find_template_in_window": {k: summarize(v) for k, v in tpl_ms.items() if v},
+        "match_template_multiscale": {k: summarize(v) for k, v in ms_ms.items() if v},
+        "cap_batch": summarize(cap_ms),
+        "confusion": confusion,
+        "accuracy": round(correct / labelled, 4) if labelled else None,
+        "labelled": labelled,
+    }
+    print_report(result)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fp:
+            json.dump(result, fp, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.out}")
+    return 0
+
+
+def print_report(r):
+    t = r["ticks"]
+    print(f"帧数 {t['n']}  |  tick p50={t['p50_ms']}ms p90={t['p90_ms']}ms p99={t['p99_ms']}ms "
+          f"max={t['max_ms']}ms  |  {r['fps']} fps")
+    print(f"峰值内存: tracemalloc {r['peak_traced_mb']} MB, RSS {r['peak_rss_mb']} MB")
+    c = r.get("cap_batch")
+    if c and c["n"]:
+        print(f"占点批量匹配({r['meta'].get('workers')} 线程): p50={c['p50_ms']}ms p90={c['p90_ms']}ms max={c['max_ms']}ms")
+    for section in ("find_template_in_window", "match_template_multiscale"):
+        if not r[section]:
+            continue
+        print(f"\n{section}:")
+        print(f"  {'模板':<34}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}")
+        for name, s in r[section].items():
+            print(f"  {name:<34}{s['p50_ms']:>9.2f}{s['p90_ms']:>9.2f}{s['p99_ms']:>9.2f}{s['max_ms']:>9.2f}")
+    if r["labelled"]:
+        print(f"\n准确率: {r['accuracy']:.2%} ({r['labelled']} 帧有标签)")
+        print("混淆矩阵（行=标签，列=识别结果）:")
+        print("  " + "".join(f"{s:>9}" for s in [""] + STATES))
+        for truth in STATES:
+            row = r["confusion"].get(truth)
+            if row:
+                print("  " + f"{truth:>9}" + "".join(f"{row.get(s, 0):>9}" for s in STATES))
+
+
+# ------------------------
+# compare
+# ------------------------
+def compare(args):
+    with open(args.base, "r", encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, "r", encoding="utf-8") as f:
+        new = json.load(f)
+    regressions = []
+
+    def check(label, b, n):
+        if not b:
+            return
+        ratio = n / b
+        mark = ""
+        if ratio > 1.0 + args.tolerance:
+            mark = "  <-- 变慢"
+            regressions.append(label)
+        print(f"  {label:<60}{b:>10.2f}{n:>10.2f}{ratio:>8.2f}x{mark}")
+
+    print(f"  {'指标':<60}{'base':>10}{'new':>10}{'比值':>9}")
+    for key in ("p50_ms", "p90_ms", "p99_ms"):
+        check(f"tick {key}", base["ticks"][key], new["ticks"][key])
+    if base.get("cap_batch", {}).get("n") and new.get("cap_batch", {}).get("n"):
+        check("cap_batch p50_ms", base["cap_batch"]["p50_ms"], new["cap_batch"]["p50_ms"])
+    for section in ("find_template_in_window", "match_template_multiscale"):
+        for name, s in base.get(section, {}).items():
+            if name in new.get(section, {}):
+                check(f"{section}[{name}] p50_ms", s["p50_ms"], new[section][name]["p50_ms"])
+
+    if base.get("accuracy") is not None and new.get("accuracy") is not None:
+        drop = base["accuracy"] - new["accuracy"]
+        print(f"\n  准确率 {base['accuracy']:.2%} -> {new['accuracy']:.2%}")
+        if drop > args.accuracy_tolerance:
+            regressions.append("accuracy")
+
+    if regressions:
+        print(f"\n发现 {len(regressions)} 项回退: {', '.join(regressions)}")
+        return 1
+    print("\n没有发现回退")
+    return 0
+
+
+# ------------------------
+# logstats：分析运行日志（logger.py 写的 JSON Lines）
+# ------------------------
+def logstats(args):
+    import logger
+    paths = args.paths or logger.log_files()
+    if not paths:
+        print("没有找到日志文件")
+        return 2
+    tick_ms = []
+    gated = 0
+    state_counts = {}
+    by_session = {}
+    scores = {}
+    tpl_ms = {}
+    for rec in logger.read_records(paths, kind="tick"):
+        tick_ms.append(rec.get("ms", 0.0))
+        gated += int(bool(rec.get("gated")))
+        state = rec.get("state", "UNKNOWN")
+        state_counts[state] = state_counts.get(state, 0) + 1
+        by_session[rec.get("session")] = by_session.get(rec.get("session"), 0) + 1
+        for name, v in rec.get("scores", {}).items():
+            scores.setdefault(name, []).append(v)
+        for name, v in rec.get("tpl_ms", {}).items():
+            tpl_ms.setdefault(name, []).append(v)
+
+    result = {
+        "files": paths,
+        "ticks": summarize(tick_ms),
+        "gated": gated,
+        "states": state_counts,
+        "sessions": {str(k): v for k, v in by_session.items()},
+        "templates": {
+            name: dict(summarize(tpl_ms.get(name, [])),
+                       score_mean=round(sum(v) / len(v), 4), score_min=min(v), score_max=max(v))
+            for name, v in scores.items()
+        },
+    }
+    t = result["ticks"]
+    print(f"{len(paths)} 个日志文件 | tick {t['n']} 次 (门控复用 {gated}) | "
+          f"p50={t['p50_ms']}ms p90={t['p90_ms']}ms p99={t['p99_ms']}ms max={t['max_ms']}ms")
+    print("状态分布: " + ", ".join(f"{k}={v}" for k, v in sorted(state_counts.items())))
+    if result["templates"]:
+        print(f"\n  {'模板':<34}{'次数':>7}{'p50ms':>9}{'p90ms':>9}{'置信度均值':>12}{'最低':>8}{'最高':>8}")
+        for name, s in sorted(result["templates"].items()):
+            print(f"  {name:<34}{s['n']:>7}{s['p50_ms']:>9.2f}{s['p90_ms']:>9.2f}"
+                  f"{s['score_mean']:>12.3f}{s['score_min']:>8.3f}{s['score_max']:>8.3f}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fp:
+            json.dump(result, fp, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.out}")
+    return 0
+
+
+# ------------------------
+# inputs：mock 输入后端上跑点击 / Shift 连点 / 按键，统计各类命令的输入时长和排队延迟
+# ------------------------
+def bench_inputs(args):
+    import inputs
+    backend = inputs.set_backend(inputs.MockBackend(realtime=args.realtime))
+    sched = inputs.InputScheduler(backend)
+    sched.start()
+    points = [(100 + 50 * i, 200 + 30 * i) for i in range(args.points)]
+    input_ms = {}
+    queue_ms = {}
+    for i in range(args.repeat):
+        for make in (lambda: inputs.Click(10, 20), lambda: inputs.ShiftClicks(points), lambda: inputs.KeyPress("m")):
+            cmd = make()
+            t0 = backend.now()
+            sched.submit(cmd).wait(settled=True)
+            input_ms.setdefault(cmd.kind, []).append((backend.now() - t0) * 1000.0)
+            queue_ms.setdefault(cmd.kind, []).append((cmd.started - cmd.queued) * 1000.0)
+        if args.trace and i == 0:
+            for t, op, a in backend.events:
+                print(f"  {t * 1000:>9.1f}ms  {op:<10} {a}")
+    sched.stop()
+    print(f"输入后端: mock ({'实时' if args.realtime else '虚拟时钟'}) | 每种命令 {args.repeat} 次 | 连点 {args.points} 个点")
+    print(f"\n  {'命令':<14}{'输入+稳定 p50ms':>16}{'max':>9}{'排队 p50ms':>12}{'max':>9}")
+    result = {}
+    for kind in input_ms:
+        s, q = summarize(input_ms[kind]), summarize(queue_ms[kind])
+        result[kind] = {"input": s, "queue": q}
+        print(f"  {kind:<14}{s['p50_ms']:>16.1f}{s['max_ms']:>9.1f}{q['p50_ms']:>12.2f}{q['max_ms']:>9.2f}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fp:
+            json.dump(result, fp, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.out}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="WoWsBot 离线基准")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_run = sub.add_parser("run", help="回放录制帧并测速")
+    p_run.add_argument("--dir", default=config.REPLAY_DIR)
+    p_run.add_argument("--pattern", default=config.REPLAY_PATTERN)
+    p_run.add_argument("--archive", default=None, help="回放 recorder 录制档案（logs/rec_<时间>），代替 --dir/--pattern")
+    p_run.add_argument("--labels", default=None, help="标签文件（JSON 或 CSV）")
+    p_run.add_argument("--templates", default=None, help="逗号分隔的模板列表，默认测常用模板")
+    p_run.add_argument("--repeat", type=int, default=1)
+    p_run.add_argument("--ticks-only", action="store_true", help="只测 detect_state_once")
+    p_run.add_argument("--gate", action="store_true", help="启用画面变化门控")
+    p_run.add_argument("--workers", type=int, default=None, help="匹配线程数（默认 config.MATCH_WORKERS，1 为串行）")
+    p_run.add_argument("--full-res", action="store_true", help="关闭缩小图匹配（MATCH_SCALE），全部按原分辨率匹配")
+    p_run.add_argument("--debug", action="store_true", help="打开 DEBUG 日志")
+    p_run.add_argument("--out", default=None, help="结果 JSON 输出路径")
+
+    p_cmp = sub.add_parser("compare", help="比较两次 run 的结果")
+    p_cmp.add_argument("base")
+    p_cmp.add_argument("new")
+    p_cmp.add_argument("--tolerance", type=float, default=0.15, help="允许的耗时增长比例")
+    p_cmp.add_argument("--accuracy-tolerance", type=float, default=0.0, help="允许的准确率下降")
+
+    p_log = sub.add_parser("logstats", help="分析运行日志中的 tick 记录")
+    p_log.add_argument("paths", nargs="*", help="JSON Lines 日志文件，默认 logs 下全部 run_*.jsonl")
+    p_log.add_argument("--out", default=None, help="结果 JSON 输出路径")
+
+    p_in = sub.add_parser("inputs", help="用 mock 输入后端测输入命令时序")
+    p_in.add_argument("--points", type=int, default=config.NAV_WAYPOINTS, help="Shift 连点的点数")
+    p_in.add_argument("--repeat", type=int, default=20)
+    p_in.add_argument("--realtime", action="store_true", help="真实等待（默认虚拟时钟，瞬间跑完）")
+    p_in.add_argument("--trace", action="store_true", help="打印第一轮的输入事件")
+    p_in.add_argument("--out", default=None, help="结果 JSON 输出路径")
+
+    args = parser.parse_args(argv)
+    if args.cmd == "run":
+        return run(args)
+    if args.cmd == "logstats":
+        return logstats(args)
+    if args.cmd == "inputs":
+        return bench_inputs(args)
+    return compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
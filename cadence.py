@@ -0,0 +1,203 @@
+# cadence.py - 自适应检测节奏：从历史学习每个状态的停留时长分布（匹配等待、战斗时长、结算界面），
+#              状态转移不太可能发生时稀疏检测，接近预期转移时间时密集检测；统计省下的检测次数 / CPU 和反应延迟变化
+#
+# 用法：python cadence.py   查看学到的停留时长和不同停留时间下的检测间隔
+import os
+import sys
+import json
+import time
+import threading
+from collections import deque
+import config
+import logger
+import utils
+
+# 停留时长统计持久化文件（相对 LOG_DIR）
+DWELL_STATE_FILE = "dwell_times.json"
+
+
+def _percentile(sorted_vals, p):
+    k = (len(sorted_vals) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+
+class DwellStats:
+    """
+    每个状态最近 CADENCE_HISTORY 次完整停留的时长（秒）。样本够 CADENCE_LEARN_MIN 条后按经验分布给出检测间隔：
+    已在状态里停留 elapsed 秒时，取最大的间隔 Δ，使“Δ 内发生转移”的条件概率
+    P(T <= elapsed + Δ | T > elapsed) 不超过 CADENCE_TARGET_P，再限制在 [CADENCE_MIN_INTERVAL, CADENCE_MAX_INTERVAL]。
+    离预期转移还远时 Δ 很大（稀疏），进入历史转移时间密集的区间后 Δ 很小（密集）；
+    超过全部历史样本（比以往都久）时模型不再可信，退回默认间隔。
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._samples = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    # ------------------------
+    # 持久化
+    # ------------------------
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for state, vals in data.items():
+                self._samples[state] = deque(vals, maxlen=config.CADENCE_HISTORY)
+            utils.dbg(f"[CADENCE] 载入 {len(data)} 个状态的停留时长")
+        except Exception as e:
+            utils.dbg(f"[CADENCE] 读取 {self.path} 失败: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = {state: list(vals) for state, vals in self._samples.items()}
+        try:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+        except Exception as e:
+            utils.dbg(f"[CADENCE] 保存 {self.path} 失败: {e}")
+
+    # ------------------------
+    # 统计
+    # ------------------------
+    def record(self, state, seconds):
+        with self._lock:
+            vals = self._samples.setdefault(state, deque(maxlen=config.CADENCE_HISTORY))
+            vals.append(round(seconds, 2))
+
+    def interval(self, state, elapsed, default):
+        """返回 (检测间隔秒数, 是否稀疏)；样本不足或已超过全部历史样本时为 (default, False)"""
+        with self._lock:
+            vals = sorted(self._samples.get(state, ()))
+        if len(vals) < config.CADENCE_LEARN_MIN:
+            return default, False
+        remaining = [v for v in vals if v > elapsed]
+        if not remaining:
+            return default, False
+        nearest = _percentile(remaining, config.CADENCE_TARGET_P * 100.0)
+        gap = min(config.CADENCE_MAX_INTERVAL, max(config.CADENCE_MIN_INTERVAL, nearest - elapsed))
+        return gap, gap > default
+
+    def stats(self):
+        with self._lock:
+            out = {}
+            for state, vals in self._samples.items():
+                vals = sorted(vals)
+                out[state] = {
+                    "n": len(vals),
+                    "p5": round(_percentile(vals, 5), 1) if vals else None,
+                    "p50": round(_percentile(vals, 50), 1) if vals else None,
+                    "p95": round(_percentile(vals, 95), 1) if vals else None,
+                }
+        return out
+
+
+STATS = DwellStats(path=os.path.join(utils.LOG_DIR, DWELL_STATE_FILE))
+
+
+# ------------------------
+# 效果统计：与固定间隔（spec delay + STATE_CHECK_INTERVAL）相比省下的检测次数和反应延迟变化
+# ------------------------
+class Savings:
+    """
+    每次检测记一笔：实际检测次数 +1，固定间隔下同一段时间应检测的次数 += 距上次检测的时间 / 固定间隔。
+    省下的 CPU = (应检测次数 - 实际次数) × 平均每次检测耗时。
+    反应延迟：状态转移发生在两次检测之间，期望延迟取检测间隔的一半；固定间隔下为固定间隔的一半。
+    """
+
+    def __init__(self):
+        self.polls = 0
+        self.baseline_polls = 0.0
+        self.tick_ms = 0.0
+        self.transitions = 0
+        self.latency = 0.0
+        self.baseline_latency = 0.0
+        self._lock = threading.Lock()
+        self._last_report = time.time()
+
+    def note(self, gap, baseline, tick_ms, changed):
+        with self._lock:
+            self.polls += 1
+            self.baseline_polls += gap / baseline if baseline > 0 else 1.0
+            self.tick_ms += tick_ms
+            if changed:
+                self.transitions += 1
+                self.latency += gap / 2.0
+                self.baseline_latency += baseline / 2.0
+
+    def report(self):
+        with self._lock:
+            mean_ms = self.tick_ms / self.polls if self.polls else 0.0
+            saved = max(0.0, self.baseline_polls - self.polls)
+            return {
+                "polls": self.polls,
+                "baseline_polls": round(self.baseline_polls, 1),
+                "saved_polls_pct": round(100.0 * saved / self.baseline_polls, 1) if self.baseline_polls else 0.0,
+                "cpu_saved_s": round(saved * mean_ms / 1000.0, 2),
+                "transitions": self.transitions,
+                "latency_s": round(self.latency / self.transitions, 2) if self.transitions else None,
+                "baseline_latency_s": round(self.baseline_latency / self.transitions, 2) if self.transitions else None,
+            }
+
+    def summary_line(self):
+        r = self.report()
+        line = (f"[CADENCE] 检测 {r['polls']} 次 / 固定间隔约 {r['baseline_polls']:.0f} 次，"
+                f"省 {r['saved_polls_pct']}%（CPU {r['cpu_saved_s']}s）")
+        if r["transitions"]:
+            line += f" | 转移 {r['transitions']} 次，期望反应延迟 {r['baseline_latency_s']}s -> {r['latency_s']}s"
+        return line
+
+
+SAVINGS = Savings()
+
+
+def baseline_interval(delay):
+    """原来的固定节奏：处理后等 spec delay 再加 STATE_CHECK_INTERVAL"""
+    return delay + config.STATE_CHECK_INTERVAL
+
+
+def next_interval(state, elapsed, delay, pending=False):
+    """
+    距下一次检测的秒数和是否处于稀疏阶段。CADENCE 关闭、状态还有未完成的 once 动作（动作自己有节奏）
+    或没有足够历史时用固定节奏。
+    """
+    default = baseline_interval(delay)
+    if not config.CADENCE or pending:
+        return default, False
+    return STATS.interval(state, elapsed, default)
+
+
+def maybe_report():
+    """距上次报告超过 CADENCE_REPORT_INTERVAL 秒时输出一行效果统计"""
+    if not config.CADENCE or not config.CADENCE_REPORT_INTERVAL:
+        return
+    now = time.time()
+    if now - SAVINGS._last_report < config.CADENCE_REPORT_INTERVAL:
+        return
+    SAVINGS._last_report = now
+    utils.log(SAVINGS.summary_line())
+    logger.emit("cadence", **SAVINGS.report())
+
+
+def main(argv=None):
+    stats = STATS.stats()
+    if not stats:
+        print(f"还没有停留时长记录（{STATS.path}）")
+        return 0
+    probe = [0, 5, 15, 30, 60, 120, 300, 600, 900]
+    print(f"  {'状态':<10}{'样本':>6}{'p5':>8}{'p50':>8}{'p95':>8}   停留 t 秒时的检测间隔")
+    for state, s in sorted(stats.items()):
+        gaps = " ".join(f"{t}s:{STATS.interval(state, t, baseline_interval(0.0))[0]:.1f}" for t in probe)
+        print(f"  {state:<10}{s['n']:>6}{s['p5']:>8}{s['p50']:>8}{s['p95']:>8}   {gaps}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
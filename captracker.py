@@ -0,0 +1,133 @@
+# captracker.py - 占领点跟踪：多帧累积地图上的占点检测，按置信度加权平滑位置和类别，从模型里给出导航点
+import config
+import metrics
+import multimatch
+import frame as framebus
+from utils import dbg
+
+# 导航用的占点模板（敌方 + 中立）
+CAP_TEMPLATES = [
+    "cap_enemy.png", "cap_enemy_1.png", "cap_enemy_2.png", "cap_enemy_3.png",
+    "cap_neutral.png", "cap_neutral_1.png", "cap_neutral_2.png", "cap_neutral_3.png",
+]
+
+
+def map_rect(width, height):
+    """战术地图在客户区里的像素矩形 (x0, y0, x1, y1)（NAV_MAP_RECT 为比例）"""
+    r = config.NAV_MAP_RECT
+    return int(r[0] * width), int(r[1] * height), int(r[2] * width), int(r[3] * height)
+
+
+class CapPoint:
+    """一个占点的累积模型：地图相对坐标 (u, v ∈ [0, 1])、累计权重、各类别得分、命中次数"""
+
+    def __init__(self, u, v, cls, score):
+        self.u = u
+        self.v = v
+        self.weight = score
+        self.votes = {cls: score}
+        self.hits = 1
+        self.best = score
+
+    @property
+    def cls(self):
+        return max(self.votes, key=self.votes.get)
+
+    def update(self, u, v, cls, score):
+        w = self.weight + score
+        self.u = (self.u * self.weight + u * score) / w
+        self.v = (self.v * self.weight + v * score) / w
+        self.weight = w
+        self.votes[cls] = self.votes.get(cls, 0.0) + score
+        self.hits += 1
+        self.best = max(self.best, score)
+
+    def __repr__(self):
+        return f"CapPoint({self.cls} u={self.u:.3f} v={self.v:.3f} w={self.weight:.2f} hits={self.hits})"
+
+
+class CapTracker:
+    """
+    每次 observe() 把一帧的占点检测并入模型：
+    - 只接受战术地图矩形内的检测（取代原来的 y > 100 过滤），换算成地图相对坐标
+    - 与已有点距离 <= CAPTRACK_RADIUS 的并入该点（置信度加权平均位置、类别投票），否则新建
+    - 本帧没看到的点权重乘 CAPTRACK_DECAY，低于 CAPTRACK_MIN_WEIGHT 删除 —— 单帧误检很快消失
+    命中 >= CAPTRACK_MIN_HITS 帧的点才作为导航点。一场战斗内模型保留，重试导航时不必从头扫描。
+    """
+
+    def __init__(self):
+        self.points = []
+        self.frames = 0
+        self.last_frame = None
+
+    def reset(self):
+        self.points = []
+        self.frames = 0
+        self.last_frame = None
+
+    def observe(self, f, detections=None):
+        if detections is None:
+            detections = multimatch.match_all(f, CAP_TEMPLATES, threshold=config.CAPTRACK_THRESHOLD,
+                                              rect=map_rect(f.width, f.height))
+        x0, y0, x1, y1 = map_rect(f.width, f.height)
+        mw, mh = float(x1 - x0), float(y1 - y0)
+        self.frames += 1
+        seen = set()
+        rejected = 0
+        for d in detections:
+            cx, cy = d.center
+            if not (x0 <= cx < x1 and y0 <= cy < y1):
+                rejected += 1
+                continue
+            u, v = (cx - x0) / mw, (cy - y0) / mh
+            best, best_dist = None, config.CAPTRACK_RADIUS
+            for p in self.points:
+                dist = ((p.u - u) ** 2 + (p.v - v) ** 2) ** 0.5
+                if dist <= best_dist and id(p) not in seen:
+                    best, best_dist = p, dist
+            if best is None:
+                best = CapPoint(u, v, d.cls, d.score)
+                self.points.append(best)
+            else:
+                best.update(u, v, d.cls, d.score)
+            seen.add(id(best))
+        for p in self.points:
+            if id(p) not in seen:
+                p.weight *= config.CAPTRACK_DECAY
+        self.points = [p for p in self.points if p.weight >= config.CAPTRACK_MIN_WEIGHT]
+        if rejected:
+            dbg(f"[CAPTRACK] 过滤掉 {rejected} 个地图区域外的检测")
+        metrics.count("captrack.frames")
+        return len(seen)
+
+    def confirmed(self):
+        return [p for p in self.points if p.hits >= config.CAPTRACK_MIN_HITS]
+
+    def scan(self, hwnd, first=None):
+        """
+        连续观察至少 CAPTRACK_FRAMES 帧；还没有确认的点就继续，最多 CAPTRACK_MAX_FRAMES 帧。
+        first 为已经截好的地图帧（会作为第一帧）。返回确认的点数。
+        """
+        n = 0
+        f = first
+        for _ in range(config.CAPTRACK_MAX_FRAMES):
+            if f is None:
+                metrics.sleep(config.CAPTRACK_INTERVAL, "sleep.captrack")
+                f = framebus.capture(hwnd)
+            if f is not None:
+                self.observe(f)
+                n += 1
+                self.last_frame = f
+            f = None
+            if n >= config.CAPTRACK_FRAMES and self.confirmed():
+                break
+        dbg(f"[CAPTRACK] 观察 {n} 帧，模型: {self.points}")
+        return len(self.confirmed())
+
+    def waypoints(self, width, height, limit=None):
+        """按累计权重从高到低返回最多 limit 个确认点的客户区像素坐标"""
+        if limit is None:
+            limit = config.NAV_WAYPOINTS
+        x0, y0, x1, y1 = map_rect(width, height)
+        pts = sorted(self.confirmed(), key=lambda p: p.weight, reverse=True)[:limit]
+        return [(int(x0 + p.u * (x1 - x0)), int(y0 + p.v * (y1 - y0))) for p in pts]
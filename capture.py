@@ -0,0 +1,346 @@
+# capture.py - 截图后端：pyautogui（旧路径）/ gdi（预分配缓冲区快速路径）/ replay（从图片目录回放）/ archive（从录制档案回放）
+import os
+import glob
+import threading
+import cv2
+import numpy as np
+import config
+import utils
+
+
+class CaptureBackend:
+    """
+    截图后端接口：
+    - find_window(title)      -> hwnd 或 None
+    - find_windows(title)     -> 所有同名窗口的 hwnd 列表（多开）
+    - activate(hwnd)          -> 把窗口切到前台（多开时输入前调用）
+    - get_client_rect(hwnd)   -> {"left", "top", "width", "height", "hwnd"} 或 None
+    - grab(hwnd, rect)        -> BGR ndarray 或 None
+    fallback 为连续截图失败后改用的后端名（None 不切换）
+    """
+    name = "base"
+    fallback = None
+
+    def find_window(self, title):
+        raise NotImplementedError
+
+    def find_windows(self, title):
+        hwnd = self.find_window(title)
+        return [hwnd] if hwnd is not None else []
+
+    def activate(self, hwnd):
+        return True
+
+    def get_client_rect(self, hwnd):
+        raise NotImplementedError
+
+    def grab(self, hwnd, rect):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+# ------------------------
+# Windows 窗口定位（pyautogui / gdi 共用）
+# ------------------------
+class Win32WindowMixin:
+    def find_window(self, title):
+        import win32gui
+        hwnd = win32gui.FindWindow(None, title)
+        if hwnd == 0:
+            return None
+        return hwnd
+
+    def find_windows(self, title):
+        import win32gui
+        found = []
+
+        def _cb(hwnd, _):
+            if win32gui.IsWindowVisible(hwnd) and win32gui.GetWindowText(hwnd) == title:
+                found.append(hwnd)
+            return True
+
+        win32gui.EnumWindows(_cb, None)
+        return sorted(found)
+
+    def activate(self, hwnd):
+        import win32gui
+        try:
+            if win32gui.GetForegroundWindow() != hwnd:
+                win32gui.SetForegroundWindow(hwnd)
+            return True
+        except Exception as e:
+            utils.dbg(f"[CAPTURE] 切换前台窗口失败 hwnd={hwnd}: {e}")
+            return False
+
+    def get_client_rect(self, hwnd):
+        """返回客户区左上角屏幕坐标以及宽高"""
+        import win32gui
+        try:
+            left_top = win32gui.ClientToScreen(hwnd, (0, 0))
+            cl, ct, cr, cb = win32gui.GetClientRect(hwnd)
+            return {"left": left_top[0], "top": left_top[1], "width": cr, "height": cb, "hwnd": hwnd}
+        except Exception as e:
+            utils.dbg(f"get_client_rect error: {e}")
+            return None
+
+
+class PyAutoGuiBackend(Win32WindowMixin, CaptureBackend):
+    """旧路径：pyautogui.screenshot -> PIL -> numpy -> BGR，多次整帧拷贝"""
+    name = "pyautogui"
+
+    def grab(self, hwnd, rect):
+        import pyautogui
+        img = pyautogui.screenshot(region=(rect["left"], rect["top"], rect["width"], rect["height"]))
+        return cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
+
+
+class _GdiContext:
+    """单个窗口的 GDI 资源：客户区 DC、内存 DC、兼容位图和预分配的 BGRA 读出缓冲区"""
+
+    def __init__(self, hwnd, w, h):
+        import win32gui, win32ui
+        self.hwnd = hwnd
+        self.size = (w, h)
+        self.hwnd_dc = win32gui.GetDC(hwnd)
+        self.src_dc = win32ui.CreateDCFromHandle(self.hwnd_dc)
+        self.mem_dc = self.src_dc.CreateCompatibleDC()
+        self.bmp = win32ui.CreateBitmap()
+        self.bmp.CreateCompatibleBitmap(self.src_dc, w, h)
+        self.mem_dc.SelectObject(self.bmp)
+        self.bgra = np.empty((h, w, 4), dtype=np.uint8)
+
+    def read_bits(self):
+        """把位图像素直接读进预分配的 bgra（GetBitmapBits(True) 每次都会新建一个 bytes 对象）"""
+        import ctypes
+        n = self.bgra.nbytes
+        got = ctypes.windll.gdi32.GetBitmapBits(self.bmp.GetHandle(), n, self.bgra.ctypes.data)
+        if got != n:
+            raise OSError(f"GetBitmapBits 只读到 {got}/{n} 字节")
+        return self.bgra
+
+    def release(self):
+        import win32gui
+        try:
+            win32gui.DeleteObject(self.bmp.GetHandle())
+            self.mem_dc.DeleteDC()
+            self.src_dc.DeleteDC()
+            win32gui.ReleaseDC(self.hwnd, self.hwnd_dc)
+        except Exception as e:
+            utils.dbg(f"[CAPTURE] 释放 gdi 资源失败: {e}")
+
+
+class GdiBackend(Win32WindowMixin, CaptureBackend):
+    """
+    快速路径：BitBlt 客户区到常驻的兼容位图，GetBitmapBits 读进预分配的 BGRA 缓冲区，
+    再 cvtColor 成一个新的 BGR 数组返回，不经过 PIL。每帧两次整帧拷贝（读出 + 转换），
+    返回的数组归调用方（Frame）独有，之后的截图不会覆盖它，Frame 上按需计算的灰度图 / 缩小图始终对应这一帧。
+    初始化时检查 pywin32 并试建一次桌面 DC，失败则抛出异常，由 get_backend 改用 pyautogui。
+    """
+    name = "gdi"
+    fallback = "pyautogui"
+
+    def __init__(self):
+        import win32gui, win32ui, win32con  # noqa: F401  缺少 pywin32 时在这里失败，而不是每次 grab
+        hdc = win32gui.GetDC(0)
+        try:
+            dc = win32ui.CreateDCFromHandle(hdc)
+            dc.CreateCompatibleDC().DeleteDC()
+        finally:
+            win32gui.ReleaseDC(0, hdc)
+        self._ctx = {}
+
+    def _ensure(self, hwnd, w, h):
+        ctx = self._ctx.get(hwnd)
+        if ctx is not None and ctx.size == (w, h):
+            return ctx
+        if ctx is not None:
+            ctx.release()
+        ctx = self._ctx[hwnd] = _GdiContext(hwnd, w, h)
+        utils.dbg(f"[CAPTURE] gdi 资源已分配: hwnd={hwnd} {w}x{h}")
+        return ctx
+
+    def grab(self, hwnd, rect):
+        import win32con
+        w, h = rect["width"], rect["height"]
+        if w <= 0 or h <= 0:
+            return None
+        ctx = self._ensure(hwnd, w, h)
+        ctx.mem_dc.BitBlt((0, 0), (w, h), ctx.src_dc, (0, 0), win32con.SRCCOPY)
+        return cv2.cvtColor(ctx.read_bits(), cv2.COLOR_BGRA2BGR)
+
+    def close(self):
+        for ctx in self._ctx.values():
+            ctx.release()
+        self._ctx.clear()
+
+
+class ReplayBackend(CaptureBackend):
+    """
+    回放后端：按文件名顺序从目录读取截图（如 logs/debug_*.png），无需 Windows / 游戏窗口。
+    每次 grab() 前进一帧；到末尾后 loop=True 从头开始，否则返回 None。
+    """
+    name = "replay"
+    HWND = 1
+
+    def __init__(self, source=None, pattern=None, loop=None, preload=None):
+        source = config.REPLAY_DIR if source is None else source
+        pattern = config.REPLAY_PATTERN if pattern is None else pattern
+        if not os.path.isabs(source):
+            source = os.path.join(utils.ROOT, source)
+        self.paths = sorted(glob.glob(os.path.join(source, pattern)))
+        self.loop = config.REPLAY_LOOP if loop is None else loop
+        self.index = -1
+        self._cache = {}
+        self._preload = config.REPLAY_PRELOAD if preload is None else preload
+        if not self.paths:
+            utils.log(f"[CAPTURE] 回放目录中没有匹配的图片: {os.path.join(source, pattern)}")
+        if self._preload:
+            for i in range(len(self.paths)):
+                self._read(i)
+
+    def _read(self, i):
+        """预加载时缓存全部帧，否则只缓存最近读过的一帧（get_client_rect 与 grab 共用）"""
+        img = self._cache.get(i)
+        if img is None:
+            img = cv2.imread(self.paths[i], cv2.IMREAD_COLOR)
+            if img is not None:
+                if not self._preload:
+                    self._cache.clear()
+                self._cache[i] = img
+        return img
+
+    @property
+    def current_path(self):
+        if 0 <= self.index < len(self.paths):
+            return self.paths[self.index]
+        return None
+
+    def find_window(self, title):
+        return self.HWND if self.paths else None
+
+    def _peek_index(self):
+        nxt = self.index + 1
+        if nxt >= len(self.paths):
+            return 0 if self.loop and self.paths else None
+        return nxt
+
+    def get_client_rect(self, hwnd):
+        i = self._peek_index()
+        if i is None:
+            return None
+        img = self._read(i)
+        if img is None:
+            return None
+        h, w = img.shape[:2]
+        return {"left": 0, "top": 0, "width": w, "height": h, "hwnd": hwnd}
+
+    def grab(self, hwnd, rect):
+        i = self._peek_index()
+        if i is None:
+            return None
+        self.index = i
+        return self._read(i)
+
+
+class ArchiveReplayBackend(ReplayBackend):
+    """
+    从 recorder 录制的档案回放：按录制顺序逐帧解码（关键帧 + 增量），还原到原始窗口尺寸，
+    检测用的像素坐标与录制时一致。paths 为虚拟帧名（档案目录/frame_<seq>），标签可用 Archive.labels()。
+    """
+    name = "archive"
+
+    def __init__(self, source=None, loop=None, preload=None):
+        import recorder
+        source = config.REPLAY_ARCHIVE if source is None else source
+        if not os.path.isabs(source):
+            source = os.path.join(utils.ROOT, source)
+        self.archive = recorder.Archive(source)
+        self.paths = [os.path.join(source, recorder.frame_name(row["seq"])) for row in self.archive.rows]
+        self.loop = config.REPLAY_LOOP if loop is None else loop
+        self.index = -1
+        self._cache = {}
+        self._preload = config.REPLAY_PRELOAD if preload is None else preload
+        if not self.paths:
+            utils.log(f"[CAPTURE] 录制档案中没有帧: {source}")
+        if self._preload:
+            for i in range(len(self.paths)):
+                self._read(i)
+
+    def _read(self, i):
+        img = self._cache.get(i)
+        if img is None:
+            img = self.archive.full_image(i)
+            if len(img.shape) == 2:
+                img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+            if not self._preload:
+                self._cache.clear()
+            self._cache[i] = img
+        return img
+
+    def close(self):
+        self.archive.close()
+
+
+BACKENDS = {
+    "pyautogui": PyAutoGuiBackend,
+    "gdi": GdiBackend,
+    "replay": ReplayBackend,
+    "archive": ArchiveReplayBackend,
+}
+
+_backend = None
+_failures = 0
+
+# 截图后端全局锁（utils.capture_window 使用）
+LOCK = threading.RLock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        name = config.CAPTURE_BACKEND
+        cls = BACKENDS.get(name)
+        if cls is None:
+            utils.log(f"[CAPTURE] 未知截图后端 {name}，改用 pyautogui")
+            cls = PyAutoGuiBackend
+        try:
+            _backend = cls()
+        except Exception as e:
+            utils.log(f"[CAPTURE] 初始化截图后端 {name} 失败: {e}，改用 pyautogui")
+            _backend = PyAutoGuiBackend()
+        utils.dbg(f"[CAPTURE] 使用截图后端: {_backend.name}")
+    return _backend
+
+
+def note_grab(backend, error=None):
+    """
+    记录一次截图结果（utils.capture_window 在 LOCK 内调用）：后端连续抛异常 CAPTURE_FALLBACK_FAILURES 次后
+    改用它的 fallback 后端（gdi -> pyautogui），避免 BitBlt 一直失败时每个 tick 都拿不到画面。
+    """
+    global _failures
+    if error is None:
+        _failures = 0
+        return
+    _failures += 1
+    if not backend.fallback or not config.CAPTURE_FALLBACK_FAILURES or _failures < config.CAPTURE_FALLBACK_FAILURES:
+        return
+    cls = BACKENDS.get(backend.fallback)
+    if cls is None or backend is not _backend:
+        return
+    utils.log(f"[CAPTURE] 截图后端 {backend.name} 连续失败 {_failures} 次（{error}），改用 {backend.fallback}")
+    _failures = 0
+    try:
+        set_backend(cls())
+    except Exception as e:
+        utils.log(f"[CAPTURE] 初始化截图后端 {backend.fallback} 失败: {e}")
+
+
+def set_backend(backend):
+    """替换当前截图后端（基准测试 / 回放用）"""
+    global _backend
+    if _backend is not None and _backend is not backend:
+        _backend.close()
+    _backend = backend
+    return backend
@@ -2,22 +2,209 @@
 GAME_TITLE = "《战舰世界》"      # 游戏窗口标题（和窗口标题完全匹配）
 TEMPLATE_DIR = "templates"       # 模板文件夹（相对 main.py）
 LOG_DIR = "logs"
+ATLAS = True                    # 启动时内存映射模板图集（源 PNG 变化时自动重建），False 则逐个解码 PNG
+ATLAS_PATH = "cache/templates.atlas"  # 图集文件（相对项目根目录）
+TEMPLATE_RELOAD_CHECK = 5.0     # 后台线程检查模板文件修改的间隔（秒），0 表示只在启动时加载
+
+# 截图后端："gdi"（BitBlt + 预分配缓冲区，最快）/ "pyautogui"（旧路径）/ "replay"（从目录回放截图，可在 Linux 上运行）
+#          / "archive"（从 recorder 录制档案回放）
+CAPTURE_BACKEND = "gdi"
+CAPTURE_FALLBACK_FAILURES = 5   # gdi 后端连续截图失败多少次后改用 pyautogui（0 不切换）
+REPLAY_DIR = "logs"             # replay 后端读取的目录（相对 main.py）
+REPLAY_PATTERN = "debug_*.png"
+REPLAY_LOOP = True              # 回放到末尾后是否从头开始
+REPLAY_PRELOAD = False          # 是否启动时解码全部回放图片
+REPLAY_ARCHIVE = "logs/rec"     # archive 后端读取的录制档案目录（recorder.py 录制的 logs/rec_<时间>）
 
 # 匹配与重试参数（可调）
 DEFAULT_THRESHOLD = 0.75        # 默认模板匹配阈值（可微调）
 MULTISCALE = True               # 是否启用多尺度尝试（0.9,1.0,1.1）
 SCALES = [0.9, 1.0, 1.1]
+PYRAMID = False                 # 多尺度时使用金字塔匹配（连续尺度范围）；只对较大模板更快，bench 确认持平前默认关闭
+SCALE_RANGE = (0.8, 1.25)       # 金字塔匹配的尺度范围
+PYRAMID_FACTOR = 0.25           # 粗扫时图像/模板的缩小系数
+PYRAMID_MIN_TPL = 12            # 粗层模板短边最少像素（太小会自动提高缩小系数）
+PYRAMID_MAX_FACTOR = 0.5        # 粗层缩小系数上限；模板小到需要更大系数时不建粗层，改为按 SCALES 逐尺度匹配
+PYRAMID_SCALE_STEP = 0.05       # 粗扫尺度步长，精修时再细分一半
+PYRAMID_CANDIDATES = 3          # 进入精修的候选个数
+
+# 并行匹配（cv2.matchTemplate 会释放 GIL）
+MATCH_WORKERS = 4               # 匹配线程池大小（不超过 CPU 核数），1 表示全部串行
+PARALLEL_DETECT = True          # 状态检测：最可能的状态不够确定时，其余检测器并行执行
+
+# 多实例匹配（占点等）
+MULTI_PEAK_MIN_DIST = 8         # 同一响应图中两个峰值的最小间距（像素）
+MULTI_MAX_PEAKS = 16            # 每个模板最多取多少个峰值
+NMS_OVERLAP = 0.5               # 两个命中框重叠（交集/较小框）超过该比例视为同一个目标
+MULTI_GRAY = True               # 颜色过滤后转灰度再匹配（约快 3 倍；语料帧上命中与 BGR 三通道匹配一致）
 
 CLICK_HOLD = 0.08               # 点击时按住时长（秒）
 CLICK_MOVE_DURATION = 0.08      # 移动鼠标到目标的时长（秒）
-CLICK_CONFIRM_DELAY = 1.2       # 点击后等待确认的时间（秒）
+CLICK_CONFIRM_DELAY = 1.2       # 找不到点击目标 / 点击失败时的重试间隔（秒）
+
+# 输入调度（inputs.py）：点击 / Shift 连点 / 按键排队，由专用输入线程按命令类型的时序执行
+INPUT_BACKEND = "pyautogui"     # 输入后端："pyautogui"（真实鼠标键盘）/ "mock"（只记录，可在 Linux 上测试）
+INPUT_ASYNC = True              # False 时命令在调用线程里直接执行
+INPUT_QUEUE_SIZE = 32           # 输入队列长度
+INPUT_SUBMIT_TIMEOUT = 1.0      # 队列满时提交最多等待（秒），超时丢弃该命令
+INPUT_WAIT_TIMEOUT = 10.0       # 等待一条命令执行完的最长时间（秒）
+INPUT_TIMING = {                # 各类命令的时序（秒）：move 移动时长 / hold 按住时长 / lead 按下 Shift 后等待 /
+                                # gap 连点间隔 / after 执行后的稳定时间（之后才执行下一条命令）
+    "click": {"move": CLICK_MOVE_DURATION, "hold": CLICK_HOLD, "after": 0.0},
+    "shift_clicks": {"move": CLICK_MOVE_DURATION, "hold": CLICK_HOLD, "lead": 0.15, "gap": 0.35, "after": 0.0},
+    "key": {"hold": 0.0, "after": 0.3},
+}
+MAP_OPEN_DELAY = 1.2            # 按 M 打开地图后等地图出现的时间（秒）
+NAV_CONFIRM_TIMEOUT = 1.0       # Shift 连点后等自动导航图标出现的最长时间（秒）
+
+# 点击确认（点击后轮询确认模板，命中立即返回）
+CONFIRM_POLL_MIN = 0.1          # 首次轮询间隔（秒）
+CONFIRM_POLL_MAX = 0.5          # 轮询间隔上限（秒）
+CONFIRM_POLL_BACKOFF = 1.5      # 每次未命中后间隔乘以该系数
+CONFIRM_TIMEOUT = 3.0           # 没有足够历史样本时的确认超时（秒）
+CONFIRM_TIMEOUT_MIN = 0.8       # 自适应超时下限（秒）
+CONFIRM_TIMEOUT_MAX = 6.0       # 自适应超时上限（秒）
+CONFIRM_TIMEOUT_PERCENTILE = 95 # 自适应超时取历史响应时间的分位数
+CONFIRM_TIMEOUT_FACTOR = 1.5    # 分位数乘以该系数作为超时
+CONFIRM_LEARN_MIN = 5           # 至少多少次成功确认后才自适应
+CONFIRM_HISTORY = 50            # 每个转换保留的最近响应时间样本数
 MAX_RETRY = 3                   # 点击确认最大重试次数
 
+# 缩小图匹配：模板 -> 匹配尺度（帧和模板同比缩小后匹配，坐标换算回原分辨率）
+MATCH_SCALE_ENABLED = True
+MATCH_SCALE = {
+    "port_join_battle.png": 0.5,
+    "port_join_battle_disabled.png": 0.5,
+    "back_to_port.png": 0.5,
+    "queue_waiting.png": 0.5,
+    "victory.png": 0.5,
+    "defeat.png": 0.5,
+}
+MATCH_SCALE_VERIFY_MARGIN = 0.08  # 缩小图置信度距阈值不超过该值时，在原分辨率下复核
+MATCH_SCALE_VERIFY_PAD = 4        # 复核窗口在命中框外扩的像素
+
+# 自动导航：占点跟踪
+NAV_MAP_RECT = (0.26, 0.07, 0.74, 0.88)  # 战术地图在客户区中的区域（比例 x0, y0, x1, y1），区域外的占点检测丢弃
+NAV_CLICK_OFFSET = (0, 0)       # 点击导航点时在客户区坐标上的额外偏移（像素）
+NAV_WAYPOINTS = 3               # 最多连续点击几个导航点
+CAPTRACK_THRESHOLD = 0.6        # 占点模板匹配阈值
+CAPTRACK_FRAMES = 3             # 每次导航至少观察几帧地图
+CAPTRACK_MAX_FRAMES = 6         # 还没有确认的占点时最多观察几帧
+CAPTRACK_INTERVAL = 0.15        # 观察帧之间的间隔（秒）
+CAPTRACK_RADIUS = 0.03          # 地图相对距离不超过该值的检测视为同一个占点
+CAPTRACK_DECAY = 0.6            # 某帧没看到的占点权重乘以该系数
+CAPTRACK_MIN_WEIGHT = 0.3       # 权重低于该值的占点删除
+CAPTRACK_MIN_HITS = 2           # 至少在几帧中出现才作为导航点
+
+# 战斗 HUD 监视（hud.py）：战斗中按 HUD_RATE 在固定小区域里批量读取异常状态 / 血量 / 主炮 / 被发现 / 技能
+HUD = True                      # 是否启用 HUD 监视
+HUD_RATE = 10                   # 读取频率（Hz）；异步截图时战斗中截图线程也提到该帧率
+HUD_THRESHOLD = 0.75            # HUD 模板匹配阈值
+HUD_ROIS = {                    # 各 HUD 模板的搜索区域（相对客户区的比例 x0, y0, x1, y1）
+    "hp_area.png": (0.00, 0.68, 0.22, 0.86),
+    "debuffs/debuff_fire.png": (0.00, 0.60, 0.30, 0.90),
+    "debuffs/debuff_flooding.png": (0.00, 0.60, 0.30, 0.90),
+    "debuffs/debuff_engine.png": (0.00, 0.60, 0.30, 0.90),
+    "debuffs/debuff_ping.png": (0.00, 0.60, 0.30, 0.90),
+    "main_gun_ready.png": (0.35, 0.80, 0.65, 1.00),
+    "main_gun_cooldown.png": (0.35, 0.80, 0.65, 1.00),
+    "skill_f_ready.png": (0.35, 0.80, 0.65, 1.00),
+    "detected_warning.png": (0.35, 0.55, 0.65, 0.85),
+}
+HUD_HP_BAR = (0.05, 0.70, 0.95, 0.90)  # 血条在 hp_area 命中框内的位置（比例 x0, y0, x1, y1）
+HUD_HP_MIN_SAT = 80             # 血条像素饱和度 >= 该值且亮度 >= HUD_HP_MIN_VAL 视为有血
+HUD_HP_MIN_VAL = 80
+HUD_AUTO_DAMAGE_CONTROL = False # 进水，或着火且血量低于 HUD_DC_HP 时自动使用损管（需先核对 HUD_ROIS；默认只发布状态记录）
+HUD_DAMAGE_CONTROL_KEY = "r"    # 损管按键
+HUD_DC_HP = 0.5
+HUD_DC_COOLDOWN = 90.0          # 两次自动损管的最短间隔（秒）
+
+# 模板搜索区域（ROI）：相对客户区的比例 (x0, y0, x1, y1)，未声明的模板做全屏搜索
+# 状态检测模板的 ROI 在 statespec.py 里声明，这里补充其他模板（同名时覆盖 statespec）
+ROI_TABLE = {
+    "port_join_battle_disabled.png": (0.30, 0.00, 0.70, 0.20),
+}
+ROI_FALLBACK_MISSES = 10        # ROI 内连续未命中多少次后做一次全屏搜索
+ROI_LEARN_MIN_HITS = 5          # 至少命中多少次才用历史位置收紧 ROI
+ROI_LEARN_MARGIN = 0.03         # 学习到的 ROI 外扩边距（相对客户区比例）
+ROI_HISTORY = 50                # 每个模板保留的历史命中数
+ROI_SAVE_INTERVAL = 60.0        # 学习结果写盘间隔（秒）
+
+CLASSIFIER_CONFIDENT = 0.9      # 状态检测器置信度达到该值即停止检测其余状态
+
+# 画面变化门控：画面未变时复用上次状态检测结果
+FRAME_GATE = True
+FRAME_GATE_SIZE = (32, 18)      # 缩略图尺寸（宽, 高），每块取均值
+FRAME_GATE_THRESHOLD = 6        # 任一块均值差超过该值（0-255）即视为画面变化
+FRAME_GATE_MAX_REUSE = 10       # 最多连续复用次数，之后强制重新检测
+
+FRAME_REUSE_MAX_AGE = 0.5       # actions 复用状态检测帧的最长时效（秒）
+
+# 异步截图流水线
+ASYNC_CAPTURE = True            # 后台线程持续截图，状态机用最新帧并由画面变化唤醒
+CAPTURE_FPS = 5                 # 后台截图帧率
+FRAME_RING_SIZE = 4             # 环形缓冲区保留的最新帧数
+PIPELINE_CHANGE_THRESHOLD = 6   # 缩略图块均值差超过该值视为画面变化（缩略图尺寸同 FRAME_GATE_SIZE）
+PIPELINE_MIN_INTERVAL = 0.2     # 画面变化唤醒时两次检测的最小间隔（秒）
+CAPTURE_WAIT_TIMEOUT = 1.0      # 等待后台截图线程下一帧的超时（秒）
+
 SCAN_INTERVAL = 1.0             # 主循环截图间隔（秒）
 STATE_CHECK_INTERVAL = 1.0      # 状态检测间隔（秒）
 
+# 自适应检测节奏（cadence.py）：按历史停留时长分布，转移不太可能时稀疏检测，接近预期转移时密集检测
+CADENCE = True                  # False 时固定为 spec delay + STATE_CHECK_INTERVAL
+CADENCE_MIN_INTERVAL = 0.5      # 检测间隔下限（秒）
+CADENCE_MAX_INTERVAL = 4.0      # 检测间隔上限（秒）；画面变化时仍会提前检测（见 Session.wakeable）
+CADENCE_TARGET_P = 0.02         # 一个检测间隔内发生状态转移的条件概率上限（越小越密集、反应越快）
+CADENCE_LEARN_MIN = 5           # 某状态至少有多少次完整停留后才自适应
+CADENCE_HISTORY = 100           # 每个状态保留的最近停留时长样本数
+CADENCE_REPORT_INTERVAL = 300.0 # 每隔多少秒输出一行节奏效果统计（省下的检测 / CPU、反应延迟），0 为不输出
+
+# 多开：一个进程驱动多个同名游戏窗口
+MULTI_CLIENT = False
+MAX_CLIENTS = 4                 # 最多同时驱动的窗口数
+WINDOW_RESCAN_INTERVAL = 10.0   # 重新枚举游戏窗口的间隔（秒）
+FOCUS_DELAY = 0.15              # 多开时切换前台窗口后等待的时间（秒）
+
 HOTKEY_TOGGLE = "f8"            # 启动/停止（切换）
 HOTKEY_FORCE_STOP = "f9"        # 强制停止脚本
 
 # 日志开关
 DEBUG = True
+
+# 日志（logs/run_<日期>.jsonl，每行一条 JSON 记录）
+LOG_QUEUE_SIZE = 10000          # 日志队列长度，满了丢弃新记录（不阻塞主循环）
+LOG_BATCH = 200                 # 攒够多少条写一次盘
+LOG_FLUSH_INTERVAL = 1.0        # 最长多少秒写一次盘
+LOG_MAX_BYTES = 20 * 1024 * 1024  # 单个日志文件上限，超过后轮转为 run_<日期>.<n>.jsonl
+LOG_DEBUG_EVERY = 20            # 热路径调试日志每个调用位置每 N 次只输出 1 次
+LOG_TICKS = True                # 每次状态检测写一条 tick 记录（状态、耗时、各模板置信度/耗时）
+
+# 调试截图（logs/snapshots/debug_<时间>_<序号>.<格式>，后台线程编码写盘）
+SNAPSHOTS = True                # 是否保存调试截图
+SNAPSHOT_DIR = "snapshots"      # 调试截图目录（相对 LOG_DIR）；清理只在该目录内进行，不会删到 logs/ 下的基准截图
+SNAPSHOT_FORMAT = "png"         # png / jpg / webp
+SNAPSHOT_QUALITY = 85           # jpg / webp 质量（0-100）
+SNAPSHOT_PNG_COMPRESSION = 6    # png 压缩级别（0-9）
+SNAPSHOT_QUEUE = 8              # 待写截图队列长度，满了丢弃
+SNAPSHOT_MAX_FILES = 200        # 最多保留多少张，超出删除最旧的（0 不限）
+SNAPSHOT_MAX_MB = 200           # 调试截图最多占用多少 MB（0 不限）
+SNAPSHOT_CROP_MARGIN = 16       # 只保存 ROI 时向外扩的像素
+
+# 会话录制（logs/rec_<时间>/，recorder.py）：截图帧 + 全部决策记录，可用 archive 截图后端回放
+RECORD = False                  # 是否录制
+RECORD_STEP = 1                 # 帧缩小倍数（2 = 长宽各缩小一半，档案约小 4 倍，但回放时检测结果与录制时不一致，不能做回归基准）
+RECORD_CROP = None              # 只录制该区域（相对客户区比例 x0, y0, x1, y1），None 为整帧
+RECORD_KEYFRAME_INTERVAL = 50   # 每个关键帧之后最多多少个增量帧
+RECORD_KEYFRAME_RATIO = 0.5     # 增量数据超过关键帧大小的该比例时改写关键帧
+RECORD_ZLIB_LEVEL = 1           # 增量帧 zlib 压缩级别
+RECORD_PNG_COMPRESSION = 3      # 关键帧 PNG 压缩级别（0-9）
+RECORD_QUEUE = 2000             # 待写队列长度（帧和事件共用），满了丢弃
+RECORD_FRAME_BACKLOG = 8        # 队列里最多积压多少帧（每帧是一份原始截图拷贝），超过丢弃新帧
+RECORD_MAX_MB = 500             # 帧数据上限（MB），超过后只记录事件（0 不限）
+
+# 运行指标（截图 / 匹配 / 动作耗时、tick 速率、状态停留时间、每小时战斗数）
+METRICS = True                  # 关闭后埋点几乎零开销
+METRICS_WINDOW = 512            # 每个耗时直方图保留的最近样本数
+METRICS_HTTP_PORT = 8765        # 本地指标接口 http://127.0.0.1:<端口>/metrics，0 为不启动
+METRICS_SUMMARY_INTERVAL = 60.0 # 每隔多少秒输出一行指标摘要日志，0 为不输出
@@ -0,0 +1,142 @@
+# confirm.py - 事件驱动的点击确认：点击后在 ROI 内短间隔轮询确认模板，命中立即返回；记录界面响应时间并自适应超时
+import os
+import json
+import time
+import threading
+from collections import deque
+import config
+import roi
+import metrics
+import utils
+import frame as framebus
+
+# 响应时间统计持久化文件（相对 LOG_DIR）
+RESPONSE_STATE_FILE = "response_times.json"
+
+
+def _percentile(sorted_vals, p):
+    k = (len(sorted_vals) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+
+class ResponseStats:
+    """
+    每个转换（如 PORT->QUEUE）一条记录：最近 CONFIRM_HISTORY 次点击到确认模板出现的耗时。
+    样本够 CONFIRM_LEARN_MIN 条后，超时 = 分位数 CONFIRM_TIMEOUT_PERCENTILE × CONFIRM_TIMEOUT_FACTOR，
+    限制在 [CONFIRM_TIMEOUT_MIN, CONFIRM_TIMEOUT_MAX]；样本不足时用 CONFIRM_TIMEOUT。
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._samples = {}
+        self._timeouts = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    # ------------------------
+    # 持久化
+    # ------------------------
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for key, vals in data.items():
+                self._samples[key] = deque(vals, maxlen=config.CONFIRM_HISTORY)
+            utils.dbg(f"[CONFIRM] 载入 {len(data)} 个转换的响应时间")
+        except Exception as e:
+            utils.dbg(f"[CONFIRM] 读取 {self.path} 失败: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = {key: list(vals) for key, vals in self._samples.items()}
+        try:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+        except Exception as e:
+            utils.dbg(f"[CONFIRM] 保存 {self.path} 失败: {e}")
+
+    # ------------------------
+    # 统计
+    # ------------------------
+    def record(self, key, elapsed):
+        with self._lock:
+            vals = self._samples.setdefault(key, deque(maxlen=config.CONFIRM_HISTORY))
+            vals.append(round(elapsed, 3))
+
+    def record_timeout(self, key):
+        """超时不记样本（真实响应时间未知），只计数"""
+        with self._lock:
+            self._timeouts[key] = self._timeouts.get(key, 0) + 1
+
+    def timeout(self, key):
+        with self._lock:
+            vals = sorted(self._samples.get(key, ()))
+        if len(vals) < config.CONFIRM_LEARN_MIN:
+            return config.CONFIRM_TIMEOUT
+        t = _percentile(vals, config.CONFIRM_TIMEOUT_PERCENTILE) * config.CONFIRM_TIMEOUT_FACTOR
+        return min(config.CONFIRM_TIMEOUT_MAX, max(config.CONFIRM_TIMEOUT_MIN, t))
+
+    def stats(self):
+        with self._lock:
+            keys = set(self._samples) | set(self._timeouts)
+            out = {}
+            for key in keys:
+                vals = sorted(self._samples.get(key, ()))
+                out[key] = {
+                    "n": len(vals),
+                    "p50": round(_percentile(vals, 50), 3) if vals else None,
+                    "max": vals[-1] if vals else None,
+                    "timeouts": self._timeouts.get(key, 0),
+                }
+        for key in out:
+            out[key]["timeout"] = round(self.timeout(key), 3)
+        return out
+
+
+STATS = ResponseStats(path=os.path.join(utils.LOG_DIR, RESPONSE_STATE_FILE))
+
+
+def match_any(f, templates, threshold=None):
+    """
+    在一帧上按 ROI 匹配模板列表（传入 Frame，按模板的匹配尺度走缩小图），返回第一个命中的 (模板名, 置信度)，
+    都没命中返回 (None, 最高置信度)。轮询中的未命中是预期的，不计入 ROI 命中统计。
+    """
+    if threshold is None:
+        threshold = config.DEFAULT_THRESHOLD
+    best = 0.0
+    for name in templates:
+        val, loc = roi.match_in_roi(f, name, threshold, record=False)
+        if loc is not None and val >= threshold:
+            return name, val
+        best = max(best, val)
+    return None, best
+
+
+def wait_for_any(hwnd, templates, timeout, threshold=None, since=None):
+    """
+    轮询等待任一确认模板出现：首个间隔 CONFIRM_POLL_MIN，每次乘 CONFIRM_POLL_BACKOFF，最多 CONFIRM_POLL_MAX。
+    异步截图时 framebus.capture 直接拿截图线程的下一帧，无需额外等待。
+    since 为点击时刻（默认现在），用于计算响应时间。
+    返回 (模板名, 置信度, 耗时秒)；超时返回 (None, 最高置信度, 耗时秒)。
+    """
+    start = time.time() if since is None else since
+    deadline = start + timeout
+    interval = config.CONFIRM_POLL_MIN
+    best = 0.0
+    while True:
+        metrics.sleep(max(0.0, min(interval, deadline - time.time())), "sleep.confirm")
+        f = framebus.capture(hwnd)
+        if f is not None:
+            name, val = match_any(f, templates, threshold)
+            if name is not None:
+                return name, val, max(0.0, f.ts - start)
+            best = max(best, val)
+        if time.time() >= deadline:
+            return None, best, time.time() - start
+        interval = min(config.CONFIRM_POLL_MAX, interval * config.CONFIRM_POLL_BACKOFF)
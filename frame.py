@@ -0,0 +1,147 @@
+# frame.py - 帧对象 + 帧总线：每个 tick 只截一次图，states / actions 共享同一帧
+import time
+import itertools
+import threading
+import cv2
+import config
+import metrics
+from utils import capture_window, dbg, color_masked
+
+_seq = itertools.count(1)
+
+
+class Frame:
+    """
+    一次截图：BGR 原图 + 按需计算并缓存的灰度 / HSV / 缩小图 / 颜色过滤图。
+    帧创建后视为只读，多个使用者可以放心共享。
+    """
+
+    def __init__(self, bgr, rect, hwnd=None, ts=None):
+        self.bgr = bgr
+        self.rect = rect
+        self.hwnd = hwnd
+        self.ts = time.time() if ts is None else ts
+        self.seq = next(_seq)
+        self.height, self.width = bgr.shape[:2]
+        self._gray = None
+        self._hsv = None
+        self._small = {}
+        self._masked = {}
+        self.changed = True            # 异步截图时由 pipeline 标记：与上一次变化帧相比画面是否变化
+
+    @property
+    def gray(self):
+        if self._gray is None:
+            with metrics.span("cvt.gray"):
+                self._gray = self.bgr if len(self.bgr.shape) == 2 else cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY)
+        return self._gray
+
+    @property
+    def hsv(self):
+        if self._hsv is None:
+            with metrics.span("cvt.hsv"):
+                self._hsv = cv2.cvtColor(self.bgr, cv2.COLOR_BGR2HSV)
+        return self._hsv
+
+    def small(self, scale):
+        """缩小后的灰度图，同一尺度每帧只缩放一次"""
+        key = round(float(scale), 3)
+        img = self._small.get(key)
+        if img is None:
+            if key == 1.0:
+                img = self.gray
+            else:
+                w = max(1, int(self.width * key))
+                h = max(1, int(self.height * key))
+                gray = self.gray
+                with metrics.span("cvt.resize"):
+                    img = cv2.resize(gray, (w, h), interpolation=cv2.INTER_AREA)
+            self._small[key] = img
+        return img
+
+    def masked(self, dominant):
+        """按主色类别（enemy / neutral）颜色过滤后的 BGR 图，每帧每类只算一次，供所有占点模板共享"""
+        img = self._masked.get(dominant)
+        if img is None:
+            with metrics.span("cvt.mask"):
+                bgr = self.bgr if len(self.bgr.shape) == 3 else cv2.cvtColor(self.bgr, cv2.COLOR_GRAY2BGR)
+                img = self._masked[dominant] = color_masked(bgr, dominant)
+        return img
+
+    def age(self):
+        return time.time() - self.ts
+
+    def __repr__(self):
+        return f"Frame(seq={self.seq}, hwnd={self.hwnd}, {self.width}x{self.height}, age={self.age():.2f}s)"
+
+
+# ------------------------
+# 帧总线：按窗口保存最新一帧
+# ------------------------
+_latest = {}
+_lock = threading.Lock()
+
+
+def publish(frame):
+    with _lock:
+        _latest[frame.hwnd] = frame
+    if _recorder is not None:
+        _recorder.frame(frame)
+
+
+def latest(hwnd, max_age=None):
+    """返回该窗口最新一帧；超过 max_age 秒视为过期返回 None"""
+    with _lock:
+        f = _latest.get(hwnd)
+    if f is None:
+        return None
+    if max_age is not None and f.age() > max_age:
+        return None
+    return f
+
+
+_sources = {}
+_recorder = None
+
+
+def set_recorder(rec):
+    """登记会话录制器（recorder.Recorder）：之后每个发布到总线的帧都交给它（只入队，不编码）"""
+    global _recorder
+    _recorder = rec
+
+
+def set_source(hwnd, source):
+    """
+    登记某窗口的后台截图源（pipeline.CaptureProducer）。登记后 capture() 不再自己截图，
+    而是等待截图源产出的下一帧，保证同一窗口只有一个线程在用截图后端。
+    """
+    with _lock:
+        if source is None:
+            _sources.pop(hwnd, None)
+        else:
+            _sources[hwnd] = source
+
+
+def capture(hwnd):
+    """截一帧并发布到总线；失败返回 None"""
+    with _lock:
+        source = _sources.get(hwnd)
+    if source is not None and source.is_alive():
+        return source.next_frame(timeout=config.CAPTURE_WAIT_TIMEOUT)
+    bgr, rect = capture_window(hwnd)
+    if bgr is None:
+        return None
+    f = Frame(bgr, rect, hwnd)
+    publish(f)
+    return f
+
+
+def get_fresh(hwnd, max_age=None):
+    """优先复用足够新的帧（默认 FRAME_REUSE_MAX_AGE 秒内），否则重新截图"""
+    if max_age is None:
+        max_age = config.FRAME_REUSE_MAX_AGE
+    f = latest(hwnd, max_age)
+    if f is not None:
+        dbg(f"[FRAME] 复用帧 seq={f.seq} (age={f.age():.2f}s)")
+        return f
+    return capture(hwnd)
@@ -0,0 +1,74 @@
+# framegate.py - 画面变化门控：画面基本没变时直接复用上一次的状态检测结果
+import cv2
+import numpy as np
+import config
+
+
+def thumbnail(img, size=None):
+    """缩小到 size（宽, 高），INTER_AREA 即块均值；转 int16 方便做差"""
+    if size is None:
+        size = config.FRAME_GATE_SIZE
+    return cv2.resize(img, tuple(size), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+
+def block_diff(a, b):
+    """两张缩略图的最大块均值差；尺寸不同视为完全不同"""
+    if a is None or b is None or a.shape != b.shape:
+        return 255
+    return int(np.abs(a - b).max())
+
+
+class FrameGate:
+    """
+    把截图缩小到 FRAME_GATE_SIZE（INTER_AREA 即块均值），与上一次“真正检测过”的缩略图比较：
+    所有块、所有通道的均值差都 <= FRAME_GATE_THRESHOLD 视为画面未变。
+    连续复用 FRAME_GATE_MAX_REUSE 次后强制重新检测一次，防止缓慢变化被一直吞掉。
+    """
+
+    def __init__(self, size=None, threshold=None, max_reuse=None):
+        self.size = tuple(config.FRAME_GATE_SIZE if size is None else size)
+        self.threshold = config.FRAME_GATE_THRESHOLD if threshold is None else threshold
+        self.max_reuse = config.FRAME_GATE_MAX_REUSE if max_reuse is None else max_reuse
+        self._ref = None
+        self._reuse = 0
+        self.state = None
+        self.info = None
+        self.checks = 0
+        self.hits = 0
+
+    def _thumb(self, img):
+        return thumbnail(img, self.size)
+
+    def unchanged(self, img):
+        """
+        判断画面是否与参考帧基本相同；相同且有缓存结果时返回 True（计为一次命中）。
+        返回 False 时参考帧已更新为当前画面，调用方应重新检测并调用 remember()。
+        """
+        self.checks += 1
+        thumb = self._thumb(img)
+        ref = self._ref
+        if (ref is not None and self.state is not None
+                and self._reuse < self.max_reuse
+                and block_diff(thumb, ref) <= self.threshold):
+            self._reuse += 1
+            self.hits += 1
+            return True
+        self._ref = thumb
+        self._reuse = 0
+        return False
+
+    def remember(self, state, info):
+        self.state = state
+        self.info = dict(info)
+
+    def reset(self):
+        self._ref = None
+        self.state = None
+        self.info = None
+        self._reuse = 0
+
+    def hit_rate(self):
+        return self.hits / self.checks if self.checks else 0.0
+
+    def stats(self):
+        return {"checks": self.checks, "hits": self.hits, "hit_rate": round(self.hit_rate(), 4)}
@@ -0,0 +1,255 @@
+# fsm.py - 表驱动状态机：把 statespec.STATES 编译成每个状态的检测计划，并按声明执行进入动作
+import time
+import config
+import roi
+import statespec
+import metrics
+import frame as framebus
+import parallel
+from parallel import pmap
+from utils import log, dbg, save_debug_overlay
+
+
+# ------------------------
+# 检测器
+# ------------------------
+class Detector:
+    """spec 里的一条检测项：在 ROI 内匹配模板，命中返回置信度，否则返回 None"""
+    __slots__ = ("template", "threshold", "report", "key", "min_xy")
+
+    def __init__(self, template, threshold, report=None, key=None, min_xy=None, roi=None):
+        self.template = template
+        self.threshold = threshold
+        self.report = threshold if report is None else report
+        self.key = key or template.rsplit(".", 1)[0]
+        self.min_xy = tuple(min_xy) if min_xy else None
+
+    def __call__(self, img, info):
+        """img 为灰度图或 frame.Frame（按模板的匹配尺度走缩小图）；ROI 命中统计按 threshold 记，report 只决定写不写 info"""
+        val, loc = roi.match_in_roi(img, self.template, self.threshold)
+        if loc is None:
+            return None
+        if val >= self.report:
+            info[self.key] = val
+        if val < self.threshold:
+            return None
+        if self.min_xy is not None and not (loc[0] > self.min_xy[0] and loc[1] > self.min_xy[1]):
+            return None
+        return val
+
+
+class StateDef:
+    def __init__(self, name, spec):
+        self.name = name
+        self.detectors = tuple(Detector(**d) for d in spec.get("detect", ()))
+        self.next = tuple(spec.get("next", ()))
+        self.actions = tuple(spec.get("actions", ()))
+        self.reset = tuple(spec.get("reset", ()))
+        self.delay = float(spec.get("delay", 0.0))
+        self.timeout = spec.get("timeout")
+        self.log = spec.get("log", name)
+        self.hud = bool(spec.get("hud", False))
+        self.overlaps = tuple(spec.get("overlaps", ()))
+
+    def detect(self, img):
+        """按顺序检测，任一命中即停；返回 (置信度或 None, info)"""
+        info = {}
+        with metrics.span("detect." + self.name):
+            for d in self.detectors:
+                v = d(img, info)
+                if v is not None:
+                    return v, info
+        return None, info
+
+
+# ------------------------
+# 动作（spec 里 actions[].do 的取值）：fn(sess, step) -> 是否成功
+# ------------------------
+def _act_click_confirm(sess, step):
+    import actions
+    return actions.click_with_confirm(step["click"], step["confirm"], max_retry=step.get("retries"),
+                                      hwnd=sess.hwnd, transition=step.get("transition"))
+
+
+def _act_auto_nav(sess, step):
+    import actions
+    return actions.ensure_auto_nav_enabled(hwnd=sess.hwnd, tracker=sess.tracker)
+
+
+def _act_wait(sess, step):
+    metrics.sleep(step.get("seconds", 1.0), "sleep.fsm")
+    return True
+
+
+def _act_snapshot(sess, step):
+    f = framebus.latest(sess.hwnd)
+    if f is not None:
+        save_debug_overlay(f, f.rect, [], crop=step.get("crop"))
+    return True
+
+
+ACTIONS = {
+    "click_confirm": _act_click_confirm,
+    "auto_nav": _act_auto_nav,
+    "wait": _act_wait,
+    "snapshot": _act_snapshot,
+}
+
+
+# ------------------------
+# 引擎
+# ------------------------
+class Engine:
+    """
+    编译：为每个“上一状态”预先算好两段检测计划
+    - primary: 上一状态 + 它的合法后继（每个 tick 只跑这些）
+    - fallback: 其余状态（primary 全部未命中才跑；primary 命中但不够确定时，只跑其中优先级更高的状态）
+    上一状态未知（None / UNKNOWN）时 primary 为全部状态，按 PRIORITY 排序。
+    """
+
+    def __init__(self, states=None, priority=None):
+        states = statespec.STATES if states is None else states
+        self.priority = list(statespec.PRIORITY if priority is None else priority)
+        self.states = {name: StateDef(name, spec) for name, spec in states.items()}
+        for name in self.states:
+            if name not in self.priority:
+                self.priority.append(name)
+        for sdef in self.states.values():
+            for n in sdef.next + sdef.reset + sdef.overlaps:
+                if n not in self.states:
+                    raise ValueError(f"状态 {sdef.name} 引用了未声明的状态 {n}")
+            for step in sdef.actions:
+                if step.get("do") not in ACTIONS:
+                    raise ValueError(f"状态 {sdef.name} 使用了未知动作 {step.get('do')}")
+        self.plans = {}
+        everything = tuple(self.states[s] for s in self.priority)
+        self.plans[None] = (everything, ())
+        for name, sdef in self.states.items():
+            primary = [sdef] + [self.states[n] for n in sdef.next if n != name]
+            fallback = tuple(s for s in everything if s not in primary)
+            self.plans[name] = (tuple(primary), fallback)
+        self._rank = {name: i for i, name in enumerate(self.priority)}
+
+    def plan(self, prev_state):
+        return self.plans.get(prev_state) or self.plans[None]
+
+    def wants_hud(self, state):
+        sdef = self.states.get(state)
+        return sdef is not None and sdef.hud
+
+    def allowed(self, prev_state, state):
+        sdef = self.states.get(prev_state)
+        return sdef is None or state == prev_state or state in sdef.next or state not in self.states
+
+    # ------------------------
+    # 检测
+    # ------------------------
+    def _run_stage(self, stage, img, info, fired, checked):
+        """
+        依次检测 stage 中的状态，置信度 >= CLASSIFIER_CONFIDENT 立即返回该状态。
+        PARALLEL_DETECT 时首个状态串行，不够确定再把其余并行跑完（结果按原顺序裁决）；
+        只有一个匹配线程（单核 / MATCH_WORKERS=1）时逐个检测，保留提前结束。
+        """
+        if not stage:
+            return None
+        results = None
+        if config.PARALLEL_DETECT and len(stage) > 1 and parallel.enabled():
+            results = [stage[0].detect(img)]
+            if results[0][0] is None or results[0][0] < config.CLASSIFIER_CONFIDENT:
+                results += pmap(lambda s: s.detect(img), stage[1:])
+        for i, sdef in enumerate(stage):
+            if results is not None:
+                if i >= len(results):
+                    break
+                v, part = results[i]
+            else:
+                v, part = sdef.detect(img)
+            checked.add(sdef.name)
+            info.update(part)
+            if v is None:
+                continue
+            fired[sdef.name] = v
+            if v >= config.CLASSIFIER_CONFIDENT:
+                dbg(f"[STATE] {sdef.name} 置信度 {v:.2f} 足够确定，提前结束检测", every=config.LOG_DEBUG_EVERY)
+                return sdef.name
+        return None
+
+    def classify(self, img, prev_state=None):
+        """
+        img 为灰度图或 frame.Frame；返回 (state, info)。多个状态命中且都不够确定时按 PRIORITY 裁决。
+        足够确定的状态如果声明了 overlaps（其模板在这些界面上也会命中），先检测其中优先级更高且还没测过的状态，
+        它们命中则按 PRIORITY 裁决（港口里 minimap_corner 置信度再高也是 PORT）。
+        """
+        primary, fallback = self.plan(prev_state)
+        info = {}
+        fired = {}
+        checked = set()
+        state = self._run_stage(primary, img, info, fired, checked)
+        if state is None and fired:
+            # 主阶段命中但不够确定：优先级更高的状态也要检测
+            best = min(self._rank[n] for n in fired)
+            fallback = tuple(s for s in fallback if self._rank[s.name] < best)
+        if state is None:
+            state = self._run_stage(fallback, img, info, fired, checked)
+        if state is not None:
+            rivals = tuple(self.states[n] for n in self.states[state].overlaps
+                           if n not in checked and self._rank[n] < self._rank[state])
+            if rivals:
+                self._run_stage(rivals, img, info, fired, checked)
+                state = min(fired, key=self._rank.get)
+            return state, info
+        if fired:
+            return min(fired, key=self._rank.get), info
+        return "UNKNOWN", info
+
+    # ------------------------
+    # 动作
+    # ------------------------
+    def pending_once(self, sess):
+        """当前状态是否还有未完成的 once 动作（例如战斗中导航尚未成功）"""
+        sdef = self.states.get(sess.last_state)
+        if sdef is None:
+            return False
+        return any(step.get("once") and (sdef.name, i) not in sess.done
+                   for i, step in enumerate(sdef.actions))
+
+    def handle(self, sess, state, info):
+        """执行 state 声明的动作，返回处理后额外等待的秒数"""
+        sdef = self.states.get(state)
+        if sdef is None:
+            dbg(f"{sess.tag}[MAIN] 未识别状态，继续检测")
+            return 0.0
+
+        for name in sdef.reset:
+            sess.reset_state(name)
+
+        todo = [(i, step) for i, step in enumerate(sdef.actions)
+                if not (step.get("once") and (state, i) in sess.done)]
+        if sdef.actions and not todo:
+            dbg(f"{sess.tag}[MAIN] {state} 动作已完成，无需重复操作")
+        else:
+            log(f"{sess.tag}[MAIN] {sdef.log}")
+        for i, step in todo:
+            with metrics.span("fsm." + step["do"]):
+                ok = ACTIONS[step["do"]](sess, step)
+            if ok and step.get("once"):
+                sess.done.add((state, i))
+                dbg(f"{sess.tag}[MAIN] {state} 动作 {step['do']} 完成，后续不再重复执行")
+
+        self._check_timeout(sess, sdef)
+        return sdef.delay
+
+    def _check_timeout(self, sess, sdef):
+        if not sdef.timeout or sess.timeout_for == sess.state_since:
+            return
+        dwell = time.time() - sess.state_since
+        if dwell < sdef.timeout:
+            return
+        sess.timeout_for = sess.state_since
+        log(f"{sess.tag}[FSM] 在 {sdef.name} 停留 {dwell:.0f}s 超过 {sdef.timeout:.0f}s，保存截图并重新检测")
+        metrics.count("fsm.timeout." + sdef.name)
+        _act_snapshot(sess, {})
+        sess.ctx.gate.reset()
+
+
+ENGINE = Engine()
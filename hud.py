@@ -0,0 +1,164 @@
+# hud.py - 战斗 HUD 监视：高频（>= HUD_RATE Hz）批量检测异常状态 / 血量 / 主炮 / 被发现 / 技能，发布紧凑状态记录
+import time
+import threading
+from collections import namedtuple
+import cv2
+import numpy as np
+import config
+import registry
+import metrics
+import frame as framebus
+import inputs
+from utils import log, dbg, match_gray_scaled
+
+# hp: 血量比例 0~1（未找到血条时为 None）；其余为布尔值
+HudStatus = namedtuple("HudStatus", [
+    "ts", "seq", "fire", "flood", "engine", "ping",
+    "gun_ready", "gun_cooldown", "detected", "skill_ready", "hp",
+])
+
+EMPTY = HudStatus(0.0, 0, False, False, False, False, False, False, False, False, None)
+
+# 状态字段 -> 模板
+FLAGS = {
+    "fire": "debuffs/debuff_fire.png",
+    "flood": "debuffs/debuff_flooding.png",
+    "engine": "debuffs/debuff_engine.png",
+    "ping": "debuffs/debuff_ping.png",
+    "gun_ready": "main_gun_ready.png",
+    "gun_cooldown": "main_gun_cooldown.png",
+    "detected": "detected_warning.png",
+    "skill_ready": "skill_f_ready.png",
+}
+HP_TEMPLATE = "hp_area.png"
+
+
+def _px(rel, width, height):
+    return (int(rel[0] * width), int(rel[1] * height), int(np.ceil(rel[2] * width)), int(np.ceil(rel[3] * height)))
+
+
+def hp_fraction(f, loc, entry):
+    """
+    在 hp_area 命中框里取血条带（HUD_HP_BAR，相对命中框的比例），
+    统计饱和度 / 亮度都高于阈值的列占比作为血量比例。
+    """
+    bx0, by0, bx1, by1 = config.HUD_HP_BAR
+    x0 = loc[0] + int(bx0 * entry.w)
+    x1 = loc[0] + int(bx1 * entry.w)
+    y0 = loc[1] + int(by0 * entry.h)
+    y1 = max(y0 + 1, loc[1] + int(by1 * entry.h))
+    strip = f.bgr[y0:y1, x0:x1]
+    if strip.size == 0:
+        return None
+    hsv = cv2.cvtColor(strip, cv2.COLOR_BGR2HSV)
+    filled = (hsv[..., 1] >= config.HUD_HP_MIN_SAT) & (hsv[..., 2] >= config.HUD_HP_MIN_VAL)
+    cols = filled.mean(axis=0) >= 0.5
+    return round(float(cols.mean()), 3)
+
+
+@metrics.timed("hud.read")
+def read_hud(f):
+    """
+    一帧一次批量读取：所有 HUD 模板都在 config.HUD_ROIS 声明的小区域里匹配，共用这一帧缓存的灰度图，
+    不做任何全帧匹配。返回 HudStatus。
+    """
+    width, height = f.width, f.height
+    values = {}
+    for key, name in FLAGS.items():
+        entry = registry.get(name)
+        rel = config.HUD_ROIS.get(name)
+        if entry is None or rel is None:
+            values[key] = False
+            continue
+        val, loc = match_gray_scaled(f, entry, config.HUD_THRESHOLD, _px(rel, width, height))
+        values[key] = loc is not None and val >= config.HUD_THRESHOLD
+    hp = None
+    entry = registry.get(HP_TEMPLATE)
+    rel = config.HUD_ROIS.get(HP_TEMPLATE)
+    if entry is not None and rel is not None:
+        val, loc = match_gray_scaled(f, entry, config.HUD_THRESHOLD, _px(rel, width, height))
+        if loc is not None and val >= config.HUD_THRESHOLD:
+            hp = hp_fraction(f, loc, entry)
+    return HudStatus(ts=f.ts, seq=f.seq, hp=hp, **values)
+
+
+class HudMonitor(threading.Thread):
+    """
+    单个窗口的 HUD 监视线程：active 为 True（会话处于 BATTLE）时按 HUD_RATE 读取 HUD。
+    异步截图时直接等截图线程的下一帧，新帧到达后同一帧内完成读取和反应；否则自己截图。
+    status 为最新状态记录；状态变化时调用 listeners。HUD_AUTO_DAMAGE_CONTROL 开启时还执行内置反应（损管）。
+    """
+
+    def __init__(self, hwnd, tag="", producer=None):
+        super().__init__(name=f"hud-{hwnd}", daemon=True)
+        self.hwnd = hwnd
+        self.tag = tag
+        self.producer = producer
+        self.status = EMPTY
+        self.active = False
+        self.listeners = []
+        self.reads = 0
+        self._last_dc = 0.0
+        self._halt = threading.Event()
+        self._wake = threading.Event()
+
+    def set_active(self, active):
+        """进入 / 离开战斗时调用；异步截图时同时把截图线程帧率提到 HUD_RATE / 恢复 CAPTURE_FPS"""
+        if active == self.active:
+            return
+        if active:
+            self.status = EMPTY
+        self.active = active
+        if self.producer is not None:
+            self.producer.set_fps(max(config.CAPTURE_FPS, config.HUD_RATE) if active else config.CAPTURE_FPS)
+        self._wake.set()
+
+    def run(self):
+        period = 1.0 / config.HUD_RATE
+        while not self._halt.is_set():
+            if not self.active:
+                self._wake.wait(0.5)
+                self._wake.clear()
+                continue
+            t0 = time.time()
+            if self.producer is not None:
+                # 截图线程已按 HUD_RATE 出帧：新帧一到就读，不再额外等待
+                f = self.producer.next_frame(after_seq=self.status.seq, timeout=period * 2)
+            else:
+                f = framebus.capture(self.hwnd)
+            if f is not None and f.seq != self.status.seq:
+                try:
+                    self._update(read_hud(f))
+                except Exception as e:
+                    dbg(f"{self.tag}[HUD] 读取失败: {e}", every=config.LOG_DEBUG_EVERY)
+            if self.producer is None:
+                self._halt.wait(max(0.0, period - (time.time() - t0)))
+
+    def _update(self, st):
+        prev = self.status
+        self.status = st
+        self.reads += 1
+        metrics.mark("hud")
+        changed = [k for k in FLAGS if getattr(st, k) != getattr(prev, k)]
+        if changed:
+            dbg(f"{self.tag}[HUD] " + ", ".join(f"{k}={getattr(st, k)}" for k in changed) + f" | hp={st.hp}")
+            for fn in self.listeners:
+                fn(st, prev)
+        self._react(st, prev)
+
+    def _react(self, st, prev):
+        """内置反应：进水，或着火且血量低于 HUD_DC_HP 时使用损管（冷却 HUD_DC_COOLDOWN 秒）"""
+        if not config.HUD_AUTO_DAMAGE_CONTROL:
+            return
+        need = st.flood or (st.fire and st.hp is not None and st.hp < config.HUD_DC_HP)
+        if not need or time.time() - self._last_dc < config.HUD_DC_COOLDOWN:
+            return
+        self._last_dc = time.time()
+        log(f"{self.tag}[HUD] 着火={st.fire} 进水={st.flood} 血量={st.hp} -> 使用损管")
+        metrics.count("hud.damage_control")
+        inputs.key(config.HUD_DAMAGE_CONTROL_KEY, self.hwnd)  # 不等执行完，下一帧照常读取
+
+    def stop(self):
+        self._halt.set()
+        self._wake.set()
+        self.join(timeout=1.0)
@@ -0,0 +1,403 @@
+# inputs.py - 输入调度：点击 / Shift 连点 / 按键作为带类型的命令排队，由一个专用线程按命令类型的时序执行
+#
+# 调用方提交命令后立即拿到 Command，可以 wait() 等它执行完（或等到执行后的稳定时间结束），
+# 也可以不等（例如关闭地图、HUD 自动损管），检测在输入执行期间照常进行。
+# 时序（移动时长、按住时长、连点间隔、执行后的稳定时间）按命令类型在 config.INPUT_TIMING 里配置。
+#
+# 输入后端：pyautogui（真实鼠标 + keyboard 按键）/ mock（只记录事件，可选虚拟时钟，可在 Linux 上测试和基准）
+import time
+import queue
+import threading
+import config
+import metrics
+import logger
+from arbiter import ARBITER
+from utils import log, dbg
+
+
+# ------------------------
+# 输入后端
+# ------------------------
+class InputBackend:
+    """
+    输入后端接口：
+    - move(x, y, duration)   -> 把光标移动到屏幕坐标
+    - mouse_down() / mouse_up()
+    - key_down(key) / key_up(key)
+    - press(key)             -> 按一下键
+    - sleep(seconds) / now() -> 时序用的时钟（mock 后端可以是虚拟时钟）
+    """
+    name = "base"
+
+    def move(self, x, y, duration):
+        raise NotImplementedError
+
+    def mouse_down(self):
+        raise NotImplementedError
+
+    def mouse_up(self):
+        raise NotImplementedError
+
+    def key_down(self, key):
+        raise NotImplementedError
+
+    def key_up(self, key):
+        raise NotImplementedError
+
+    def press(self, key):
+        self.key_down(key)
+        self.key_up(key)
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def now(self):
+        return time.time()
+
+
+class PyAutoGuiBackend(InputBackend):
+    """真实输入：鼠标用 pyautogui，按键用 keyboard（与原来的 keyboard.send 一致）"""
+    name = "pyautogui"
+
+    def __init__(self):
+        import pyautogui
+        import keyboard
+        self._gui = pyautogui
+        self._kb = keyboard
+
+    def move(self, x, y, duration):
+        self._gui.moveTo(x, y, duration=duration)
+
+    def mouse_down(self):
+        self._gui.mouseDown()
+
+    def mouse_up(self):
+        self._gui.mouseUp()
+
+    def key_down(self, key):
+        self._gui.keyDown(key)
+
+    def key_up(self, key):
+        self._gui.keyUp(key)
+
+    def press(self, key):
+        self._kb.send(key)
+
+
+class MockBackend(InputBackend):
+    """
+    只记录不操作：events 为 (时间, 操作, 参数) 列表。
+    realtime=False 时 sleep 只推进虚拟时钟、移动时长也计入虚拟时钟，动作时序可以瞬间跑完并精确断言。
+    """
+    name = "mock"
+
+    def __init__(self, realtime=False):
+        self.realtime = realtime
+        self.events = []
+        self.clock = 0.0
+        self._lock = threading.Lock()
+
+    def _record(self, op, *args):
+        with self._lock:
+            self.events.append((self.now(), op, args))
+
+    def move(self, x, y, duration):
+        self.sleep(duration)
+        self._record("move", x, y)
+
+    def mouse_down(self):
+        self._record("mouse_down")
+
+    def mouse_up(self):
+        self._record("mouse_up")
+
+    def key_down(self, key):
+        self._record("key_down", key)
+
+    def key_up(self, key):
+        self._record("key_up", key)
+
+    def press(self, key):
+        self._record("press", key)
+
+    def sleep(self, seconds):
+        if seconds <= 0:
+            return
+        if self.realtime:
+            time.sleep(seconds)
+        else:
+            with self._lock:
+                self.clock += seconds
+
+    def now(self):
+        return time.time() if self.realtime else self.clock
+
+    def clear(self):
+        with self._lock:
+            self.events = []
+            self.clock = 0.0
+
+
+BACKENDS = {
+    "pyautogui": PyAutoGuiBackend,
+    "mock": MockBackend,
+}
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        name = config.INPUT_BACKEND
+        cls = BACKENDS.get(name)
+        if cls is None:
+            log(f"[INPUT] 未知输入后端 {name}，改用 pyautogui")
+            cls = PyAutoGuiBackend
+        _backend = cls()
+        dbg(f"[INPUT] 使用输入后端: {_backend.name}")
+    return _backend
+
+
+def set_backend(backend):
+    """替换当前输入后端（基准测试 / mock 用）"""
+    global _backend
+    _backend = backend
+    return backend
+
+
+# ------------------------
+# 命令
+# ------------------------
+class Command:
+    """
+    一条输入命令。done：输入已执行完；settled：执行后的稳定时间（after）也已过去。
+    ok 为执行结果；queued / started / finished 为提交、开始、结束时间（time.time）。
+    """
+    kind = "base"
+
+    def __init__(self, hwnd=None, after=None):
+        self.hwnd = hwnd
+        self.after = after
+        self.ok = None
+        self.queued = time.time()
+        self.started = None
+        self.finished = None
+        self.done = threading.Event()
+        self.settled = threading.Event()
+
+    def timing(self, key, default=0.0):
+        return config.INPUT_TIMING.get(self.kind, {}).get(key, default)
+
+    @property
+    def settle(self):
+        return self.timing("after") if self.after is None else self.after
+
+    def execute(self, backend):
+        raise NotImplementedError
+
+    def wait(self, timeout=None, settled=False):
+        """等命令执行完（settled=True 时再等稳定时间），返回是否成功；超时返回 False"""
+        ev = self.settled if settled else self.done
+        if not ev.wait(timeout):
+            return False
+        return bool(self.ok)
+
+    def __repr__(self):
+        return f"{type(self).__name__}(hwnd={self.hwnd})"
+
+
+class Click(Command):
+    """在屏幕坐标 (x, y) 单击"""
+    kind = "click"
+
+    def __init__(self, x, y, hold=None, hwnd=None, after=None):
+        super().__init__(hwnd, after)
+        self.x, self.y = int(x), int(y)
+        self.hold = hold
+
+    def execute(self, backend):
+        backend.move(self.x, self.y, self.timing("move"))
+        backend.mouse_down()
+        backend.sleep(self.timing("hold") if self.hold is None else self.hold)
+        backend.mouse_up()
+        return True
+
+    def __repr__(self):
+        return f"Click({self.x}, {self.y})"
+
+
+class ShiftClicks(Command):
+    """按住 Shift 依次单击多个屏幕坐标（导航路径点），整段不会被其他命令插入"""
+    kind = "shift_clicks"
+
+    def __init__(self, points, hwnd=None, after=None):
+        super().__init__(hwnd, after)
+        self.points = [(int(x), int(y)) for x, y in points]
+
+    def execute(self, backend):
+        backend.key_down("shift")
+        try:
+            backend.sleep(self.timing("lead"))
+            for i, (x, y) in enumerate(self.points):
+                if i:
+                    backend.sleep(self.timing("gap"))  # 避免点击过快漏点
+                backend.move(x, y, self.timing("move"))
+                backend.mouse_down()
+                backend.sleep(self.timing("hold"))
+                backend.mouse_up()
+        finally:
+            backend.key_up("shift")
+        return True
+
+    def __repr__(self):
+        return f"ShiftClicks({self.points})"
+
+
+class KeyPress(Command):
+    kind = "key"
+
+    def __init__(self, key, hwnd=None, after=None):
+        super().__init__(hwnd, after)
+        self.key = key
+
+    def execute(self, backend):
+        hold = self.timing("hold")
+        if hold > 0:
+            backend.key_down(self.key)
+            backend.sleep(hold)
+            backend.key_up(self.key)
+        else:
+            backend.press(self.key)
+        return True
+
+    def __repr__(self):
+        return f"KeyPress({self.key!r})"
+
+
+# ------------------------
+# 调度线程
+# ------------------------
+class InputScheduler(threading.Thread):
+    """
+    单个输入线程按提交顺序执行命令：每条命令在 ARBITER.input(hwnd) 内执行（多开时切前台窗口），
+    执行完置 done，再等该命令的稳定时间后置 settled，然后才执行下一条。
+    注意：调用方等待命令时不要持有 ARBITER 锁，否则输入线程拿不到锁。
+    """
+
+    def __init__(self, backend=None):
+        super().__init__(name="input", daemon=True)
+        self.backend = backend
+        self.queue = queue.Queue(maxsize=config.INPUT_QUEUE_SIZE)
+        self.executed = 0
+        self.failed = 0
+        self._halt = threading.Event()
+
+    def submit(self, cmd):
+        try:
+            self.queue.put(cmd, timeout=config.INPUT_SUBMIT_TIMEOUT)
+        except queue.Full:
+            log(f"[INPUT] 输入队列已满，丢弃 {cmd}")
+            cmd.ok = False
+            cmd.done.set()
+            cmd.settled.set()
+        return cmd
+
+    def run(self):
+        while not self._halt.is_set():
+            try:
+                cmd = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if cmd is None:
+                break
+            self.execute(cmd)
+
+    def execute(self, cmd):
+        if run_command(cmd, self.backend):
+            self.executed += 1
+        else:
+            self.failed += 1
+
+    def stop(self):
+        """排在已提交命令之后放入结束标记，队列满放不进时直接停止"""
+        try:
+            self.queue.put(None, timeout=config.INPUT_SUBMIT_TIMEOUT)
+        except queue.Full:
+            self._halt.set()
+        self.join(timeout=2.0)
+
+    def stats(self):
+        return {"executed": self.executed, "failed": self.failed, "pending": self.queue.qsize()}
+
+
+def run_command(cmd, backend=None):
+    """在当前线程执行一条命令（输入线程 / INPUT_ASYNC=False 时的调用线程），返回是否成功"""
+    backend = backend or get_backend()
+    cmd.started = time.time()
+    metrics.observe("input.queue_wait", (cmd.started - cmd.queued) * 1000.0)
+    try:
+        with ARBITER.input(cmd.hwnd), metrics.span("input." + cmd.kind):
+            cmd.ok = cmd.execute(backend)
+        dbg(f"[INPUT] {cmd} 完成，排队 {(cmd.started - cmd.queued) * 1000:.0f}ms")
+    except Exception as e:
+        cmd.ok = False
+        log(f"[ERROR] 输入命令 {cmd} 执行失败: {e}")
+    finally:
+        cmd.finished = time.time()
+        cmd.done.set()
+    logger.emit("input", cmd=repr(cmd), type=cmd.kind, hwnd=cmd.hwnd, ok=cmd.ok,
+                queue_ms=round((cmd.started - cmd.queued) * 1000.0, 2),
+                ms=round((cmd.finished - cmd.started) * 1000.0, 2))
+    backend.sleep(cmd.settle)
+    cmd.settled.set()
+    return cmd.ok
+
+
+_scheduler = None
+_sched_lock = threading.Lock()
+
+
+def get_scheduler():
+    """输入线程（首次提交命令时启动）；INPUT_ASYNC=False 时返回 None，命令在调用线程里直接执行"""
+    global _scheduler
+    if not config.INPUT_ASYNC:
+        return None
+    with _sched_lock:
+        if _scheduler is None or not _scheduler.is_alive():
+            _scheduler = InputScheduler()
+            _scheduler.start()
+        return _scheduler
+
+
+def submit(cmd):
+    """提交命令并立即返回；需要结果时调用 cmd.wait()"""
+    sched = get_scheduler()
+    if sched is None:
+        run_command(cmd)
+        return cmd
+    return sched.submit(cmd)
+
+
+def click(x, y, hwnd=None, hold=None, after=None):
+    return submit(Click(x, y, hold=hold, hwnd=hwnd, after=after))
+
+
+def shift_clicks(points, hwnd=None, after=None):
+    return submit(ShiftClicks(points, hwnd=hwnd, after=after))
+
+
+def key(k, hwnd=None, after=None):
+    return submit(KeyPress(k, hwnd=hwnd, after=after))
+
+
+def shutdown():
+    """执行完已排队的命令后停止输入线程"""
+    global _scheduler
+    with _sched_lock:
+        sched, _scheduler = _scheduler, None
+    if sched is not None and sched.is_alive():
+        sched.stop()
+        dbg(f"[INPUT] 输入线程统计: {sched.stats()}")
+
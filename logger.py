@@ -0,0 +1,251 @@
+# logger.py - 异步结构化日志：记录（JSON Lines）先进队列，后台线程批量写盘，按日期 / 大小轮转
+#
+# 每行一条 JSON 记录，公共字段：
+#   ts    时间戳（秒，float）
+#   kind  log / debug / tick / ...
+# log/debug 记录带 msg；tick 记录带 tick、session、state、frame（所用帧 seq）、ms、gated、scores{模板: 置信度}、tpl_ms{模板: 耗时}
+# input 记录带 cmd、type、hwnd、ok、queue_ms、ms
+# 分析工具（bench.py logstats）用 read_records() 读取。
+import os
+import json
+import time
+import glob
+import queue
+import atexit
+import threading
+import contextvars
+from datetime import datetime
+import config
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+LOG_DIR = os.path.join(ROOT, config.LOG_DIR)
+
+
+# ------------------------
+# 后台写盘线程
+# ------------------------
+class LogWriter(threading.Thread):
+    """
+    记录先放进有界队列（LOG_QUEUE_SIZE），满了直接丢弃并计数，热路径永远不等磁盘。
+    后台线程攒够 LOG_BATCH 条或每 LOG_FLUSH_INTERVAL 秒写一次；
+    文件名 <prefix>_<日期>.jsonl，跨日换新文件，超过 LOG_MAX_BYTES 时把当前文件改名为 <prefix>_<日期>.<n>.jsonl。
+    """
+
+    def __init__(self, log_dir=None, prefix="run", max_bytes=None, flush_interval=None, batch=None, queue_size=None):
+        super().__init__(name="log-writer", daemon=True)
+        self.log_dir = LOG_DIR if log_dir is None else log_dir
+        self.prefix = prefix
+        self.max_bytes = config.LOG_MAX_BYTES if max_bytes is None else max_bytes
+        self.flush_interval = config.LOG_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.batch = config.LOG_BATCH if batch is None else batch
+        self.q = queue.Queue(maxsize=config.LOG_QUEUE_SIZE if queue_size is None else queue_size)
+        self.dropped = 0
+        self.written = 0
+        self._fp = None
+        self._date = None
+        self._halt = threading.Event()
+        os.makedirs(self.log_dir, exist_ok=True)
+
+    def put(self, rec):
+        try:
+            self.q.put_nowait(rec)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def path_for(self, date):
+        return os.path.join(self.log_dir, f"{self.prefix}_{date}.jsonl")
+
+    def _open(self):
+        date = str(datetime.now().date())
+        if self._fp is not None and date == self._date and self._fp.tell() < self.max_bytes:
+            return self._fp
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+        path = self.path_for(date)
+        if os.path.exists(path) and os.path.getsize(path) >= self.max_bytes:
+            n = 1
+            while os.path.exists(os.path.join(self.log_dir, f"{self.prefix}_{date}.{n}.jsonl")):
+                n += 1
+            os.replace(path, os.path.join(self.log_dir, f"{self.prefix}_{date}.{n}.jsonl"))
+        self._fp = open(path, "a", encoding="utf-8")
+        self._date = date
+        return self._fp
+
+    def _write(self, recs):
+        if self.dropped:
+            recs.append({"ts": time.time(), "kind": "log", "msg": f"[LOG] 日志队列已满，丢弃 {self.dropped} 条"})
+            self.dropped = 0
+        try:
+            fp = self._open()
+            fp.write("".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in recs))
+            fp.flush()
+            self.written += len(recs)
+        except Exception as e:
+            print(f"[LOG] 写日志失败: {e}")
+
+    def run(self):
+        pending = []
+        last_flush = time.time()
+        while True:
+            timeout = max(0.0, self.flush_interval - (time.time() - last_flush))
+            try:
+                pending.append(self.q.get(timeout=timeout))
+                # 把队列里已有的一次取完，减少唤醒次数
+                while len(pending) < self.batch:
+                    pending.append(self.q.get_nowait())
+            except queue.Empty:
+                pass
+            stopping = self._halt.is_set()
+            if pending and (len(pending) >= self.batch or stopping
+                            or time.time() - last_flush >= self.flush_interval):
+                self._write(pending)
+                pending = []
+                last_flush = time.time()
+            elif not pending:
+                last_flush = time.time()
+            if stopping and self.q.empty() and not pending:
+                break
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def close(self, timeout=2.0):
+        self._halt.set()
+        self.join(timeout)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                w = LogWriter()
+                w.start()
+                _writer = w
+    return _writer
+
+
+_taps = []
+
+
+def tap(fn):
+    """登记一个记录监听者（如 recorder），每条 emit 的记录都会同步传给它；fn 必须不阻塞"""
+    if fn not in _taps:
+        _taps.append(fn)
+
+
+def untap(fn):
+    if fn in _taps:
+        _taps.remove(fn)
+
+
+def emit(kind, **fields):
+    """写一条结构化记录（不阻塞）"""
+    rec = {"ts": round(time.time(), 3), "kind": kind}
+    rec.update(fields)
+    for fn in _taps:
+        fn(rec)
+    return get_writer().put(rec)
+
+
+@atexit.register
+def shutdown():
+    """退出前把队列里剩余的记录写完"""
+    global _writer
+    w = _writer
+    if w is not None:
+        w.close()
+        _writer = None
+
+
+# ------------------------
+# 每次检测（tick）的记录：ContextVar 保存当前 tick，匹配函数往里追加置信度和耗时
+# ------------------------
+_current = contextvars.ContextVar("log_tick", default=None)
+
+
+class Tick:
+    def __init__(self, **fields):
+        self.fields = fields
+        self.scores = {}
+        self.tpl_ms = {}
+        self.t0 = time.perf_counter()
+
+
+class TickScope:
+    """
+    with logger.tick(tick=n, session=i) as t:
+        state, info = detect(...)
+        t.fields["state"] = state
+    退出时写一条 kind=tick 记录。LOG_TICKS 关闭时什么都不记。
+    pmap 会把 contextvars 带到线程池，并行匹配同样记到这个 tick 上。
+    """
+
+    def __init__(self, **fields):
+        self.rec = Tick(**fields) if config.LOG_TICKS else None
+        self._token = None
+
+    def __enter__(self):
+        if self.rec is not None:
+            self._token = _current.set(self.rec)
+        return self.rec if self.rec is not None else Tick()
+
+    def __exit__(self, exc_type, exc, tb):
+        rec = self.rec
+        if rec is None:
+            return False
+        _current.reset(self._token)
+        emit("tick", ms=round((time.perf_counter() - rec.t0) * 1000.0, 3),
+             scores=rec.scores, tpl_ms=rec.tpl_ms, **rec.fields)
+        return False
+
+
+def tick(**fields):
+    return TickScope(**fields)
+
+
+def note_match(name, score, ms):
+    """记录一次模板匹配（没有进行中的 tick 时直接返回）"""
+    rec = _current.get()
+    if rec is None:
+        return
+    rec.scores[name] = round(float(score), 4)
+    rec.tpl_ms[name] = round(ms, 3)
+
+
+def note(**fields):
+    """给当前 tick 追加字段"""
+    rec = _current.get()
+    if rec is not None:
+        rec.fields.update(fields)
+
+
+# ------------------------
+# 读取（分析工具用）
+# ------------------------
+def log_files(log_dir=None, prefix="run"):
+    """按时间顺序返回所有 JSON Lines 日志文件（含轮转出的分卷）"""
+    return sorted(glob.glob(os.path.join(LOG_DIR if log_dir is None else log_dir, f"{prefix}_*.jsonl")),
+                  key=os.path.getmtime)
+
+
+def read_records(paths, kind=None):
+    """逐条读取记录；kind 不为空时只返回该类型。损坏的行跳过"""
+    if isinstance(paths, str):
+        paths = [paths]
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue
+                if kind is None or rec.get("kind") == kind:
+                    yield rec
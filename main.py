@@ -1,20 +1,33 @@
 # main.py - 程序入口：状态机 + 热键启动/停止（固定模板名）
-import time, keyboard, config
-from utils import log, dbg, ensure_templates_exist, find_game_window
-from states import detect_state_once
-import actions
+import time, config
+from utils import log, dbg, ensure_templates_exist
+import registry
+import roi
+import confirm
+import metrics
+import snapshots
+import inputs
+import recorder
+import cadence
+from session import Scheduler
 from typing import Optional, Dict
 
 def main():
     log("WoWsBot 启动 - 固定模板版本")
     ensure_templates_exist()
+    registry.preload()  # ✅ 启动时一次性解码全部模板
+    metrics.serve()  # ✅ 本地指标接口（METRICS_HTTP_PORT）
+    recorder.start()  # ✅ RECORD 开启时录制截图帧和决策记录
     running = False
-    last_state = None
-    nav_done = False  # ✅ 用于记忆是否已经完成自动导航
+    scheduler = Scheduler()  # ✅ 每个游戏窗口一个会话（last_state / 已完成动作等都在会话里）
 
     log(f"按 {config.HOTKEY_TOGGLE} 切换启动/停止，按 {config.HOTKEY_FORCE_STOP} 强制退出")
+    if scheduler.multi:
+        log(f"[MAIN] 多开模式：最多同时驱动 {config.MAX_CLIENTS} 个游戏窗口")
+
+    # 注册热键（keyboard 等输入库只在真正需要时导入，不拖慢启动）
+    import keyboard
 
-    # 注册热键
     def toggle():
         nonlocal running
         running = not running
@@ -29,59 +42,15 @@ def main():
 
     try:
         while True:
-            hwnd = find_game_window()
-            if hwnd is None:
-                log("未找到游戏窗口，等待中...")
-                time.sleep(2)
-                continue
-
             if not running:
+                scheduler.pause()  # ✅ 暂停时停止后台截图
                 time.sleep(0.3)
                 continue
+            scheduler.resume()
 
-            state, info = detect_state_once()
-            if state != last_state:
-                log(f"State change: {last_state} -> {state} | info={info}")
-                last_state = state
-
-            # === 状态处理 ===
-            if state == "PORT":
-                log("[MAIN] 在港口 - 尝试点击加入战斗")
-                nav_done = False  # ✅ 每次回到港口重置
-                actions.click_with_confirm(
-                    ["port_join_battle.png", "port_join_battle_disabled.png"],
-                    ["queue_waiting.png", "battle_score_bar.png"],
-                    max_retry=3
-                )
-
-            elif state == "QUEUE":
-                log("[MAIN] 匹配中 - 等待进入战斗")
-                time.sleep(2)
-
-            elif state == "BATTLE":
-                if not nav_done:  # ✅ 仅第一次执行导航逻辑
-                    log("[MAIN] 战斗中 - 确保自动导航")
-                    success = actions.ensure_auto_nav_enabled()
-                    if success:
-                        nav_done = True  # ✅ 记住导航已完成
-                        dbg("[MAIN] 自动导航完成，后续不再重复执行")
-                else:
-                    dbg("[MAIN] 自动导航已完成，无需重复操作")
-                time.sleep(2)
-
-            elif state == "RESULT":
-                log("[MAIN] 结算界面 - 点击返回港口按钮")
-                nav_done = False  # ✅ 战斗结束重置
-                actions.click_with_confirm(
-                    ["back_to_port.png"],
-                    ["port_join_battle.png"],
-                    max_retry=3
-                )
-
-            else:
-                dbg("[MAIN] 未识别状态，继续检测")
-
-            time.sleep(config.STATE_CHECK_INTERVAL)
+            # === 检测所有到期的窗口并处理状态 ===
+            wait = scheduler.step()
+            scheduler.wait(max(0.05, wait))  # ✅ 异步截图时画面变化会提前唤醒
 
     except KeyboardInterrupt:
         log("收到 Ctrl+C，退出")
@@ -89,6 +58,16 @@ def main():
         log("强制退出")
     except Exception as e:
         log(f"[FATAL] 未处理异常: {e}")
+    finally:
+        scheduler.close()  # ✅ 停止后台截图线程
+        inputs.shutdown()  # ✅ 执行完已排队的输入后停止输入线程
+        recorder.shutdown()  # ✅ 写完录制队列
+        metrics.shutdown()
+        snapshots.shutdown()  # ✅ 写完队列里的调试截图
+        roi.TABLE.save()  # ✅ 保存学习到的模板搜索区域
+        confirm.STATS.save()  # ✅ 保存点击确认的响应时间统计
+        cadence.STATS.save()  # ✅ 保存各状态的停留时长统计
+        log(cadence.SAVINGS.summary_line())
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,289 @@
+# metrics.py - 热路径耗时统计：span 耗时直方图、计数器、事件速率、状态停留时间；本地 HTTP 文本接口 + 定期摘要日志
+#
+# 用法：
+#   with metrics.span("capture"): ...
+#   @metrics.timed("find_template_in_window")
+#   metrics.count("click")  /  metrics.mark("battle")  /  metrics.dwell("PORT", 12.3)
+# config.METRICS 关闭时 span() 返回共享的空对象，timed() 直接调用原函数，开销只有一次属性判断。
+import json
+import time
+import threading
+import functools
+from collections import deque
+import config
+
+
+def _percentile(sorted_vals, p):
+    if not sorted_vals:
+        return 0.0
+    k = (len(sorted_vals) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+
+class Histogram:
+    """滚动直方图：最近 METRICS_WINDOW 个样本算分位数，count / total 为累计值"""
+
+    def __init__(self, window=None):
+        self.samples = deque(maxlen=config.METRICS_WINDOW if window is None else window)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, v):
+        self.samples.append(v)
+        self.count += 1
+        self.total += v
+
+    def snapshot(self):
+        vals = sorted(self.samples)
+        return {
+            "count": self.count,
+            "total": round(self.total, 3),
+            "p50": round(_percentile(vals, 50), 3),
+            "p90": round(_percentile(vals, 90), 3),
+            "p99": round(_percentile(vals, 99), 3),
+            "max": round(vals[-1], 3) if vals else 0.0,
+        }
+
+
+class Metrics:
+    """
+    - spans: 名称 -> 耗时直方图（毫秒）
+    - counters: 名称 -> 累计次数
+    - events: 名称 -> 最近 1 小时的发生时间，用于 ticks/秒、战斗/小时
+    - dwell: 状态 -> 停留时间直方图（秒）
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.spans = {}
+        self.counters = {}
+        self.events = {}
+        self.dwell = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, ms):
+        with self._lock:
+            h = self.spans.get(name)
+            if h is None:
+                h = self.spans[name] = Histogram()
+            h.observe(ms)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def mark(self, name):
+        now = time.time()
+        with self._lock:
+            q = self.events.get(name)
+            if q is None:
+                q = self.events[name] = deque()
+            q.append(now)
+            while q and now - q[0] > 3600.0:
+                q.popleft()
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def rate(self, name, window):
+        """最近 window 秒内每秒发生次数（运行时间不足 window 时按实际运行时间算）"""
+        now = time.time()
+        span = max(1e-6, min(window, now - self.started))
+        with self._lock:
+            q = self.events.get(name, ())
+            n = sum(1 for t in q if now - t <= window)
+        return n / span
+
+    def observe_dwell(self, state, seconds):
+        with self._lock:
+            h = self.dwell.get(state)
+            if h is None:
+                h = self.dwell[state] = Histogram()
+            h.observe(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            spans = {k: h.snapshot() for k, h in self.spans.items()}
+            dwell = {k: h.snapshot() for k, h in self.dwell.items()}
+            counters = dict(self.counters)
+        return {
+            "uptime_s": round(time.time() - self.started, 1),
+            "ticks_per_s": round(self.rate("tick", 60.0), 3),
+            "battles_per_hour": round(self.rate("battle", 3600.0) * 3600.0, 2),
+            "counters": counters,
+            "spans_ms": spans,
+            "dwell_s": dwell,
+        }
+
+    def render_text(self):
+        """纯文本格式（每行 名称{标签} 值），方便 curl / 监控脚本抓取"""
+        snap = self.snapshot()
+        lines = [
+            f"wowsbot_uptime_seconds {snap['uptime_s']}",
+            f"wowsbot_ticks_per_second {snap['ticks_per_s']}",
+            f"wowsbot_battles_per_hour {snap['battles_per_hour']}",
+        ]
+        for name, v in sorted(snap["counters"].items()):
+            lines.append(f'wowsbot_count{{name="{name}"}} {v}')
+        for name, s in sorted(snap["spans_ms"].items()):
+            for key in ("count", "p50", "p90", "p99", "max"):
+                lines.append(f'wowsbot_span_ms{{name="{name}",stat="{key}"}} {s[key]}')
+        for state, s in sorted(snap["dwell_s"].items()):
+            for key in ("count", "p50", "p90", "max"):
+                lines.append(f'wowsbot_dwell_seconds{{state="{state}",stat="{key}"}} {s[key]}')
+        return "\n".join(lines) + "\n"
+
+    def summary_line(self):
+        snap = self.snapshot()
+        top = sorted(snap["spans_ms"].items(), key=lambda kv: kv[1]["total"], reverse=True)[:5]
+        spans = ", ".join(f"{k} p50={s['p50']:.1f}ms p99={s['p99']:.1f}ms" for k, s in top)
+        return (f"[METRICS] {snap['ticks_per_s']:.2f} tick/s | 战斗 {snap['battles_per_hour']:.1f}/h | "
+                f"最耗时: {spans}")
+
+
+METRICS = Metrics()
+
+
+# ------------------------
+# 埋点接口
+# ------------------------
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        METRICS.observe(self.name, (time.perf_counter() - self.t0) * 1000.0)
+        return False
+
+
+def span(name):
+    if not config.METRICS:
+        return _NOOP
+    return _Span(name)
+
+
+def timed(name):
+    """函数耗时装饰器"""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not config.METRICS:
+                return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                METRICS.observe(name, (time.perf_counter() - t0) * 1000.0)
+        return wrapper
+    return deco
+
+
+def observe(name, ms):
+    if config.METRICS:
+        METRICS.observe(name, ms)
+
+
+def count(name, n=1):
+    if config.METRICS:
+        METRICS.count(name, n)
+
+
+def mark(name):
+    if config.METRICS:
+        METRICS.mark(name)
+
+
+def dwell(state, seconds):
+    if config.METRICS:
+        METRICS.observe_dwell(state, seconds)
+
+
+def sleep(seconds, name="sleep"):
+    """time.sleep 并把等待时间记到 span（动作里的固定等待也能看到占了多少时间）"""
+    with span(name):
+        time.sleep(seconds)
+
+
+# ------------------------
+# 输出：HTTP 文本接口 + 定期摘要日志
+# ------------------------
+_server = None
+_last_summary = time.time()
+
+
+def serve(port=None):
+    """在 127.0.0.1:port 提供 /metrics（文本）和 /metrics.json；port 为 0 时不启动"""
+    global _server
+    port = config.METRICS_HTTP_PORT if port is None else port
+    if not config.METRICS or not port or _server is not None:
+        return None
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith("/metrics.json"):
+                body = json.dumps(METRICS.snapshot(), ensure_ascii=False).encode("utf-8")
+                ctype = "application/json; charset=utf-8"
+            elif self.path.startswith("/metrics"):
+                body = METRICS.render_text().encode("utf-8")
+                ctype = "text/plain; charset=utf-8"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    try:
+        _server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    except OSError as e:
+        import utils
+        utils.log(f"[METRICS] 无法监听端口 {port}: {e}")
+        return None
+    threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    import utils
+    utils.log(f"[METRICS] 指标接口: http://127.0.0.1:{port}/metrics")
+    return _server
+
+
+def shutdown():
+    global _server
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
+
+
+def maybe_summary():
+    """距上次摘要超过 METRICS_SUMMARY_INTERVAL 秒时输出一行摘要日志"""
+    global _last_summary
+    if not config.METRICS or not config.METRICS_SUMMARY_INTERVAL:
+        return
+    now = time.time()
+    if now - _last_summary < config.METRICS_SUMMARY_INTERVAL:
+        return
+    _last_summary = now
+    import utils
+    utils.log(METRICS.summary_line())
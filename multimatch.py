@@ -0,0 +1,126 @@
+# multimatch.py - 多实例模板匹配：每张响应图取出所有超过阈值的峰值，跨模板做 NMS 合并
+from collections import namedtuple
+import cv2
+import numpy as np
+import config
+import registry
+import metrics
+from utils import dbg, color_masked
+from parallel import pmap
+
+# name: 命中的模板名；cls: 类别（模板的 family：enemy / neutral ...）；center: 中心坐标；box: (x0, y0, x1, y1)
+Detection = namedtuple("Detection", ["name", "cls", "score", "center", "box"])
+
+
+def find_peaks(res, threshold, min_dist=None, max_peaks=None):
+    """
+    从一张 matchTemplate 响应图中取出所有局部极大值（邻域半径 min_dist）且 >= threshold 的点。
+    返回 [(score, (x, y)), ...]，按置信度从高到低。
+    """
+    if min_dist is None:
+        min_dist = config.MULTI_PEAK_MIN_DIST
+    if max_peaks is None:
+        max_peaks = config.MULTI_MAX_PEAKS
+    if res.size == 0 or float(res.max()) < threshold:
+        return []
+    k = 2 * max(1, int(min_dist)) + 1
+    dil = cv2.dilate(res, np.ones((k, k), dtype=np.uint8))
+    ys, xs = np.where((res >= threshold) & (res >= dil))
+    if len(xs) == 0:
+        return []
+    scores = res[ys, xs]
+    order = np.argsort(-scores)[:max_peaks]
+    return [(float(scores[i]), (int(xs[i]), int(ys[i]))) for i in order]
+
+
+def _overlap(a, b):
+    """交集面积 / 较小框面积：大模板和小模板框住同一个点时也能互相抑制"""
+    ix = min(a[2], b[2]) - max(a[0], b[0])
+    iy = min(a[3], b[3]) - max(a[1], b[1])
+    if ix <= 0 or iy <= 0:
+        return 0.0
+    inter = ix * iy
+    smaller = min((a[2] - a[0]) * (a[3] - a[1]), (b[2] - b[0]) * (b[3] - b[1]))
+    return inter / smaller if smaller > 0 else 0.0
+
+
+def nms(detections, overlap=None):
+    """贪心非极大值抑制：按置信度保留，与已保留框重叠超过 overlap 的丢弃"""
+    if overlap is None:
+        overlap = config.NMS_OVERLAP
+    kept = []
+    for d in sorted(detections, key=lambda d: d.score, reverse=True):
+        if all(_overlap(d.box, k.box) <= overlap for k in kept):
+            kept.append(d)
+    return kept
+
+
+@metrics.timed("match_all")
+def match_all(img, template_names, threshold=None, rect=None):
+    """
+    一次调用匹配一组模板，返回 NMS 之后的全部命中 [Detection, ...]（按置信度排序，坐标为整帧坐标）。
+    - img: BGR 图或 frame.Frame
+    - rect: 只在该像素矩形 (x0, y0, x1, y1) 内匹配（占点只在战术地图里，顶部 UI 栏的误检不用算出来再丢）
+    - 颜色过滤模板按 family 分组：每组在裁剪区上只做一次颜色过滤（MULTI_GRAY 时再转一次灰度），组内模板共用
+    - 普通模板用灰度图
+    """
+    if threshold is None:
+        threshold = config.DEFAULT_THRESHOLD
+    frame = img if hasattr(img, "gray") else None
+    bgr = frame.bgr if frame is not None else img
+    h, w = bgr.shape[:2]
+    x0, y0, x1, y1 = (0, 0, w, h) if rect is None else rect
+    x0, y0, x1, y1 = max(0, int(x0)), max(0, int(y0)), min(w, int(x1)), min(h, int(y1))
+    gray = None
+    if len(bgr.shape) == 2:
+        gray = bgr[y0:y1, x0:x1]
+        bgr = cv2.cvtColor(bgr, cv2.COLOR_GRAY2BGR)
+    crop = bgr[y0:y1, x0:x1]
+    masked = {}
+
+    # ① 准备每个模板的输入图（颜色过滤图 / 灰度图在这里串行算好，并行阶段只读）
+    jobs = []
+    for name in template_names:
+        entry = registry.get(name)
+        if entry is None:
+            continue
+        if entry.color_filter:
+            fam = entry.family or entry.dominant
+            if fam == "friendly":
+                continue
+            src = masked.get(fam)
+            if src is None:
+                src = color_masked(crop, fam)
+                if config.MULTI_GRAY:
+                    src = cv2.cvtColor(src, cv2.COLOR_BGR2GRAY)
+                masked[fam] = src
+            tpl = entry.gray if config.MULTI_GRAY else entry.bgr
+        else:
+            fam = None
+            if gray is None:
+                gray = frame.gray[y0:y1, x0:x1] if frame is not None else cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+            src = gray
+            tpl = entry.gray
+        if tpl.shape[0] > src.shape[0] or tpl.shape[1] > src.shape[1]:
+            continue
+        jobs.append((entry, fam, src, tpl))
+
+    # ② 各模板的匹配 + 取峰值并行执行，结果按模板顺序汇总
+    def _match(job):
+        entry, fam, src, tpl = job
+        res = cv2.matchTemplate(src, tpl, cv2.TM_CCOEFF_NORMED)
+        min_dist = max(config.MULTI_PEAK_MIN_DIST, min(entry.w, entry.h) // 2)
+        return [
+            Detection(entry.name, fam or entry.dominant, score,
+                      (x0 + x + entry.w // 2, y0 + y + entry.h // 2),
+                      (x0 + x, y0 + y, x0 + x + entry.w, y0 + y + entry.h))
+            for score, (x, y) in find_peaks(res, threshold, min_dist=min_dist)
+        ]
+
+    detections = []
+    for found in pmap(_match, jobs):
+        detections.extend(found)
+
+    kept = nms(detections)
+    dbg(f"[MULTI] {len(template_names)} 个模板共 {len(detections)} 个峰值，NMS 后保留 {len(kept)} 个")
+    return kept
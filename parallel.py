@@ -0,0 +1,63 @@
+# parallel.py - 并行匹配执行器：cv2.matchTemplate 会释放 GIL，用有界线程池把多个模板/ROI 匹配分摊到多核
+import os
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+import config
+
+
+class MatchExecutor:
+    """
+    有界线程池（大小 config.MATCH_WORKERS，不超过 CPU 核数）。
+    map() 按输入顺序返回结果，和串行执行完全一致；
+    workers <= 1（含单核机器：线程池只会增加调度开销）或只有一个任务时直接在当前线程执行。
+    """
+
+    def __init__(self, workers=None):
+        self._workers = workers
+        self._pool = None
+        self._pool_size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def workers(self):
+        n = config.MATCH_WORKERS if self._workers is None else self._workers
+        return max(1, min(n, os.cpu_count() or 1))
+
+    def _get_pool(self):
+        n = self.workers
+        with self._lock:
+            if self._pool is None or self._pool_size != n:
+                if self._pool is not None:
+                    self._pool.shutdown(wait=False)
+                self._pool = ThreadPoolExecutor(max_workers=n, thread_name_prefix="match")
+                self._pool_size = n
+            return self._pool
+
+    def map(self, fn, items):
+        items = list(items)
+        if self.workers <= 1 or len(items) <= 1 or threading.current_thread().name.startswith("match"):
+            return [fn(x) for x in items]
+        pool = self._get_pool()
+        # 每个任务带上调用方的 contextvars（logger 的当前 tick 等），和串行执行时看到的一样
+        futures = [pool.submit(contextvars.copy_context().run, fn, x) for x in items]
+        return [f.result() for f in futures]
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
+
+
+EXECUTOR = MatchExecutor()
+
+
+def enabled():
+    """是否真的会并行执行（线程数 > 1）"""
+    return EXECUTOR.workers > 1
+
+
+def pmap(fn, items):
+    """并行执行 fn(item)，结果顺序与 items 一致"""
+    return EXECUTOR.map(fn, items)
@@ -0,0 +1,168 @@
+# pipeline.py - 异步截图流水线：后台线程按固定帧率截图进环形缓冲区，画面变化时唤醒状态机
+import time
+import threading
+from collections import deque
+import config
+import frame as framebus
+from framegate import thumbnail, block_diff
+from utils import log, dbg, capture_window
+
+# 所有截图源共用的“有画面变化”通知；调度器在它上面等待，而不是固定 sleep
+_changed = threading.Condition()
+_change_seq = 0
+
+
+def change_seq():
+    return _change_seq
+
+
+def _notify_change():
+    global _change_seq
+    with _changed:
+        _change_seq += 1
+        _changed.notify_all()
+
+
+def wait_for_change(since_seq, timeout):
+    """等到任一窗口出现画面变化（序号超过 since_seq）或超时；返回当前变化序号"""
+    deadline = time.time() + max(0.0, timeout)
+    with _changed:
+        while _change_seq <= since_seq:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            _changed.wait(remaining)
+        return _change_seq
+
+
+class CaptureProducer(threading.Thread):
+    """
+    单个窗口的后台截图线程：
+    - 按 CAPTURE_FPS 截图，最新 FRAME_RING_SIZE 帧放在环形缓冲区，并发布到帧总线
+    - 与上一次“有变化”的缩略图相比块均值差超过 PIPELINE_CHANGE_THRESHOLD 时记一次变化并唤醒等待者
+    - 登记为帧总线的截图源后，frame.capture() 会等它的下一帧，不会并发使用截图后端
+    - pause() 后停止截图（热键暂停时），resume() 恢复
+    """
+
+    def __init__(self, hwnd, fps=None, ring_size=None):
+        super().__init__(name=f"capture-{hwnd}", daemon=True)
+        self.hwnd = hwnd
+        self.period = 1.0 / (config.CAPTURE_FPS if fps is None else fps)
+        self.ring = deque(maxlen=config.FRAME_RING_SIZE if ring_size is None else ring_size)
+        self.changes = 0
+        self.captured = 0
+        self.failed = 0
+        self._ref = None
+        self._cond = threading.Condition()
+        self._halt = threading.Event()
+        self._active = threading.Event()
+        self._active.set()
+
+    def set_fps(self, fps):
+        """调整截图帧率（如战斗中 HUD 监视需要更高帧率），下一帧起生效"""
+        self.period = 1.0 / fps
+
+    # ------------------------
+    # 生产
+    # ------------------------
+    def run(self):
+        dbg(f"[PIPE] 截图线程启动 hwnd={self.hwnd} ({1.0 / self.period:.1f} fps)")
+        next_t = time.time()
+        while not self._halt.is_set():
+            if not self._active.is_set():
+                self._active.wait(0.5)
+                next_t = time.time()  # 恢复后从当前时间重新计帧
+                continue
+            self._grab_once()
+            next_t += self.period
+            delay = next_t - time.time()
+            if delay < 0:
+                next_t = time.time()  # 截图跟不上帧率时不累积欠账
+                delay = 0
+            self._halt.wait(delay)
+        dbg(f"[PIPE] 截图线程退出 hwnd={self.hwnd}")
+
+    def _grab_once(self):
+        bgr, rect = capture_window(self.hwnd)
+        if bgr is None:
+            self.failed += 1
+            return None
+        f = framebus.Frame(bgr, rect, self.hwnd)
+        thumb = thumbnail(bgr)
+        changed = block_diff(thumb, self._ref) > config.PIPELINE_CHANGE_THRESHOLD
+        if changed:
+            self._ref = thumb
+            self.changes += 1
+        f.changed = changed
+        with self._cond:
+            self.ring.append(f)
+            self.captured += 1
+            self._cond.notify_all()
+        framebus.publish(f)
+        if changed:
+            _notify_change()
+        return f
+
+    # ------------------------
+    # 消费
+    # ------------------------
+    def latest(self):
+        with self._cond:
+            return self.ring[-1] if self.ring else None
+
+    def frames(self):
+        """环形缓冲区快照（旧 -> 新）"""
+        with self._cond:
+            return list(self.ring)
+
+    def next_frame(self, after_seq=None, timeout=None):
+        """等待一帧序号大于 after_seq 的新帧（默认：比调用时最新帧更新），超时返回 None"""
+        if timeout is None:
+            timeout = config.CAPTURE_WAIT_TIMEOUT
+        deadline = time.time() + timeout
+        with self._cond:
+            if after_seq is None:
+                after_seq = self.ring[-1].seq if self.ring else 0
+            while not (self.ring and self.ring[-1].seq > after_seq):
+                remaining = deadline - time.time()
+                if remaining <= 0 or self._halt.is_set() or not self._active.is_set():
+                    return None
+                self._cond.wait(remaining)
+            return self.ring[-1]
+
+    def pause(self):
+        """暂停截图，正在等新帧的调用方立即返回 None"""
+        self._active.clear()
+        with self._cond:
+            self._cond.notify_all()
+
+    def resume(self):
+        self._active.set()
+
+    @property
+    def paused(self):
+        return not self._active.is_set()
+
+    def stop(self):
+        self._halt.set()
+        self._active.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def stats(self):
+        return {"captured": self.captured, "changes": self.changes, "failed": self.failed}
+
+
+def start(hwnd):
+    """为窗口启动截图线程并登记为帧总线的截图源"""
+    producer = CaptureProducer(hwnd)
+    producer.start()
+    framebus.set_source(hwnd, producer)
+    return producer
+
+
+def stop(producer):
+    framebus.set_source(producer.hwnd, None)
+    producer.stop()
+    producer.join(timeout=1.0)
+    log(f"[PIPE] hwnd={producer.hwnd} 截图统计: {producer.stats()}")
@@ -0,0 +1,324 @@
+# recorder.py - 会话录制：截图帧（缩小 / 裁剪后关键帧 + 增量编码）和每条决策记录写入紧凑档案，
+#               可按帧 / tick 随机定位，并作为回放截图源（capture.ArchiveReplayBackend）做回归测试
+#
+# 档案目录 logs/rec_<日期_时间>/：
+#   frames.bin    帧数据依次追加：关键帧为 PNG；增量帧为与所属关键帧逐字节异或后的 zlib 数据
+#                 （画面没变的区域异或后全为 0，压缩后很小）
+#   index.jsonl   每帧一行：{seq, ts, hwnd, type: "key" / "delta", off, len, key（所属关键帧的行号）,
+#                            shape（存储的数组形状）, full（原始宽高）, crop（裁剪左上角）, step（缩小倍数）, rect}
+#   events.jsonl  logger 的全部结构化记录：tick（状态、各模板置信度，frame 为检测所用帧的 seq）、input（点击 / 按键）、日志
+#
+# 发布帧的线程只把帧像素（截图后端返回的数组归 Frame 独有且只读，不需要拷贝；裁剪时是视图）入队，
+# 缩小、编码和写盘都在后台线程；积压的帧过多时丢弃新帧（计数），不阻塞截图和检测。
+#
+# 用法：python recorder.py info <档案目录>
+#       python recorder.py export <档案目录> <输出目录> [--every N]   导出为 PNG（原始尺寸）
+import os
+import sys
+import json
+import zlib
+import queue
+import threading
+from datetime import datetime
+import cv2
+import numpy as np
+import config
+import logger
+import frame as framebus
+from utils import log, dbg, LOG_DIR
+
+FRAMES = "frames.bin"
+INDEX = "index.jsonl"
+EVENTS = "events.jsonl"
+
+
+# ------------------------
+# 写入
+# ------------------------
+class Recorder(threading.Thread):
+    """
+    frame(f) / event(rec) 只入队（队列长度 RECORD_QUEUE，其中待写的帧最多 RECORD_FRAME_BACKLOG 个），后台线程编码写盘：
+    - 每个窗口独立维护关键帧；距上一个关键帧满 RECORD_KEYFRAME_INTERVAL 帧、尺寸变化，
+      或增量数据超过关键帧大小的 RECORD_KEYFRAME_RATIO 倍（画面大变）时写新关键帧
+    - 档案超过 RECORD_MAX_MB 后不再记录帧（事件照常记录）
+    """
+
+    def __init__(self, out_dir=None):
+        super().__init__(name="recorder", daemon=True)
+        if out_dir is None:
+            out_dir = os.path.join(LOG_DIR, f"rec_{datetime.now():%Y%m%d_%H%M%S}")
+        self.out_dir = out_dir
+        self.q = queue.Queue(maxsize=config.RECORD_QUEUE)
+        self.frames = 0
+        self.keyframes = 0
+        self.events = 0
+        self.dropped = 0
+        self.bytes = 0
+        self._backlog = threading.BoundedSemaphore(config.RECORD_FRAME_BACKLOG)  # 队列里待写帧的名额
+        self._keys = {}       # hwnd -> [关键帧行号, 关键帧数组, 关键帧字节数, 之后的增量帧数]
+        self._rows = 0
+        self._full = False
+        self._halt = threading.Event()
+        os.makedirs(out_dir, exist_ok=True)
+        self._bin = open(os.path.join(out_dir, FRAMES), "ab")
+        self._index = open(os.path.join(out_dir, INDEX), "a", encoding="utf-8")
+        self._events = open(os.path.join(out_dir, EVENTS), "a", encoding="utf-8")
+
+    # ------------------------
+    # 入队（任意线程调用）
+    # ------------------------
+    def frame(self, f):
+        if self._full:
+            return
+        if not self._backlog.acquire(blocking=False):
+            self.dropped += 1
+            return
+        h, w = f.bgr.shape[:2]
+        x0 = y0 = 0
+        x1, y1 = w, h
+        if config.RECORD_CROP is not None:
+            cx0, cy0, cx1, cy1 = config.RECORD_CROP
+            x0, y0, x1, y1 = int(cx0 * w), int(cy0 * h), int(cx1 * w), int(cy1 * h)
+        img = f.bgr[y0:y1, x0:x1]
+        if not self._put(("frame", f.seq, f.ts, f.hwnd, f.rect, (w, h), (x0, y0), img)):
+            self._backlog.release()
+
+    def event(self, rec):
+        self._put(("event", rec))
+
+    def _put(self, item):
+        try:
+            self.q.put_nowait(item)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    # ------------------------
+    # 后台写盘
+    # ------------------------
+    def run(self):
+        dbg(f"[REC] 开始录制 -> {self.out_dir}")
+        while not (self._halt.is_set() and self.q.empty()):
+            try:
+                item = self.q.get(timeout=0.5)
+            except queue.Empty:
+                self._flush()
+                continue
+            try:
+                if item[0] == "frame":
+                    self._backlog.release()
+                    self._write_frame(*item[1:])
+                else:
+                    self._events.write(json.dumps(item[1], ensure_ascii=False, default=str) + "\n")
+                    self.events += 1
+            except Exception as e:
+                dbg(f"[REC] 写入失败: {e}")
+            if self.q.empty():
+                self._flush()
+        self._flush()
+        for fp in (self._bin, self._index, self._events):
+            fp.close()
+
+    def _write_frame(self, seq, ts, hwnd, rect, full, crop, img):
+        step = max(1, int(config.RECORD_STEP))
+        if step > 1:
+            ch, cw = img.shape[:2]
+            img = cv2.resize(img, (max(1, cw // step), max(1, ch // step)), interpolation=cv2.INTER_AREA)
+        key = self._keys.get(hwnd)
+        payload = None
+        if key is not None and key[1].shape == img.shape and key[3] < config.RECORD_KEYFRAME_INTERVAL:
+            delta = zlib.compress(np.bitwise_xor(img, key[1]).tobytes(), config.RECORD_ZLIB_LEVEL)
+            if len(delta) <= key[2] * config.RECORD_KEYFRAME_RATIO:
+                payload = delta
+        if payload is None:
+            ok, buf = cv2.imencode(".png", img, [cv2.IMWRITE_PNG_COMPRESSION, config.RECORD_PNG_COMPRESSION])
+            if not ok:
+                return
+            payload = buf.tobytes()
+            key = self._keys[hwnd] = [self._rows, img, len(payload), 0]
+            kind = "key"
+            self.keyframes += 1
+        else:
+            key[3] += 1
+            kind = "delta"
+        off = self._bin.tell()
+        self._bin.write(payload)
+        row = {"seq": seq, "ts": round(ts, 3), "hwnd": hwnd, "type": kind, "off": off, "len": len(payload),
+               "key": key[0], "shape": list(img.shape), "full": list(full), "crop": list(crop), "step": step,
+               "rect": rect}
+        self._index.write(json.dumps(row, default=str) + "\n")
+        self._rows += 1
+        self.frames += 1
+        self.bytes += len(payload)
+        if config.RECORD_MAX_MB and self.bytes > config.RECORD_MAX_MB * 1024 * 1024 and not self._full:
+            self._full = True
+            log(f"[REC] 录制帧数据超过 {config.RECORD_MAX_MB} MB，停止记录帧（事件照常记录）")
+
+    def _flush(self):
+        for fp in (self._bin, self._index, self._events):
+            fp.flush()
+
+    def close(self, timeout=5.0):
+        self._halt.set()
+        self.join(timeout=timeout)
+
+    def stats(self):
+        return {"frames": self.frames, "keyframes": self.keyframes, "events": self.events,
+                "dropped": self.dropped, "mb": round(self.bytes / 1024.0 / 1024.0, 2)}
+
+
+_recorder = None
+
+
+def start(out_dir=None):
+    """开始录制：登记为帧总线和 logger 的监听者。RECORD 关闭时返回 None"""
+    global _recorder
+    if not config.RECORD or _recorder is not None:
+        return _recorder
+    rec = Recorder(out_dir)
+    rec.start()
+    framebus.set_recorder(rec)
+    logger.tap(rec.event)
+    _recorder = rec
+    log(f"[REC] 会话录制已开启 -> {rec.out_dir}")
+    return rec
+
+
+def shutdown():
+    global _recorder
+    rec, _recorder = _recorder, None
+    if rec is None:
+        return
+    framebus.set_recorder(None)
+    logger.untap(rec.event)
+    rec.close()
+    log(f"[REC] 录制结束: {rec.stats()} -> {rec.out_dir}")
+
+
+# ------------------------
+# 读取：随机访问任意帧 / tick
+# ------------------------
+class Archive:
+    """
+    读取录制档案。image(i) 解码第 i 帧（存储尺寸）；full_image(i) 还原到原始窗口尺寸（裁剪区域外为黑色），
+    增量帧只需读所属关键帧 + 自己两段数据。最近一个关键帧会缓存，顺序回放时每帧只解码一次增量。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, INDEX), "r", encoding="utf-8") as f:
+            self.rows = [json.loads(line) for line in f if line.strip()]
+        self._by_seq = {row["seq"]: i for i, row in enumerate(self.rows)}
+        self._bin = open(os.path.join(path, FRAMES), "rb")
+        self._key = (None, None)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _read(self, row):
+        self._bin.seek(row["off"])
+        return self._bin.read(row["len"])
+
+    def _keyframe(self, i):
+        if self._key[0] != i:
+            data = np.frombuffer(self._read(self.rows[i]), dtype=np.uint8)
+            self._key = (i, cv2.imdecode(data, cv2.IMREAD_UNCHANGED))
+        return self._key[1]
+
+    def image(self, i):
+        row = self.rows[i]
+        key = self._keyframe(row["key"])
+        if row["type"] == "key":
+            return key
+        delta = np.frombuffer(zlib.decompress(self._read(row)), dtype=np.uint8).reshape(row["shape"])
+        return np.bitwise_xor(delta, key)
+
+    def full_image(self, i):
+        row = self.rows[i]
+        img = self.image(i)
+        w, h = row["full"]
+        x0, y0 = row["crop"]
+        step = row["step"]
+        if step > 1:
+            ch, cw = img.shape[:2]
+            img = cv2.resize(img, (cw * step, ch * step), interpolation=cv2.INTER_LINEAR)
+        if (x0, y0) == (0, 0) and img.shape[1] >= w and img.shape[0] >= h:
+            return np.ascontiguousarray(img[:h, :w])
+        out = np.zeros((h, w) + img.shape[2:], dtype=np.uint8)
+        ch, cw = min(img.shape[0], h - y0), min(img.shape[1], w - x0)
+        out[y0:y0 + ch, x0:x0 + cw] = img[:ch, :cw]
+        return out
+
+    @property
+    def exact(self):
+        """是否逐像素保存了整帧（没有缩小 / 裁剪）：只有这样回放才能复现录制时的检测结果"""
+        return all(r["step"] == 1 and tuple(r["crop"]) == (0, 0) and r["shape"][:2] == r["full"][::-1]
+                   for r in self.rows)
+
+    def index_of(self, seq):
+        """帧 seq -> 行号（没有记录该帧时返回 None）"""
+        return self._by_seq.get(seq)
+
+    def events(self, kind=None):
+        path = os.path.join(self.path, EVENTS)
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue
+                if kind is None or rec.get("kind") == kind:
+                    yield rec
+
+    def seek_tick(self, tick, session=None):
+        """第 tick 次检测所用帧的行号（session 为会话序号，多开时区分）；找不到返回 None"""
+        for rec in self.events("tick"):
+            if rec.get("tick") == tick and (session is None or rec.get("session") == session):
+                return self.index_of(rec.get("frame"))
+        return None
+
+    def labels(self):
+        """{帧名: 录制时检测出的状态}，帧名与 ArchiveReplayBackend 的 current_path 的文件名一致"""
+        return {frame_name(rec["frame"]): rec.get("state")
+                for rec in self.events("tick") if rec.get("frame") in self._by_seq}
+
+    def close(self):
+        self._bin.close()
+
+
+def frame_name(seq):
+    return f"frame_{seq}"
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) >= 2 and argv[0] == "info":
+        a = Archive(argv[1])
+        keys = sum(1 for r in a.rows if r["type"] == "key")
+        size = sum(r["len"] for r in a.rows)
+        ticks = sum(1 for _ in a.events("tick"))
+        inputs = sum(1 for _ in a.events("input"))
+        span = a.rows[-1]["ts"] - a.rows[0]["ts"] if a.rows else 0.0
+        print(f"{argv[1]}: {len(a)} 帧（关键帧 {keys}）, {size / 1024.0 / 1024.0:.2f} MB, 时长 {span:.0f}s, "
+              f"tick {ticks} 条, 输入 {inputs} 条")
+        if a.rows:
+            print(f"  平均每帧 {size / len(a) / 1024.0:.1f} KB | 存储尺寸 {a.rows[0]['shape']} / 原始 {a.rows[0]['full']}"
+                  f"{'' if a.exact else '（有损：缩小 / 裁剪，回放结果不能作为回归基准）'}")
+        return 0
+    if len(argv) >= 3 and argv[0] == "export":
+        every = int(argv[argv.index("--every") + 1]) if "--every" in argv else 1
+        a = Archive(argv[1])
+        os.makedirs(argv[2], exist_ok=True)
+        for i in range(0, len(a), every):
+            cv2.imwrite(os.path.join(argv[2], frame_name(a.rows[i]["seq"]) + ".png"), a.full_image(i))
+        print(f"已导出 {len(range(0, len(a), every))} 帧 -> {argv[2]}")
+        return 0
+    print("用法: python recorder.py info <档案目录> | export <档案目录> <输出目录> [--every N]")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
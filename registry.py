@@ -0,0 +1,245 @@
+# registry.py - 模板注册表：启动时一次性加载 templates/（含子目录）全部模板并常驻内存
+import os
+import time
+import threading
+import cv2
+import config
+import utils
+import atlas
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_DIR = os.path.join(ROOT, config.TEMPLATE_DIR)
+
+# 需要颜色过滤的模板（占点/敌我相关）
+COLOR_FILTER_KEYS = ["cap_enemy", "cap_neutral", "cap_friendly"]
+
+
+def normalize_name(name):
+    """模板名统一为相对 templates/ 的正斜杠路径，如 debuffs/debuff_fire.png"""
+    return name.replace("\\", "/").lstrip("/")
+
+
+def template_family(name):
+    """占点模板按文件名归类（cap_enemy* -> enemy 等）；其他模板返回 None"""
+    lower = os.path.basename(name).lower()
+    for key in COLOR_FILTER_KEYS:
+        if lower.startswith(key):
+            return key.split("_", 1)[1]
+    return None
+
+
+def classify_color(mean_color):
+    """根据模板平均颜色 (b, g, r) 判定主色类别：enemy / friendly / neutral"""
+    b, g, r = mean_color
+    dominant = "neutral"
+    if r > g * 1.2 and r > b * 1.2:
+        dominant = "enemy"
+    elif g > r * 1.2 and g > b * 1.2:
+        dominant = "friendly"
+    elif abs(r - g) < 40 and abs(r - b) < 40:
+        dominant = "neutral"
+    return dominant
+
+
+class TemplateEntry:
+    """
+    单个模板的全部内存变体：BGR、灰度、平均色/主色类别、按尺度缓存的缩放图。
+    family 为按文件名确定的占点类别（enemy / neutral / friendly，其他模板为 None），
+    比按平均色推断的 dominant 可靠（cap_enemy_1.png 的平均色就被判成 neutral）。
+    来自图集时 gray / bgr 是内存映射的只读视图，meta 为图集里预先算好的元数据。
+    """
+
+    def __init__(self, name, path, mtime, bgr, gray=None, meta=None):
+        self.name = name
+        self.path = path
+        self.mtime = mtime
+        self.bgr = bgr
+        self.gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY) if gray is None else gray
+        self.h, self.w = self.gray.shape[:2]
+        if meta is not None:
+            self.mean_color = tuple(meta["mean_color"])
+            self.dominant = meta["dominant"]
+            self.color_filter = meta["color_filter"]
+        else:
+            self.mean_color = tuple(float(c) for c in bgr.mean(axis=(0, 1)))
+            self.dominant = classify_color(self.mean_color)
+            self.color_filter = any(key in name.lower() for key in COLOR_FILTER_KEYS)
+        self.family = template_family(name)
+        self.roi = meta.get("roi") if meta else None
+        self.threshold = meta.get("threshold") if meta else None
+        self._scaled = {}
+
+    def scaled(self, scale, color=False):
+        """返回缩放后的模板（灰度或 BGR），同一尺度只缩放一次"""
+        key = (round(float(scale), 3), bool(color))
+        tpl = self._scaled.get(key)
+        if tpl is not None:
+            return tpl
+        src = self.bgr if color else self.gray
+        if key[0] == 1.0:
+            tpl = src
+        else:
+            tw = max(1, int(self.w * scale))
+            th = max(1, int(self.h * scale))
+            try:
+                tpl = cv2.resize(src, (tw, th), interpolation=cv2.INTER_AREA)
+            except Exception:
+                tpl = src
+        self._scaled[key] = tpl
+        return tpl
+
+
+class TemplateRegistry:
+    """
+    模板注册表：所有匹配函数的唯一模板来源。
+    - preload() 优先内存映射模板图集（atlas.py，源文件哈希变化时自动重建），否则一次性解码全部 PNG
+    - preload() 后由后台线程每隔 check_interval 秒扫描一次 mtime，仅重新加载被修改/新增的文件；
+      也可以直接调用 reload()
+    - get() 只是字典查找，不做任何磁盘 I/O（首次调用前未 preload 时除外）
+    """
+
+    def __init__(self, root=TEMPLATE_DIR, check_interval=None):
+        self.root = root
+        self.check_interval = config.TEMPLATE_RELOAD_CHECK if check_interval is None else check_interval
+        self._entries = {}
+        self._lock = threading.RLock()
+        self._last_check = 0.0
+        self._loaded = False
+        self._atlas = None
+        self._watcher = None
+        self._halt = threading.Event()
+
+    # ------------------------
+    # 扫描 / 加载
+    # ------------------------
+    def _scan(self):
+        """返回 {相对名: (绝对路径, mtime)}"""
+        found = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for fn in filenames:
+                if not fn.lower().endswith(".png"):
+                    continue
+                path = os.path.join(dirpath, fn)
+                rel = normalize_name(os.path.relpath(path, self.root))
+                try:
+                    found[rel] = (path, os.path.getmtime(path))
+                except OSError:
+                    continue
+        return found
+
+    def _load(self, name, path, mtime):
+        bgr = cv2.imread(path, cv2.IMREAD_COLOR)
+        if bgr is None:
+            utils.dbg(f"读取模板失败: {path}")
+            return None
+        entry = TemplateEntry(name, path, mtime, bgr)
+        for s in config.SCALES:
+            entry.scaled(s)
+        return entry
+
+    def _load_atlas(self, found):
+        """从图集载入全部模板（零拷贝视图，不做预缩放）；返回载入数"""
+        a = atlas.ensure({name: path for name, (path, _) in found.items()})
+        if a is None:
+            return 0
+        for name, (path, mtime) in found.items():
+            meta = a.entries.get(name)
+            if meta is None:
+                continue
+            gray, bgr = a.arrays(name)
+            self._entries[name] = TemplateEntry(name, path, mtime, bgr, gray=gray, meta=meta)
+        self._atlas = a
+        return len(self._entries)
+
+    def preload(self):
+        with self._lock:
+            self._refresh()
+            self._loaded = True
+        self._start_watcher()
+        utils.log(f"[TEMPLATE] 已加载 {len(self._entries)} 个模板到内存")
+        return len(self._entries)
+
+    def reload(self):
+        """立即扫描模板目录，重新加载被修改/新增的文件；返回模板数"""
+        with self._lock:
+            self._refresh()
+            self._loaded = True
+        return len(self._entries)
+
+    def _start_watcher(self):
+        if self.check_interval <= 0 or self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, name="template-watch", daemon=True)
+        self._watcher.start()
+
+    def _watch(self):
+        while not self._halt.wait(self.check_interval):
+            try:
+                self.reload()
+            except Exception as e:
+                utils.dbg(f"[TEMPLATE] 检查模板修改失败: {e}")
+
+    def stop(self):
+        self._halt.set()
+
+    def _refresh(self):
+        self._last_check = time.time()
+        found = self._scan()
+        if not self._entries and config.ATLAS:
+            self._load_atlas(found)
+        for name, (path, mtime) in found.items():
+            old = self._entries.get(name)
+            if old is not None and old.mtime == mtime:
+                continue
+            entry = self._load(name, path, mtime)
+            if entry is not None:
+                if old is not None:
+                    utils.dbg(f"[TEMPLATE] 模板已修改，重新加载: {name}")
+                self._entries[name] = entry
+        for name in list(self._entries):
+            if name not in found:
+                utils.dbg(f"[TEMPLATE] 模板已删除: {name}")
+                del self._entries[name]
+
+    # ------------------------
+    # 查询
+    # ------------------------
+    def get(self, name) -> "TemplateEntry":
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self.preload()
+        entry = self._entries.get(normalize_name(name))
+        if entry is None:
+            dbg_missing(name)
+        return entry
+
+    def names(self, prefix=""):
+        with self._lock:
+            return sorted(n for n in self._entries if n.startswith(prefix))
+
+
+_missing_reported = set()
+
+
+def dbg_missing(name):
+    """缺失模板只提示一次，避免每帧刷屏"""
+    if name in _missing_reported:
+        return
+    _missing_reported.add(name)
+    utils.dbg(f"模板不存在: {os.path.join(TEMPLATE_DIR, name)}")
+
+
+REGISTRY = TemplateRegistry()
+
+
+def get(name):
+    return REGISTRY.get(name)
+
+
+def preload():
+    return REGISTRY.preload()
+
+
+def reload():
+    return REGISTRY.reload()
@@ -0,0 +1,166 @@
+# roi.py - 模板搜索区域（ROI）表：只在声明/学习到的矩形内匹配，连续未命中后回退全屏搜索
+import os
+import json
+import time
+import threading
+from collections import deque
+import config
+import registry
+import statespec
+import utils
+import logger
+import metrics
+
+# 学习结果持久化文件（相对 LOG_DIR）
+ROI_STATE_FILE = "roi_learned.json"
+
+
+def _clip_rect(x0, y0, x1, y1, width, height):
+    x0 = max(0, min(int(x0), width))
+    y0 = max(0, min(int(y0), height))
+    x1 = max(x0, min(int(x1), width))
+    y1 = max(y0, min(int(y1), height))
+    return x0, y0, x1, y1
+
+
+class RoiTable:
+    """
+    每个模板一条记录：
+    - declared: 配置里声明的搜索矩形（相对客户区的比例 x0, y0, x1, y1）
+    - hits: 最近命中框（同为比例坐标），够 ROI_LEARN_MIN_HITS 条后用其外包框 + 边距收紧搜索区
+    - misses: 连续未命中次数，达到 ROI_FALLBACK_MISSES 后做一次全屏搜索
+    """
+
+    def __init__(self, declared=None, path=None):
+        if declared is None:
+            # 状态检测模板的 ROI 在 statespec 里声明，config.ROI_TABLE 可覆盖
+            declared = dict(statespec.rois())
+            declared.update(config.ROI_TABLE)
+        self.declared = dict(declared)
+        self.path = path
+        self._hits = {}
+        self._misses = {}
+        self._learned = {}
+        self._lock = threading.Lock()
+        self._last_save = time.time()
+        self.load()
+
+    # ------------------------
+    # 持久化
+    # ------------------------
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for name, boxes in data.items():
+                self._hits[name] = deque((tuple(b) for b in boxes), maxlen=config.ROI_HISTORY)
+                self._relearn(name)
+            utils.dbg(f"[ROI] 载入 {len(data)} 个模板的历史命中位置")
+        except Exception as e:
+            utils.dbg(f"[ROI] 读取 {self.path} 失败: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = {name: list(boxes) for name, boxes in self._hits.items()}
+            self._last_save = time.time()
+        try:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+        except Exception as e:
+            utils.dbg(f"[ROI] 保存 {self.path} 失败: {e}")
+
+    # ------------------------
+    # 搜索区域
+    # ------------------------
+    def _relearn(self, name):
+        hits = self._hits.get(name)
+        if not hits or len(hits) < config.ROI_LEARN_MIN_HITS:
+            self._learned.pop(name, None)
+            return
+        m = config.ROI_LEARN_MARGIN
+        self._learned[name] = (
+            min(b[0] for b in hits) - m, min(b[1] for b in hits) - m,
+            max(b[2] for b in hits) + m, max(b[3] for b in hits) + m,
+        )
+
+    def search_rect(self, name, width, height):
+        """返回像素搜索矩形 (x0, y0, x1, y1)；None 表示本次做全屏搜索"""
+        with self._lock:
+            if self._misses.get(name, 0) >= config.ROI_FALLBACK_MISSES:
+                self._misses[name] = 0
+                return None
+            rel = self._learned.get(name) or self.declared.get(name)
+        if rel is None:
+            return None
+        return _clip_rect(rel[0] * width, rel[1] * height, rel[2] * width, rel[3] * height, width, height)
+
+    def peek_rect(self, name, width, height):
+        """同 search_rect，但不看也不改未命中计数（不会触发 / 消耗全屏回退），无副作用"""
+        with self._lock:
+            rel = self._learned.get(name) or self.declared.get(name)
+        if rel is None:
+            return None
+        return _clip_rect(rel[0] * width, rel[1] * height, rel[2] * width, rel[3] * height, width, height)
+
+    def record_hit(self, name, box, width, height):
+        """box 为命中框像素坐标 (x0, y0, x1, y1)"""
+        rel = (box[0] / width, box[1] / height, box[2] / width, box[3] / height)
+        with self._lock:
+            self._misses[name] = 0
+            hits = self._hits.setdefault(name, deque(maxlen=config.ROI_HISTORY))
+            hits.append(tuple(round(v, 4) for v in rel))
+            self._relearn(name)
+            due = time.time() - self._last_save >= config.ROI_SAVE_INTERVAL
+        if due:
+            self.save()
+
+    def record_miss(self, name):
+        with self._lock:
+            self._misses[name] = self._misses.get(name, 0) + 1
+
+
+TABLE = RoiTable(path=os.path.join(utils.LOG_DIR, ROI_STATE_FILE))
+
+
+def match_in_roi(img, template_name, threshold, table=None, record=True):
+    """
+    在模板的 ROI 内做灰度匹配，返回 (置信度, 左上角坐标) —— 坐标已换算回整帧。
+    img 可以是灰度图或 frame.Frame（后者按模板的匹配尺度在缩小图上匹配，见 utils.match_gray_scaled）。
+    record=False 时不更新命中 / 未命中统计，也不触发全屏回退（点击确认轮询用：画面出现前的未命中是预期的）。
+    模板不存在时返回 (0.0, None)。
+    """
+    if table is None:
+        table = TABLE
+    entry = registry.get(template_name)
+    if entry is None:
+        return 0.0, None
+    gray = img.gray if hasattr(img, "gray") else img
+    height, width = gray.shape[:2]
+    rect = table.search_rect(template_name, width, height) if record else table.peek_rect(template_name, width, height)
+    if rect is not None:
+        x0, y0, x1, y1 = rect
+        if x1 - x0 < entry.w or y1 - y0 < entry.h:
+            rect = None
+    if entry.w > width or entry.h > height:
+        return 0.0, None
+
+    t0 = time.perf_counter()
+    max_val, loc = utils.match_gray_scaled(img, entry, threshold, rect)
+    ms = (time.perf_counter() - t0) * 1000.0
+    logger.note_match(template_name, max_val, ms)
+    metrics.observe("match." + template_name, ms)
+    if not record:
+        return float(max_val), loc
+    if loc is None:
+        table.record_miss(template_name)
+        return float(max_val), None
+
+    if max_val >= threshold:
+        table.record_hit(template_name, (loc[0], loc[1], loc[0] + entry.w, loc[1] + entry.h), width, height)
+    else:
+        table.record_miss(template_name)
+    return float(max_val), loc
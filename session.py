@@ -0,0 +1,256 @@
+# session.py - 多开支持：每个游戏窗口一个会话，调度器在一个进程里轮流检测所有窗口
+import time
+import threading
+import config
+import states
+import fsm
+import captracker
+import hud
+import cadence
+import pipeline
+import logger
+import metrics
+import frame as framebus
+from utils import log, dbg, find_game_window, find_game_windows
+
+
+class Session:
+    """单个游戏窗口的全部运行状态（原 main.main 里的局部变量）"""
+
+    def __init__(self, hwnd, index):
+        self.hwnd = hwnd
+        self.index = index
+        self.ctx = states.DetectContext()
+        self.last_state = None
+        self.state_since = time.time()
+        self.done = set()              # ✅ 已完成的 once 动作 (状态, 动作序号)，例如战斗中的自动导航
+        self.timeout_for = None        # 已对哪次停留（state_since）报过超时
+        self.tracker = captracker.CapTracker()  # 占点模型，一场战斗内多次导航尝试共享
+        self.next_due = 0.0            # 下一次检测的时间
+        self.wake_after = 0.0          # 画面变化最早可提前唤醒的时间（处理完 + 状态的 delay）
+        self.busy = False              # 是否有动作正在后台线程里执行
+        self.ticks = 0
+        self.producer = None           # 异步截图线程（ASYNC_CAPTURE）
+        self.seen_changes = 0          # 上次检测时截图线程已记录的画面变化次数
+        self.last_run = 0.0
+        self.hud = None                # 战斗 HUD 监视线程（HUD），状态 spec 声明 hud 时激活
+        self.entered = False           # 是否看到了当前状态的进入（启动时所在状态的停留时长不完整，不参与学习）
+        self.sparse = False            # 检测节奏处于稀疏阶段（cadence）：转移不太可能发生，检测间隔大于固定节奏
+        self.baseline = config.STATE_CHECK_INTERVAL  # 固定节奏下本次的检测间隔（用于统计 cadence 效果）
+
+    @property
+    def tag(self):
+        """多开时日志前缀，单开时为空，保持原有日志格式"""
+        return f"[S{self.index}]" if config.MULTI_CLIENT else ""
+
+    def wakeable(self, now):
+        """
+        异步截图时，画面有新变化且距上次检测超过 PIPELINE_MIN_INTERVAL 就提前检测，不等 next_due；
+        但不早于状态 spec 的 delay（战斗等画面一直在变的状态不会因此每 PIPELINE_MIN_INTERVAL 检测一次）。
+        当前状态还有未完成的 once 动作（如战斗中导航）时不提前：动作本身有节奏，提前只会重复按键。
+        cadence 的稀疏阶段也照样提前：画面变化（结算界面、弹窗）必须缩短等待，稀疏只省静止画面上的检测。
+        """
+        p = self.producer
+        if p is None or p.changes <= self.seen_changes:
+            return False
+        if fsm.ENGINE.pending_once(self):
+            return False
+        return now >= self.wake_after and now - self.last_run >= config.PIPELINE_MIN_INTERVAL
+
+    def reset_state(self, name):
+        """清空某状态的 once 记录（spec 的 reset）；清空 BATTLE 时同时丢弃上一场的占点模型"""
+        self.done = {k for k in self.done if k[0] != name}
+        if name == "BATTLE":
+            self.tracker.reset()
+
+    def observe(self, state, info):
+        self.ticks += 1
+        if state != self.last_state:
+            now = time.time()
+            if self.last_state is not None:
+                metrics.dwell(self.last_state, now - self.state_since)
+                if self.entered and self.last_state in fsm.ENGINE.states:
+                    cadence.STATS.record(self.last_state, now - self.state_since)
+            if state == "BATTLE":
+                metrics.mark("battle")
+            if not fsm.ENGINE.allowed(self.last_state, state):
+                dbg(f"{self.tag}[FSM] 非预期的状态转移 {self.last_state} -> {state}")
+            log(f"{self.tag}State change: {self.last_state} -> {state} | info={info}")
+            dbg(f"{self.tag}[GATE] 画面门控统计: {self.ctx.gate.stats()} | 上一状态停留 {now - self.state_since:.1f}s")
+            self.entered = self.last_state is not None
+            self.last_state = state
+            self.state_since = now
+            if self.hud is not None:
+                self.hud.set_active(fsm.ENGINE.wants_hud(state))
+
+
+# ------------------------
+# 状态处理：按 statespec 声明执行动作（见 fsm.Engine.handle），返回本次处理后额外等待的秒数
+# ------------------------
+def handle_state(sess, state, info):
+    return fsm.ENGINE.handle(sess, state, info)
+
+
+class Scheduler:
+    """
+    在一个进程里驱动所有游戏窗口：
+    - 定期枚举窗口，新窗口建会话，消失的窗口删除会话
+    - 每轮只检测“到期”的会话；检测在主线程完成（模板和 OpenCV 运行时全进程共享）
+    - 多开时动作放到会话自己的后台线程执行，鼠标/键盘命令由 inputs 的输入线程串行执行
+    - ASYNC_CAPTURE 时每个会话一个后台截图线程，检测直接用最新帧；
+      next_due 只是最长等待，画面变化会提前唤醒（见 Session.wakeable / wait）
+    """
+
+    def __init__(self, multi=None):
+        self.multi = config.MULTI_CLIENT if multi is None else multi
+        self.sessions = {}
+        self._next_index = 1
+        self._last_scan = 0.0
+        self._change_seq = 0
+        self.paused = False
+
+    def refresh(self):
+        self._last_scan = time.time()
+        if self.multi:
+            hwnds = find_game_windows()[:config.MAX_CLIENTS]
+        else:
+            hwnd = find_game_window()
+            hwnds = [hwnd] if hwnd is not None else []
+        for hwnd in hwnds:
+            if hwnd not in self.sessions:
+                sess = Session(hwnd, self._next_index)
+                self._next_index += 1
+                self.sessions[hwnd] = sess
+                if config.ASYNC_CAPTURE:
+                    sess.producer = pipeline.start(hwnd)
+                if config.HUD:
+                    sess.hud = hud.HudMonitor(hwnd, sess.tag, sess.producer)
+                    sess.hud.start()
+                if self.multi:
+                    log(f"{sess.tag}[SESSION] 发现游戏窗口 hwnd={hwnd}")
+        for hwnd in list(self.sessions):
+            if hwnd not in hwnds:
+                sess = self.sessions.pop(hwnd)
+                if sess.hud is not None:
+                    sess.hud.stop()
+                if sess.producer is not None:
+                    pipeline.stop(sess.producer)
+                if self.multi:
+                    log(f"{sess.tag}[SESSION] 游戏窗口已关闭 hwnd={hwnd}")
+        return hwnds
+
+    def wait(self, timeout):
+        """两轮 step 之间的等待：异步截图时画面变化可提前唤醒，否则就是 sleep"""
+        if not any(s.producer is not None for s in self.sessions.values()):
+            time.sleep(timeout)
+            return
+        pipeline.wait_for_change(self._change_seq, timeout)
+
+    def pause(self):
+        """热键暂停：停用 HUD 监视，停止所有后台截图线程（重复调用无副作用）"""
+        if self.paused:
+            return
+        self.paused = True
+        for sess in self.sessions.values():
+            if sess.hud is not None:
+                sess.hud.set_active(False)
+            if sess.producer is not None:
+                sess.producer.pause()
+        dbg(f"[SESSION] 已暂停 {len(self.sessions)} 个会话的截图")
+
+    def resume(self):
+        """恢复运行：恢复截图线程，所有会话立即检测一次（HUD 按当前状态重新激活）"""
+        if not self.paused:
+            return
+        self.paused = False
+        for sess in self.sessions.values():
+            if sess.producer is not None:
+                sess.producer.resume()
+            if sess.hud is not None:
+                sess.hud.set_active(fsm.ENGINE.wants_hud(sess.last_state))
+            sess.next_due = 0.0
+
+    def close(self):
+        for sess in self.sessions.values():
+            if sess.hud is not None:
+                sess.hud.stop()
+                sess.hud = None
+            if sess.producer is not None:
+                pipeline.stop(sess.producer)
+                sess.producer = None
+
+    def step(self):
+        """检测并处理所有到期的会话，返回距下一个会话到期还有多少秒"""
+        now = time.time()
+        if not self.sessions or now - self._last_scan >= config.WINDOW_RESCAN_INTERVAL:
+            self.refresh()
+        if not self.sessions:
+            log("未找到游戏窗口，等待中...")
+            return 2.0
+
+        # 先记下变化序号再检测：检测期间出现的变化会让下一次 wait 立即返回
+        self._change_seq = pipeline.change_seq()
+        for sess in list(self.sessions.values()):
+            now = time.time()
+            if sess.busy or (now < sess.next_due and not sess.wakeable(now)):
+                continue
+            self._run(sess)
+
+        metrics.maybe_summary()
+        cadence.maybe_report()
+        pending = [s.next_due for s in self.sessions.values() if not s.busy]
+        if not pending:
+            return config.STATE_CHECK_INTERVAL
+        return max(0.0, min(pending) - time.time())
+
+    def _schedule(self, sess, state, delay):
+        """按 cadence 学到的停留时长安排下一次检测（没有足够历史时为 delay + STATE_CHECK_INTERVAL）"""
+        now = time.time()
+        interval, sess.sparse = cadence.next_interval(state, now - sess.state_since, delay,
+                                                      pending=fsm.ENGINE.pending_once(sess))
+        sess.baseline = cadence.baseline_interval(delay)
+        sess.next_due = now + interval
+        sess.wake_after = now + delay
+
+    def _run(self, sess):
+        prev_run = sess.last_run
+        sess.last_run = time.time()
+        f = None
+        if sess.producer is not None:
+            sess.seen_changes = sess.producer.changes
+            f = sess.producer.latest()
+            if f is None:
+                sess.next_due = sess.last_run + config.STATE_CHECK_INTERVAL
+                return
+        metrics.mark("tick")
+        t0 = time.perf_counter()
+        with logger.tick(tick=sess.ticks + 1, session=sess.index, prev=sess.last_state) as rec, metrics.span("tick"):
+            state, info = states.detect_state_once(sess.last_state, hwnd=sess.hwnd, ctx=sess.ctx, frame=f)
+            rec.fields["state"] = state
+            used = f if f is not None else framebus.latest(sess.hwnd)
+            if used is not None:
+                rec.fields["frame"] = used.seq
+            if sess.hud is not None and sess.hud.active:
+                rec.fields["hud"] = sess.hud.status._asdict()
+        if prev_run:
+            cadence.SAVINGS.note(sess.last_run - prev_run, sess.baseline, (time.perf_counter() - t0) * 1000.0,
+                                 changed=sess.last_state is not None and state != sess.last_state)
+        sess.observe(state, info)
+        if not self.multi:
+            delay = handle_state(sess, state, info)
+            self._schedule(sess, state, delay)
+            return
+        sess.busy = True
+        t = threading.Thread(target=self._work, args=(sess, state, info),
+                             name=f"session-{sess.index}", daemon=True)
+        t.start()
+
+    def _work(self, sess, state, info):
+        delay = 0.0
+        try:
+            delay = handle_state(sess, state, info)
+        except Exception as e:
+            log(f"{sess.tag}[ERROR] 状态处理异常: {e}")
+        finally:
+            self._schedule(sess, state, delay)
+            sess.busy = False
@@ -0,0 +1,203 @@
+# snapshots.py - 调试截图服务：调用方只拷贝像素入队，后台线程画标记、编码、写盘，并按数量 / 占用空间清理旧截图
+import os
+import time
+import queue
+import itertools
+import threading
+from datetime import datetime
+import cv2
+import config
+import utils
+import metrics
+
+_seq = itertools.count(1)
+
+_EXT = {"png": ".png", "jpg": ".jpg", "jpeg": ".jpg", "webp": ".webp"}
+
+
+def encode_params(fmt):
+    fmt = fmt.lower()
+    if fmt == "png":
+        return [cv2.IMWRITE_PNG_COMPRESSION, int(config.SNAPSHOT_PNG_COMPRESSION)]
+    if fmt in ("jpg", "jpeg"):
+        return [cv2.IMWRITE_JPEG_QUALITY, int(config.SNAPSHOT_QUALITY)]
+    if fmt == "webp":
+        return [cv2.IMWRITE_WEBP_QUALITY, int(config.SNAPSHOT_QUALITY)]
+    return []
+
+
+def draw_matches(img, matches, offset=(0, 0)):
+    """matches: [(名称, 中心坐标, 置信度)]，坐标是整帧坐标，offset 为裁剪区左上角"""
+    ox, oy = offset
+    for name, pos, val in matches:
+        if pos is None:
+            continue
+        x, y = int(pos[0]) - ox, int(pos[1]) - oy
+        cv2.circle(img, (x, y), 8, (0, 255, 0), 2)
+        cv2.putText(img, f"{name}:{val:.2f}", (x + 10, y + 5),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 1, cv2.LINE_AA)
+    return img
+
+
+class SnapshotWriter(threading.Thread):
+    """
+    - 队列长度 SNAPSHOT_QUEUE，满了直接丢弃（计数），调用方永远不等编码和磁盘
+    - 文件名 <prefix>_<日期_时间>_<毫秒>_<序号>.<格式>，同一秒多张也不会互相覆盖
+    - 每写一张检查目录：超过 SNAPSHOT_MAX_FILES 张或 SNAPSHOT_MAX_MB 时从最旧的开始删
+      （只在独立的 out_dir 里清理，默认 logs/snapshots/，logs/ 下的基准截图不受影响）
+    """
+
+    def __init__(self, out_dir=None, prefix="debug", fmt=None):
+        super().__init__(name="snapshot-writer", daemon=True)
+        self.out_dir = os.path.join(utils.LOG_DIR, config.SNAPSHOT_DIR) if out_dir is None else out_dir
+        self.prefix = prefix
+        self.fmt = (config.SNAPSHOT_FORMAT if fmt is None else fmt).lower()
+        self.q = queue.Queue(maxsize=config.SNAPSHOT_QUEUE)
+        self.written = 0
+        self.dropped = 0
+        self.pruned = 0
+        self._halt = threading.Event()
+        self._index = None   # 已有截图 [(mtime, 路径, 字节数)]，首次清理时扫描一次目录
+        os.makedirs(self.out_dir, exist_ok=True)
+
+    def next_path(self):
+        now = datetime.now()
+        name = f"{self.prefix}_{now:%Y%m%d_%H%M%S}_{now.microsecond // 1000:03d}_{next(_seq)}{_EXT.get(self.fmt, '.png')}"
+        return os.path.join(self.out_dir, name)
+
+    def submit(self, img, matches=(), offset=(0, 0), path=None):
+        """img 必须是调用方独占的拷贝；返回将要写入的路径，队列满时返回 None"""
+        path = path or self.next_path()
+        try:
+            self.q.put_nowait((img, list(matches), offset, path))
+        except queue.Full:
+            self.dropped += 1
+            metrics.count("snapshot.dropped")
+            return None
+        return path
+
+    def run(self):
+        while not (self._halt.is_set() and self.q.empty()):
+            try:
+                img, matches, offset, path = self.q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                with metrics.span("snapshot.write"):
+                    draw_matches(img, matches, offset)
+                    ok, buf = cv2.imencode(_EXT.get(self.fmt, ".png"), img, encode_params(self.fmt))
+                    if not ok:
+                        raise ValueError(f"编码失败 ({self.fmt})")
+                    with open(path, "wb") as f:
+                        f.write(buf.tobytes())
+                self.written += 1
+                self._track(path, len(buf))
+                utils.dbg(f"Saved debug overlay: {path}")
+            except Exception as e:
+                utils.dbg(f"[SNAPSHOT] 写入 {path} 失败: {e}")
+
+    # ------------------------
+    # 清理
+    # ------------------------
+    def _scan(self):
+        items = []
+        for name in os.listdir(self.out_dir):
+            if not name.startswith(self.prefix + "_"):
+                continue
+            if os.path.splitext(name)[1].lower() not in (".png", ".jpg", ".webp"):
+                continue
+            p = os.path.join(self.out_dir, name)
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            items.append((st.st_mtime, p, st.st_size))
+        items.sort()
+        return items
+
+    def _track(self, path, size):
+        if self._index is None:
+            self._index = self._scan()
+        else:
+            self._index.append((time.time(), path, size))
+        self.prune()
+
+    def prune(self):
+        max_files = config.SNAPSHOT_MAX_FILES
+        max_bytes = config.SNAPSHOT_MAX_MB * 1024 * 1024
+        index = self._index if self._index is not None else self._scan()
+        total = sum(s for _, _, s in index)
+        while index and ((max_files and len(index) > max_files) or (max_bytes and total > max_bytes)):
+            _, p, size = index.pop(0)
+            total -= size
+            try:
+                os.remove(p)
+                self.pruned += 1
+            except OSError:
+                pass
+        self._index = index
+
+    def close(self, timeout=5.0):
+        self._halt.set()
+        self.join(timeout)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                w = SnapshotWriter()
+                w.start()
+                _writer = w
+    return _writer
+
+
+def crop_rect(img, crop):
+    """
+    crop：像素矩形 (x0, y0, x1, y1) 或模板名（取 roi.TABLE 里该模板的搜索区域，用 peek_rect 只读查询，
+    保存截图不影响匹配的全屏回退计数）；返回裁剪后的像素矩形
+    """
+    h, w = img.shape[:2]
+    if isinstance(crop, str):
+        import roi
+        rect = roi.TABLE.peek_rect(crop, w, h)
+        if rect is None:
+            return 0, 0, w, h
+        crop = rect
+    m = config.SNAPSHOT_CROP_MARGIN
+    x0, y0, x1, y1 = crop
+    return max(0, int(x0) - m), max(0, int(y0) - m), min(w, int(x1) + m), min(h, int(y1) + m)
+
+
+def save(img, matches=(), crop=None):
+    """
+    入队一张调试截图（img 可以是 BGR 数组或 frame.Frame），返回将要写入的路径；
+    SNAPSHOTS 关闭或队列满时返回 None。crop 不为空时只保存该区域。
+    """
+    if not config.SNAPSHOTS or img is None:
+        return None
+    if hasattr(img, "bgr"):
+        img = img.bgr
+    offset = (0, 0)
+    if crop is not None:
+        x0, y0, x1, y1 = crop_rect(img, crop)
+        img = img[y0:y1, x0:x1]
+        offset = (x0, y0)
+    if len(img.shape) == 2:
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    else:
+        img = img.copy()  # 后台线程会在图上画标记，帧本身是共享只读的，必须拷贝
+    return get_writer().submit(img, matches, offset)
+
+
+def shutdown():
+    global _writer
+    w = _writer
+    if w is not None:
+        w.close()
+        _writer = None
@@ -1,105 +1,89 @@
 import cv2, os
 import numpy as np
 import config
-from utils import log, dbg, capture_window, find_game_window
-
-TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), "templates")
+import roi
+import frame as framebus
+from framegate import FrameGate
+import fsm
+import logger
+from utils import log, dbg, find_game_window
 
 # -------------------------------
 # 新增：带坐标的模板匹配函数
 # -------------------------------
 def match_template_ex(img, template_name, threshold=0.6):
-    """返回 (置信度, 坐标) 或 None"""
-    template_path = os.path.join(TEMPLATE_DIR, template_name)
-    if not os.path.exists(template_path):
-        dbg(f"模板不存在: {template_path}")
-        return None
-
-    template = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
-    if template is None:
-        dbg(f"无法读取模板: {template_path}")
+    """返回 (置信度, 坐标) 或 None；只在该模板的 ROI 内搜索（见 roi.py）"""
+    max_val, max_loc = roi.match_in_roi(img, template_name, threshold)
+    if max_loc is None:
         return None
 
-    res = cv2.matchTemplate(img, template, cv2.TM_CCOEFF_NORMED)
-    _, max_val, _, max_loc = cv2.minMaxLoc(res)
-
     if max_val >= threshold:
         return (max_val, max_loc)
     return None
 
 
 # -------------------------------
-# 状态检测主函数
+# 各状态的检测模板 / 阈值 / 合法后继见 statespec.py，由 fsm.ENGINE 编译成检测计划
 # -------------------------------
-# states.py 中修改 detect_state_once()
+class DetectContext:
+    """单个游戏窗口的检测记忆：上一状态 + 画面门控（多开时每个窗口一份）"""
+
+    def __init__(self):
+        self.last_state = None
+        self.gate = FrameGate()
+
+
+_default_ctx = DetectContext()
 
-def detect_state_once():
-    hwnd = find_game_window()
-    if hwnd is None:
-        return "UNKNOWN", {}
 
-    bgr, rect = capture_window(hwnd)
-    if bgr is None:
+def classify(img, prev_state=None):
+    """
+    img 为灰度图或 frame.Frame。
+    按 fsm.ENGINE 的检测计划识别状态：只检测上一状态及其合法后继，都没命中才检测其余状态；
+    某状态置信度 >= CLASSIFIER_CONFIDENT 立即返回，否则按 statespec.PRIORITY 裁决。返回 (state, info)
+    """
+    return fsm.ENGINE.classify(img, prev_state)
+
+
+# -------------------------------
+# 状态检测主函数
+# -------------------------------
+def detect_state_once(last_state=None, hwnd=None, ctx=None, frame=None):
+    """frame 不为空时直接检测这一帧（异步截图流水线的最新帧），不再自己截图"""
+    if ctx is None:
+        ctx = _default_ctx
+    if frame is not None:
+        f = frame
+    else:
+        if hwnd is None:
+            hwnd = find_game_window()
+        if hwnd is None:
+            return "UNKNOWN", {}
+        # 截图并发布到帧总线，后续 actions 在有效期内直接复用这一帧
+        f = framebus.capture(hwnd)
+    if f is None:
         dbg("[STATE] capture_window 返回 None，跳过")
         return "UNKNOWN", {}
 
-    gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
-
-    info = {}
-    state = "UNKNOWN"
-
-    # -------------------------------
-    # ① 检测港口专属按钮 “开始战斗”
-    # -------------------------------
-    port_btn_res = match_template_ex(gray, "port_join_battle.png", threshold=0.7)
-    if port_btn_res:
-        v_port, pos_port = port_btn_res
-        info["port_join_battle"] = v_port
-        if v_port >= 0.7:
-            state = "PORT"
-            dbg(f"[STATE] 检测到港口按钮 port_join_battle (v={v_port:.2f}) -> 识别为港口")
-
-    # -------------------------------
-    # ② 检测 minimap_corner（战斗 / 港口都可能出现）
-    # -------------------------------
-    minimap_res = match_template_ex(gray, "minimap_corner.png", threshold=0.6)
-    if minimap_res:
-        v_minimap, (x, y) = minimap_res
-        info["minimap"] = v_minimap
-        dbg(f"[STATE] minimap_corner 检测: 置信度={v_minimap:.2f}, 坐标=({x},{y})")
-
-        # 仅当尚未判断为港口时，才进一步判断是否为战斗
-        if state != "PORT" and v_minimap >= 0.7 and x > 1000 and y > 600:
-            state = "BATTLE"
-            dbg("[STATE] minimap_corner 出现在右下角 -> 识别为战斗界面")
-
-    # -------------------------------
-    # 检测胜利、失败、返回按钮 -> RESULT
-    # -------------------------------
-    for name in ["victory.png", "defeat.png", "back_to_port.png"]:
-        path = os.path.join(TEMPLATE_DIR, name)
-        if not os.path.exists(path):
-            continue
-        template = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
-        if template is None:
-            continue
-        res = cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED)
-        _, max_val, _, _ = cv2.minMaxLoc(res)
-        info[name.split(".")[0]] = max_val
-        if max_val >= 0.8:
-            state = "RESULT"
-
-    # -------------------------------
-    # 匹配中界面 -> QUEUE
-    # -------------------------------
-    if state == "UNKNOWN":
-        queue_res = match_template_ex(gray, "queue_waiting.png", threshold=0.7)
-        if queue_res:
-            v_queue, _ = queue_res
-            info["queue"] = v_queue
-            if v_queue >= 0.7:
-                state = "QUEUE"
-                dbg("[STATE] 检测到匹配界面 queue_waiting.png -> QUEUE")
-
-    dbg(f"detect_state values: {info}")
-    return state, info
\ No newline at end of file
+    # 画面基本没变 -> 复用上次结果，省掉灰度转换和全部模板匹配
+    gate = ctx.gate
+    if config.FRAME_GATE and gate.unchanged(f.bgr):
+        dbg(f"[GATE] 画面未变化，复用上次结果 {gate.state}", every=config.LOG_DEBUG_EVERY)
+        logger.note(gated=True)
+        return gate.state, dict(gate.info)
+
+    if last_state is None:
+        last_state = ctx.last_state
+    # 传入整个 Frame：配置了匹配尺度的模板在帧缓存的缩小图上匹配（每帧每个尺度只缩放一次）
+    state, info = classify(f, last_state)
+    ctx.last_state = state
+    gate.remember(state, info)
+
+    # 每次检测的完整置信度 / 耗时由 logger 的 tick 记录写入 JSON 日志，这里只采样输出
+    dbg(f"detect_state values: {info}", every=config.LOG_DEBUG_EVERY)
+    return state, info
+
+
+def frame_gate_stats(ctx=None):
+    """画面门控命中率统计：{"checks", "hits", "hit_rate"}"""
+    return (ctx or _default_ctx).gate.stats()
@@ -0,0 +1,101 @@
+# statespec.py - 状态机声明：每个界面状态的检测模板 / 阈值 / ROI、进入后的动作、等待与超时、合法后继
+#
+# 新增一个界面只需在 STATES 里加一项（模板放进 templates/），fsm.py 会编译成检测计划并执行动作。
+#
+# 每个状态的字段：
+#   detect   检测器列表，任一命中即认为处于该状态（按顺序检测，命中即停）：
+#              template  模板文件名
+#              threshold 判定为该状态所需的置信度
+#              report    置信度 >= report 时写入 info（默认同 threshold）
+#              key       info 里的键名（默认为模板名去掉扩展名）
+#              roi       搜索区域（相对客户区的比例 x0, y0, x1, y1），合并进 roi.TABLE 的声明
+#              min_xy    命中左上角坐标须大于 (x, y) 像素
+#   next     合法后继状态；每个 tick 只跑当前状态和它的后继的检测器，都没命中才检测其余状态
+#   actions  每次检测到该状态时依次执行的动作（见 fsm.ACTIONS）：
+#              do        动作名
+#              once      True 时每次进入该状态只需成功一次（成功后本次停留内不再执行）
+#              其余字段原样传给动作
+#   reset    进入该状态时清空这些状态的 once 记录
+#   delay    处理完后距下一次检测额外等待的秒数
+#   timeout  在该状态停留超过多少秒视为卡住：记日志、保存截图、丢弃画面门控缓存（每次停留只触发一次）
+#   log      检测到该状态时输出的日志
+#   overlaps 这些状态的界面上本状态的模板也会命中：本状态置信度再高也要先检测其中优先级更高的状态，命中则按 PRIORITY 裁决
+#   hud      True 时处于该状态期间运行 HUD 监视（hud.HudMonitor，高频读取异常状态 / 血量等并发布状态记录）
+STATES = {
+    "PORT": {
+        "detect": [
+            {"template": "port_join_battle.png", "threshold": 0.7, "key": "port_join_battle",
+             "roi": (0.30, 0.00, 0.70, 0.20)},
+        ],
+        "next": ["QUEUE"],
+        "actions": [
+            {"do": "click_confirm",
+             "click": ["port_join_battle.png", "port_join_battle_disabled.png"],
+             "confirm": ["queue_waiting.png", "battle_score_bar.png"],
+             "retries": 3, "transition": "PORT->QUEUE"},
+        ],
+        "reset": ["BATTLE"],
+        "delay": 0.0,
+        "timeout": 120.0,
+        "log": "在港口 - 尝试点击加入战斗",
+    },
+    "QUEUE": {
+        "detect": [
+            {"template": "queue_waiting.png", "threshold": 0.7, "key": "queue",
+             "roi": (0.25, 0.00, 0.75, 0.50)},
+        ],
+        "next": ["BATTLE", "PORT"],
+        "actions": [],
+        "delay": 2.0,
+        "timeout": 600.0,
+        "log": "匹配中 - 等待进入战斗",
+    },
+    "BATTLE": {
+        # minimap_corner 出现在右下角 -> 战斗（港口也可能出现，靠优先级区分）
+        "detect": [
+            {"template": "minimap_corner.png", "threshold": 0.7, "report": 0.6, "key": "minimap",
+             "roi": (0.50, 0.50, 1.00, 1.00), "min_xy": (1000, 600)},
+        ],
+        "next": ["RESULT"],
+        "overlaps": ["PORT"],
+        "actions": [
+            {"do": "auto_nav", "once": True},
+        ],
+        "delay": 2.0,
+        "timeout": 1500.0,
+        "log": "战斗中 - 确保自动导航",
+        "hud": True,
+    },
+    "RESULT": {
+        "detect": [
+            # report 0：和原来一样把未达阈值的结算模板置信度也写进 info / 日志
+            {"template": "victory.png", "threshold": 0.8, "report": 0.0, "roi": (0.20, 0.00, 0.80, 0.60)},
+            {"template": "defeat.png", "threshold": 0.8, "report": 0.0, "roi": (0.20, 0.00, 0.80, 0.60)},
+            {"template": "back_to_port.png", "threshold": 0.8, "report": 0.0},
+        ],
+        "next": ["PORT"],
+        "actions": [
+            {"do": "click_confirm",
+             "click": ["back_to_port.png"],
+             "confirm": ["port_join_battle.png"],
+             "retries": 3, "transition": "RESULT->PORT"},
+        ],
+        "reset": ["BATTLE"],
+        "delay": 0.0,
+        "timeout": 120.0,
+        "log": "结算界面 - 点击返回港口按钮",
+    },
+}
+
+# 多个状态同时命中（都不够确定）时的裁决优先级：结算 > 港口 > 战斗 > 匹配
+PRIORITY = ["RESULT", "PORT", "BATTLE", "QUEUE"]
+
+
+def rois(states=None):
+    """spec 里声明的 ROI：{模板名: (x0, y0, x1, y1)}"""
+    out = {}
+    for st in (STATES if states is None else states).values():
+        for d in st.get("detect", ()):
+            if d.get("roi") is not None:
+                out[d["template"]] = tuple(d["roi"])
+    return out
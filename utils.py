@@ -1,12 +1,16 @@
 # utils.py - 日志、截图、模板匹配、多尺度支持、文件工具
 import os
+import sys
 import time
 import cv2
 import numpy as np
-import pyautogui
 from datetime import datetime
 from typing import Optional, Dict  # 修复 Optional/Dict 未定义问题
 import config
+import registry
+import capture
+import logger
+import metrics
 
 ROOT = os.path.dirname(os.path.abspath(__file__))
 TEMPLATE_DIR = os.path.join(ROOT, config.TEMPLATE_DIR)
@@ -19,63 +23,76 @@ def ts():
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
 def log(s):
-    line = f"[{ts()}] {s}"
-    print(line)
-    try:
-        with open(os.path.join(LOG_DIR, f"run_{datetime.now().date()}.log"), "a", encoding="utf-8") as f:
-            f.write(line + "\n")
-    except Exception:
-        pass
+    print(f"[{ts()}] {s}")
+    # 写盘交给 logger 的后台线程（JSON Lines，批量写、按日期/大小轮转）
+    logger.emit("log", msg=s)
+
+_dbg_counts = {}
 
-def dbg(s):
-    if config.DEBUG:
-        log("[DEBUG] " + s)
+def dbg(s, every=None):
+    """
+    调试日志。every 不为空时按调用位置采样：每 every 次只输出第 1 次（热路径上用 config.LOG_DEBUG_EVERY）。
+    """
+    if not config.DEBUG:
+        return
+    if every is not None and every > 1:
+        caller = sys._getframe(1)
+        key = (caller.f_code, caller.f_lineno)
+        n = _dbg_counts.get(key, 0)
+        _dbg_counts[key] = n + 1
+        if n % every:
+            return
+    print(f"[{ts()}] [DEBUG] {s}")
+    logger.emit("debug", msg=s)
 
 # ------------------------
-# 窗口 / 截图
+# 窗口 / 截图（具体实现见 capture.py，由 config.CAPTURE_BACKEND 选择）
 # ------------------------
-import win32gui, win32con
-
 def find_game_window(title=None):
     if title is None:
         title = config.GAME_TITLE
-    hwnd = win32gui.FindWindow(None, title)
-    if hwnd == 0:
-        return None
-    return hwnd
+    return capture.get_backend().find_window(title)
+
+def find_game_windows(title=None):
+    """多开时返回所有游戏窗口"""
+    if title is None:
+        title = config.GAME_TITLE
+    return capture.get_backend().find_windows(title)
+
+def activate_window(hwnd):
+    return capture.get_backend().activate(hwnd)
 
 def get_client_rect(hwnd) -> Optional[Dict]:
     """
     返回客户区左上角屏幕坐标以及宽高
     """
-    try:
-        left_top = win32gui.ClientToScreen(hwnd, (0, 0))
-        cl, ct, cr, cb = win32gui.GetClientRect(hwnd)
-        width = cr
-        height = cb
-        return {"left": left_top[0], "top": left_top[1], "width": width, "height": height, "hwnd": hwnd}
-    except Exception as e:
-        dbg(f"get_client_rect error: {e}")
-        return None
+    return capture.get_backend().get_client_rect(hwnd)
 
 def capture_window(hwnd):
-    rect = get_client_rect(hwnd)
-    if rect is None:
-        return None, None
-    x, y, w, h = rect["left"], rect["top"], rect["width"], rect["height"]
-    try:
-        img = pyautogui.screenshot(region=(x, y, w, h))
-        bgr = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
+    backend = capture.get_backend()
+    # 截图后端不是线程安全的：后台截图线程 / 多个会话同时截图时串行化
+    with capture.LOCK, metrics.span("capture"):
+        rect = backend.get_client_rect(hwnd)
+        if rect is None:
+            return None, None
+        try:
+            bgr = backend.grab(hwnd, rect)
+        except Exception as e:
+            dbg(f"capture_window error: {e}")
+            capture.note_grab(backend, e)
+            return None, None
+        capture.note_grab(backend)
+        if bgr is None:
+            return None, None
         return bgr, rect
-    except Exception as e:
-        dbg(f"capture_window error: {e}")
-        return None, None
 
 # ------------------------
 def to_gray(bgr):
-    """将BGR彩色图像转换为灰度图像"""
+    """将BGR彩色图像转换为灰度图像（也接受 frame.Frame）"""
     if bgr is None:
         return None
+    if hasattr(bgr, "gray"):
+        return bgr.gray
     if len(bgr.shape) == 2:
         return bgr
     try:
@@ -87,14 +104,11 @@ def to_gray(bgr):
 # 模板加载与多尺度匹配
 # ------------------------
 def load_template(name):
-    path = os.path.join(TEMPLATE_DIR, name)
-    if not os.path.exists(path):
-        dbg(f"模板不存在: {path}")
+    """从模板注册表取灰度模板（不再每次读盘）"""
+    entry = registry.get(name)
+    if entry is None:
         return None
-    tpl = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
-    if tpl is None:
-        dbg(f"读取模板失败: {path}")
-    return tpl
+    return entry.gray
 
 def match_template_once(gray_img, tpl, method=cv2.TM_CCOEFF_NORMED):
     try:
@@ -105,21 +119,85 @@ def match_template_once(gray_img, tpl, method=cv2.TM_CCOEFF_NORMED):
         dbg(f"match_template_once error: {e}")
         return 0.0, (0, 0)
 
+def _resize_tpl(entry, tpl, s):
+    """按尺度缩放模板：注册表模板走缓存，裸数组现算"""
+    if entry is not None:
+        return entry.scaled(s)
+    tw = max(1, int(round(tpl.shape[1] * s)))
+    th = max(1, int(round(tpl.shape[0] * s)))
+    try:
+        return cv2.resize(tpl, (tw, th), interpolation=cv2.INTER_AREA)
+    except Exception:
+        return tpl
+
+def template_match_scale(name):
+    """模板的匹配尺度（config.MATCH_SCALE），未配置或关闭时为 1.0"""
+    if not config.MATCH_SCALE_ENABLED:
+        return 1.0
+    return float(config.MATCH_SCALE.get(name, 1.0))
+
+def match_gray_scaled(src, entry, threshold, rect=None):
+    """
+    在 rect（整帧像素坐标，默认整帧）内做灰度匹配，返回 (置信度, 左上角整帧坐标)。
+    src 为 frame.Frame 且模板配置了匹配尺度 s < 1 时：在帧缓存的缩小灰度图 frame.small(s) 上用预缩放模板匹配，
+    坐标按 1/s 换算回整帧；置信度落在 threshold ± MATCH_SCALE_VERIFY_MARGIN 内时，
+    在命中点附近用原分辨率再匹配一次作为最终结果。
+    """
+    gray = src.gray if hasattr(src, "gray") else src
+    height, width = gray.shape[:2]
+    x0, y0, x1, y1 = rect if rect is not None else (0, 0, width, height)
+    s = template_match_scale(entry.name)
+    if s < 1.0 and hasattr(src, "small"):
+        small = src.small(s)
+        tpl = entry.scaled(s)
+        sh, sw = small.shape[:2]
+        sx0, sy0 = int(x0 * s), int(y0 * s)
+        sx1, sy1 = min(sw, int(np.ceil(x1 * s))), min(sh, int(np.ceil(y1 * s)))
+        if sx1 - sx0 >= tpl.shape[1] and sy1 - sy0 >= tpl.shape[0]:
+            res = cv2.matchTemplate(small[sy0:sy1, sx0:sx1], tpl, cv2.TM_CCOEFF_NORMED)
+            _, val, _, loc = cv2.minMaxLoc(res)
+            loc = (int(round((loc[0] + sx0) / s)), int(round((loc[1] + sy0) / s)))
+            if abs(val - threshold) > config.MATCH_SCALE_VERIFY_MARGIN:
+                return float(val), loc
+            # 临界置信度：在命中点附近用原分辨率复核
+            metrics.count("match.verify")
+            pad = int(np.ceil(1.0 / s)) + config.MATCH_SCALE_VERIFY_PAD
+            x0, y0 = max(x0, loc[0] - pad), max(y0, loc[1] - pad)
+            x1, y1 = min(x1, loc[0] + entry.w + pad), min(y1, loc[1] + entry.h + pad)
+    if x1 - x0 < entry.w or y1 - y0 < entry.h:
+        return 0.0, None
+    res = cv2.matchTemplate(gray[y0:y1, x0:x1], entry.gray, cv2.TM_CCOEFF_NORMED)
+    _, val, _, loc = cv2.minMaxLoc(res)
+    return float(val), (loc[0] + x0, loc[1] + y0)
+
+@metrics.timed("match_template_multiscale")
 def match_template_multiscale(gray_img, tpl, threshold=None):
-    if tpl is None:
+    """
+    tpl 可以是灰度模板数组，也可以是模板名（此时直接使用注册表里预缩放好的变体）
+    config.PYRAMID 打开时走金字塔匹配（连续尺度范围 SCALE_RANGE），否则逐个尝试 SCALES
+    """
+    entry = None
+    if isinstance(tpl, str):
+        entry = registry.get(tpl)
+        if entry is None:
+            return None, 0.0
+        tpl = entry.gray
+    elif tpl is None:
         return None, 0.0
     if threshold is None:
         threshold = config.DEFAULT_THRESHOLD
+    if config.MULTISCALE and config.PYRAMID:
+        return match_template_pyramid(gray_img, tpl, threshold, entry=entry)
+    if hasattr(gray_img, "gray"):
+        gray_img = gray_img.gray
+    return _match_scales(gray_img, tpl, threshold, entry, config.SCALES if config.MULTISCALE else [1.0])
+
+def _match_scales(gray_img, tpl, threshold, entry, scales):
+    """逐个尺度在原分辨率整图匹配，返回 (中心坐标, 置信度)"""
     best_val = 0.0
     best_center = None
-    scales = config.SCALES if config.MULTISCALE else [1.0]
     for s in scales:
-        tw = max(1, int(tpl.shape[1] * s))
-        th = max(1, int(tpl.shape[0] * s))
-        try:
-            tpl_r = cv2.resize(tpl, (tw, th), interpolation=cv2.INTER_AREA)
-        except Exception:
-            tpl_r = tpl
+        tpl_r = _resize_tpl(entry, tpl, s)
         if tpl_r.shape[0] > gray_img.shape[0] or tpl_r.shape[1] > gray_img.shape[1]:
             continue
         val, loc = match_template_once(gray_img, tpl_r)
@@ -132,22 +210,94 @@ def match_template_multiscale(gray_img, tpl, threshold=None):
         return best_center, best_val
     return None, best_val
 
+@metrics.timed("match_template_pyramid")
+def match_template_pyramid(gray_img, tpl, threshold=None, scale_range=None, entry=None):
+    """
+    金字塔（由粗到细）多尺度匹配：
+    1. 图像和模板同时缩小到 PYRAMID_FACTOR，在连续尺度范围内按 PYRAMID_SCALE_STEP 粗扫，
+       取置信度最高的 PYRAMID_CANDIDATES 个 (位置, 尺度) 候选；
+    2. 每个候选只在原分辨率下的一个小窗口里，用相邻尺度精修。
+    模板太小、粗层缩小系数要超过 PYRAMID_MAX_FACTOR 才能保住 PYRAMID_MIN_TPL 像素时，粗扫几乎是整图匹配，
+    比逐尺度匹配还慢：这时不建粗层，直接按 SCALES 每个尺度在原分辨率匹配一次。
+    gray_img 可以是灰度图或 frame.Frame（复用帧上缓存的缩小图）。返回 (中心坐标, 置信度)
+    """
+    if tpl is None:
+        return None, 0.0
+    if threshold is None:
+        threshold = config.DEFAULT_THRESHOLD
+    s_min, s_max = scale_range if scale_range is not None else config.SCALE_RANGE
+    step = config.PYRAMID_SCALE_STEP
+    frame = gray_img if hasattr(gray_img, "gray") else None
+    full = frame.gray if frame is not None else gray_img
+    img_h, img_w = full.shape[:2]
+    th0, tw0 = tpl.shape[:2]
+
+    # 粗层缩放系数：保证最小尺度下模板短边仍有 PYRAMID_MIN_TPL 像素
+    factor = max(config.PYRAMID_FACTOR, config.PYRAMID_MIN_TPL / max(1.0, min(th0, tw0) * s_min))
+    if factor > config.PYRAMID_MAX_FACTOR:
+        metrics.count("pyramid.small_tpl")
+        return _match_scales(full, tpl, threshold, entry, config.SCALES)
+
+    scales = []
+    s = s_min
+    while s <= s_max + 1e-9:
+        scales.append(round(s, 4))
+        s += step
+
+    # ① 粗扫
+    if frame is not None:
+        coarse = frame.small(factor)
+    else:
+        coarse = cv2.resize(full, (max(1, int(img_w * factor)), max(1, int(img_h * factor))),
+                            interpolation=cv2.INTER_AREA)
+    candidates = []
+    for s in scales:
+        tpl_c = _resize_tpl(entry, tpl, s * factor)
+        if tpl_c.shape[0] > coarse.shape[0] or tpl_c.shape[1] > coarse.shape[1]:
+            continue
+        val, loc = match_template_once(coarse, tpl_c)
+        candidates.append((val, loc, s))
+    if not candidates:
+        return None, 0.0
+    candidates.sort(key=lambda c: c[0], reverse=True)
+    candidates = candidates[:config.PYRAMID_CANDIDATES]
+
+    # ② 原分辨率小窗口精修
+    pad = int(2.0 / factor) + 2
+    best_val = 0.0
+    best_center = None
+    for _, loc, s in candidates:
+        for s_r in (s - step / 2.0, s, s + step / 2.0):
+            if s_r < s_min - 1e-9 or s_r > s_max + 1e-9:
+                continue
+            tpl_r = _resize_tpl(entry, tpl, s_r)
+            th, tw = tpl_r.shape[:2]
+            x0 = max(0, int(loc[0] / factor) - pad)
+            y0 = max(0, int(loc[1] / factor) - pad)
+            x1 = min(img_w, x0 + tw + 2 * pad)
+            y1 = min(img_h, y0 + th + 2 * pad)
+            if x1 - x0 < tw or y1 - y0 < th:
+                continue
+            val, rloc = match_template_once(full[y0:y1, x0:x1], tpl_r)
+            if val > best_val:
+                best_val = val
+                best_center = (int(x0 + rloc[0] + tw // 2), int(y0 + rloc[1] + th // 2))
+    if best_val >= threshold:
+        return best_center, float(best_val)
+    return None, float(best_val)
+
 # ------------------------
 # 点击封装（相对于客户区 -> 转为屏幕坐标）
 # ------------------------
-def safe_click_screen_abs(x_abs, y_abs, hold=None):
-    try:
-        pyautogui.moveTo(x_abs, y_abs, duration=config.CLICK_MOVE_DURATION)
-        pyautogui.mouseDown()
-        if hold is None:
-            hold = config.CLICK_HOLD
-        time.sleep(hold)
-        pyautogui.mouseUp()
+def safe_click_screen_abs(x_abs, y_abs, hold=None, hwnd=None):
+    """提交到输入线程（inputs.Click，时序见 INPUT_TIMING["click"]）并等它执行完；调用时不要持有 ARBITER 锁"""
+    import inputs
+    ok = inputs.click(x_abs, y_abs, hwnd=hwnd, hold=hold).wait(timeout=config.INPUT_WAIT_TIMEOUT)
+    if ok:
         dbg(f"safe_click_screen_abs ({x_abs},{y_abs})")
-        return True
-    except Exception as e:
-        log(f"[ERROR] safe_click_screen_abs: {e}")
-        return False
+    else:
+        log(f"[ERROR] safe_click_screen_abs ({x_abs},{y_abs}) 失败")
+    return ok
 
 def safe_click_in_window(rect, pos_in_client, hold=None):
     if pos_in_client is None:
@@ -155,86 +305,81 @@ def safe_click_in_window(rect, pos_in_client, hold=None):
         return False
     x_abs = rect["left"] + int(pos_in_client[0])
     y_abs = rect["top"] + int(pos_in_client[1])
-    return safe_click_screen_abs(x_abs, y_abs, hold=hold)
+    return safe_click_screen_abs(x_abs, y_abs, hold=hold, hwnd=rect.get("hwnd"))
+
+# ------------------------
+# 颜色过滤（占点/敌我模板）
+# ------------------------
+# 各主色类别保留的 BGR 范围 (lower, upper)
+COLOR_RANGES = {
+    "enemy": (np.array([0, 0, 120]), np.array([180, 120, 255])),
+    "neutral": (np.array([90, 90, 90]), np.array([255, 255, 255])),
+}
+
+def color_masked(img_bgr, dominant):
+    """只保留属于 dominant 颜色范围的像素，其余置黑"""
+    lower, upper = COLOR_RANGES.get(dominant, (np.array([0, 0, 0]), np.array([255, 255, 255])))
+    mask = cv2.inRange(img_bgr, lower, upper)
+    return cv2.bitwise_and(img_bgr, img_bgr, mask=mask)
 
 # ------------------------
 # 高级：搜索模板并返回相对客户区坐标
 # ------------------------
+@metrics.timed("find_template_in_window")
 def find_template_in_window(gray_img_or_bgr, template_name, threshold=None):
     """
-    在窗口截图中查找模板。
+    在窗口截图中查找模板（灰度图 / BGR 图 / frame.Frame 均可）。
     - 对于占点/敌我相关模板，启用颜色过滤。
     - 对于一般UI按钮（港口/返回按钮等），禁用颜色过滤。
     返回 (坐标, 置信度)
     """
-    path = os.path.join(TEMPLATE_DIR, template_name)
-    if not os.path.exists(path):
-        dbg(f"模板不存在: {path}")
-        return None, 0.0
-
-    tpl_bgr = cv2.imread(path, cv2.IMREAD_COLOR)
-    if tpl_bgr is None:
-        dbg(f"读取模板失败: {path}")
+    entry = registry.get(template_name)
+    if entry is None:
         return None, 0.0
+    tpl_bgr = entry.bgr
 
-    # 判断是否为需要颜色识别的模板
-    use_color_filter = any(key in template_name.lower() for key in [
-        "cap_enemy", "cap_neutral", "cap_friendly"
-   ])
+    # 传入 frame.Frame 时直接使用它缓存的灰度 / BGR 视图
+    frame = gray_img_or_bgr if hasattr(gray_img_or_bgr, "gray") else None
 
     # --------------------------
     # 如果不需要颜色过滤，则直接灰度匹配
     # --------------------------
-    if not use_color_filter:
-        dbg(f"[COLOR] {template_name} -> 普通模板，跳过颜色过滤")
-        if len(gray_img_or_bgr.shape) == 3:
-            gray_img = cv2.cvtColor(gray_img_or_bgr, cv2.COLOR_BGR2GRAY)
+    if not entry.color_filter:
+        dbg(f"[COLOR] {template_name} -> 普通模板，跳过颜色过滤", every=config.LOG_DEBUG_EVERY)
+        if frame is not None:
+            src = frame  # Frame 上可按模板的匹配尺度走缩小图
+        elif len(gray_img_or_bgr.shape) == 3:
+            src = cv2.cvtColor(gray_img_or_bgr, cv2.COLOR_BGR2GRAY)
         else:
-            gray_img = gray_img_or_bgr
-        tpl_gray = cv2.cvtColor(tpl_bgr, cv2.COLOR_BGR2GRAY)
-        res = cv2.matchTemplate(gray_img, tpl_gray, cv2.TM_CCOEFF_NORMED)
-        _, maxv, _, maxloc = cv2.minMaxLoc(res)
+            src = gray_img_or_bgr
         if threshold is None:
             threshold = config.DEFAULT_THRESHOLD
-        if maxv < threshold:
+        maxv, maxloc = match_gray_scaled(src, entry, threshold)
+        if maxloc is None or maxv < threshold:
             return None, float(maxv)
-        cx = maxloc[0] + tpl_gray.shape[1] // 2
-        cy = maxloc[1] + tpl_gray.shape[0] // 2
+        cx = maxloc[0] + entry.w // 2
+        cy = maxloc[1] + entry.h // 2
         return (int(cx), int(cy)), float(maxv)
 
     # --------------------------
     # 启用颜色过滤逻辑（仅用于占点/敌我识别）
     # --------------------------
-    if len(gray_img_or_bgr.shape) == 2:
+    if frame is not None:
+        img_bgr = frame.bgr
+    elif len(gray_img_or_bgr.shape) == 2:
         img_bgr = cv2.cvtColor(gray_img_or_bgr, cv2.COLOR_GRAY2BGR)
     else:
         img_bgr = gray_img_or_bgr
 
-    mean_color = tpl_bgr.mean(axis=(0, 1))
-    b, g, r = mean_color
-    dominant = "neutral"
-    if r > g * 1.2 and r > b * 1.2:
-        dominant = "enemy"
-    elif g > r * 1.2 and g > b * 1.2:
-        dominant = "friendly"
-    elif abs(r - g) < 40 and abs(r - b) < 40:
-        dominant = "neutral"
-
-    if dominant == "enemy":
-        lower = np.array([0, 0, 120])
-        upper = np.array([180, 120, 255])
-    elif dominant == "neutral":
-        lower = np.array([90, 90, 90])
-        upper = np.array([255, 255, 255])
-    elif dominant == "friendly":
-        dbg(f"[COLOR] {template_name} 判定为友方模板，跳过匹配。")
+    # 主色类别在模板加载时已算好
+    dominant = entry.dominant
+
+    if dominant == "friendly":
+        dbg(f"[COLOR] {template_name} 判定为友方模板，跳过匹配。", every=config.LOG_DEBUG_EVERY)
         return None, 0.0
-    else:
-        lower = np.array([0, 0, 0])
-        upper = np.array([255, 255, 255])
 
-    mask = cv2.inRange(img_bgr, lower, upper)
-    masked = cv2.bitwise_and(img_bgr, img_bgr, mask=mask)
+    # 传入 Frame 时颜色过滤图在帧上缓存，同一帧的所有占点模板共享
+    masked = frame.masked(dominant) if frame is not None else color_masked(img_bgr, dominant)
 
     try:
         res = cv2.matchTemplate(masked, tpl_bgr, cv2.TM_CCOEFF_NORMED)
@@ -245,7 +390,7 @@ def find_template_in_window(gray_img_or_bgr, template_name, threshold=None):
             return None, float(maxv)
         cx = maxloc[0] + tpl_bgr.shape[1] // 2
         cy = maxloc[1] + tpl_bgr.shape[0] // 2
-        dbg(f"[COLOR] 模板 {template_name} ({dominant}) 匹配置信度={maxv:.2f}")
+        dbg(f"[COLOR] 模板 {template_name} ({dominant}) 匹配置信度={maxv:.2f}", every=config.LOG_DEBUG_EVERY)
         return (int(cx), int(cy)), float(maxv)
     except Exception as e:
         dbg(f"find_template_in_window error: {e}")
@@ -265,15 +410,10 @@ def ensure_templates_exist():
 # ------------------------
 # 预览 / debug helper（保存截图带标记）
 # ------------------------
-def save_debug_overlay(bgr_img, rect, matches):
-    out = bgr_img.copy()
-    for name, pos, val in matches:
-        if pos is None:
-            continue
-        cv2.circle(out, (int(pos[0]), int(pos[1])), 8, (0, 255, 0), 2)
-        cv2.putText(out, f"{name}:{val:.2f}", (int(pos[0]) + 10, int(pos[1]) + 5),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 1, cv2.LINE_AA)
-    p = os.path.join(LOG_DIR, f"debug_{int(time.time())}.png")
-    cv2.imwrite(p, out)
-    dbg(f"Saved debug overlay: {p}")
-    return p
+def save_debug_overlay(bgr_img, rect, matches, crop=None):
+    """
+    保存带匹配标记的调试截图：只在当前线程拷贝像素，绘制 / 编码 / 写盘和旧截图清理都在 snapshots 的后台线程完成。
+    返回将要写入的路径（被丢弃时为 None）。crop 为像素矩形或模板名（只保存该模板的 ROI）。
+    """
+    import snapshots
+    return snapshots.save(bgr_img, matches, crop=crop)